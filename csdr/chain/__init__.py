@@ -1,4 +1,4 @@
-from csdr.module import Module
+from csdr.module import Module, MessageChannel, producesMessages, consumesMessages
 from pycsdr.modules import Buffer
 from pycsdr.types import Format
 from typing import Union, Callable, Optional
@@ -19,6 +19,12 @@ class Chain(Module):
         return not self.workers
 
     def _connect(self, w1, w2, buffer: Optional[Buffer] = None) -> None:
+        if buffer is None and producesMessages(w1) and consumesMessages(w2):
+            # decoded messages are passed on as objects, without pickling
+            channel = MessageChannel()
+            w1.setWriter(channel)
+            w2.setReader(channel.getReader())
+            return
         if buffer is None:
             buffer = Buffer(w1.getOutputFormat())
         w1.setWriter(buffer)
@@ -139,6 +145,12 @@ class Chain(Module):
             w.stop()
         super().stop()
 
+    def producesMessages(self) -> bool:
+        return bool(self.workers) and producesMessages(self.workers[-1])
+
+    def consumesMessages(self) -> bool:
+        return bool(self.workers) and consumesMessages(self.workers[0])
+
     def getInputFormat(self) -> Format:
         if self.workers:
             return self.workers[0].getInputFormat()
@@ -1,11 +1,15 @@
 from pycsdr.modules import Module as BaseModule
 from pycsdr.modules import Reader, Writer, Buffer
 from pycsdr.types import Format
-from abc import ABCMeta, abstractmethod
+from abc import ABC, ABCMeta, abstractmethod
 from threading import Thread
 from io import BytesIO
 from subprocess import Popen, PIPE, TimeoutExpired
 from functools import partial
+from owrx.metrics import Metrics, HistogramMetric, CounterMetric
+from owrx.affinity import CpuAffinity, CpuClass
+from collections import deque
+import threading
 import pickle
 import logging
 import json
@@ -29,6 +33,35 @@ class Module(BaseModule, metaclass=ABCMeta):
         self.reader = None
         self.writer = None
 
+    def producesMessages(self) -> bool:
+        """
+        True if the module writes decoded messages, and accepts a MessageWriter instead of a Buffer.
+        """
+        return False
+
+    def consumesMessages(self) -> bool:
+        """
+        True if the module reads decoded messages, and accepts a MessageChannel instead of a Buffer reader.
+        """
+        return False
+
+    def writeMessages(self, messages: list) -> None:
+        if isinstance(self.writer, MessageWriter):
+            self.writer.write(messages)
+        else:
+            self.writer.write(pickleMessages(messages))
+
+    def readMessages(self):
+        """
+        Block until messages are available. Returns an iterable of messages, or None once the reader has been stopped.
+        """
+        data = self.reader.read()
+        if data is None:
+            return None
+        if isinstance(self.reader, MessageChannel):
+            return data
+        return unpickleMessages(data.tobytes())
+
     @abstractmethod
     def getInputFormat(self) -> Format:
         pass
@@ -98,36 +131,193 @@ class ThreadModule(AutoStartModule, Thread, metaclass=ABCMeta):
         Thread.start(self)
 
 
-class PickleModule(ThreadModule):
+class ParserModule(ThreadModule, metaclass=ABCMeta):
+    """
+    Base for modules that run process() on every incoming message. Collects the time spent in process() per class.
+    """
+    def __init__(self):
+        name = "decoding.parser.{}.process_time".format(type(self).__name__.lower())
+        self.processTime = Metrics.getSharedInstance().getOrAddMetric(
+            name, lambda: HistogramMetric([0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1])
+        )
+        super().__init__()
+
+    def producesMessages(self) -> bool:
+        return True
+
+    def timedProcess(self, input):
+        with self.processTime.time():
+            return self.process(input)
+
+    @abstractmethod
+    def process(self, input):
+        pass
+
+
+class MessageBatch(list):
+    """
+    Envelope for multiple messages in a single pickled write. Readers of pickled streams should use
+    unpickleMessages(), which unpacks batches transparently.
+    """
+    pass
+
+
+def pickleMessages(messages: list) -> bytes:
+    if len(messages) == 1:
+        return pickle.dumps(messages[0])
+    return pickle.dumps(MessageBatch(messages))
+
+
+def unpickleMessages(data: bytes):
+    """
+    Iterates over all messages in a buffer of concatenated pickles, with the contents of batches inlined.
+    """
+    unpickler = pickle.Unpickler(BytesIO(data))
+    while True:
+        try:
+            message = unpickler.load()
+        except EOFError:
+            return
+        if type(message) is MessageBatch:
+            yield from message
+        else:
+            yield message
+
+
+def producesMessages(module) -> bool:
+    # pycsdr modules only produce raw data
+    return isinstance(module, Module) and module.producesMessages()
+
+
+def consumesMessages(module) -> bool:
+    return isinstance(module, Module) and module.consumesMessages()
+
+
+class MessageWriter(ABC):
+    """
+    Receives decoded messages as lists of Python objects, without pickling them into a Buffer.
+    """
+    @abstractmethod
+    def write(self, messages: list) -> None:
+        pass
+
+
+class MessageChannel(MessageWriter):
+    """
+    Bounded queue passing messages between two modules. If the reading module falls behind, the oldest messages are
+    dropped and counted. The channel is its own reader, and read() returns all pending messages at once.
+    """
+    def __init__(self, maxsize: int = 1000):
+        self.queue = deque(maxlen=maxsize)
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.droppedCounter = Metrics.getSharedInstance().getOrAddMetric("decoding.bus.dropped", CounterMetric)
+
+    def write(self, messages: list) -> None:
+        with self.condition:
+            if self.stopped:
+                return
+            overflow = len(self.queue) + len(messages) - self.queue.maxlen
+            if overflow > 0:
+                self.droppedCounter.inc(overflow)
+            self.queue.extend(messages)
+            self.condition.notify()
+
+    def getReader(self):
+        return self
+
+    def read(self):
+        with self.condition:
+            while not self.queue:
+                if self.stopped:
+                    return None
+                self.condition.wait()
+            messages = list(self.queue)
+            self.queue.clear()
+            return messages
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def resume(self):
+        with self.condition:
+            self.stopped = False
+
+
+class MessageSink(MessageWriter):
+    """
+    Passes messages to a callback on the thread of the writing module. Without a callback, messages are discarded.
+    """
+    def __init__(self, callback: callable = None):
+        self.callback = callback
+
+    def write(self, messages: list) -> None:
+        if self.callback is None:
+            return
+        for message in messages:
+            try:
+                self.callback(message)
+            except Exception:
+                logger.exception("error while delivering decoded message")
+
+
+class LineFramer(object):
+    """
+    Splits a byte stream into lines. Incomplete lines are kept in a bytearray, and only the newly appended data is
+    scanned for a separator, so that a long line arriving in many small reads is not copied and split on every read.
+    """
+    def __init__(self, separator: bytes = b"\n"):
+        self.separator = separator
+        self.buffer = bytearray()
+
+    def feed(self, data) -> list:
+        buffer = self.buffer
+        # a separator may span the retained data and the new data
+        start = max(0, len(buffer) - len(self.separator) + 1)
+        buffer += data
+        if buffer.find(self.separator, start) < 0:
+            return []
+        lines = bytes(buffer).split(self.separator)
+        # the last element is either empty, or an incomplete line
+        self.buffer = bytearray(lines.pop())
+        return lines
+
+
+class PickleModule(ParserModule):
     def getInputFormat(self) -> Format:
         return Format.CHAR
 
     def getOutputFormat(self) -> Format:
         return Format.CHAR
 
+    def consumesMessages(self) -> bool:
+        return True
+
     def run(self):
         while self.doRun:
-            data = self.reader.read()
-            if data is None:
+            messages = self.readMessages()
+            if messages is None:
                 self.doRun = False
                 break
-            io = BytesIO(data.tobytes())
-            try:
-                while True:
-                    output = self.process(pickle.load(io))
-                    if output is not None:
-                        self.writer.write(pickle.dumps(output))
-            except EOFError:
-                pass
+            # everything decoded from one read is written as one batch
+            outputs = []
+            for message in messages:
+                output = self.timedProcess(message)
+                if output is not None:
+                    outputs.append(output)
+            if outputs:
+                self.writeMessages(outputs)
 
     @abstractmethod
     def process(self, input):
         pass
 
 
-class LineBasedModule(ThreadModule, metaclass=ABCMeta):
+class LineBasedModule(ParserModule, metaclass=ABCMeta):
     def __init__(self):
-        self.retained = bytes()
+        self.framer = LineFramer()
         super().__init__()
 
     def getInputFormat(self) -> Format:
@@ -142,19 +332,13 @@ class LineBasedModule(ThreadModule, metaclass=ABCMeta):
             if data is None:
                 self.doRun = False
             else:
-                self.retained += data
-                lines = self.retained.split(b"\n")
-
-                # keep the last line
-                # this should either be empty if the last char was \n
-                # or an incomplete line if the read returned early
-                self.retained = lines[-1]
-
-                # log all completed lines
-                for line in lines[0:-1]:
-                    parsed = self.process(line)
+                outputs = []
+                for line in self.framer.feed(data):
+                    parsed = self.timedProcess(line)
                     if parsed is not None:
-                        self.writer.write(pickle.dumps(parsed))
+                        outputs.append(parsed)
+                if outputs:
+                    self.writeMessages(outputs)
 
     @abstractmethod
     def process(self, line: bytes) -> any:
@@ -185,7 +369,11 @@ class PopenModule(AutoStartModule, metaclass=ABCMeta):
         pass
 
     def _getProcess(self):
-        return Popen(self.getCommand(), stdin=PIPE, stdout=PIPE)
+        # decoder processes run on the batch cores
+        with CpuAffinity.getSharedInstance().scope(CpuClass.BATCH):
+            process = Popen(self.getCommand(), stdin=PIPE, stdout=PIPE)
+        CpuAffinity.getSharedInstance().applyToProcess(process.pid, CpuClass.BATCH)
+        return process
 
     def start(self):
         self.process = self._getProcess()
@@ -211,7 +399,7 @@ class LogReader(Thread):
     def __init__(self, prefix: str, buffer: Buffer):
         self.reader = buffer.getReader()
         self.logger = logging.getLogger(prefix)
-        self.retained = bytes()
+        self.framer = LineFramer()
         super().__init__()
         self.start()
 
@@ -221,16 +409,8 @@ class LogReader(Thread):
             if data is None:
                 return
 
-            self.retained += data
-            lines = self.retained.split(b"\n")
-
-            # keep the last line
-            # this should either be empty if the last char was \n
-            # or an incomplete line if the read returned early
-            self.retained = lines[-1]
-
             # log all completed lines
-            for line in lines[0:-1]:
+            for line in self.framer.feed(data):
                 self.logger.info("{}: {}".format("STDOUT", line.decode(errors="replace")))
 
     def stop(self):
@@ -0,0 +1,173 @@
+from csdr.module import ThreadModule
+from pycsdr.modules import Buffer
+from pycsdr.types import Format
+from typing import Optional
+import numpy as np
+import threading
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _getRelativeBins(size: int) -> np.ndarray:
+    # bin order expected by the inverse fft: 0 .. size / 2 - 1, then -size / 2 .. -1
+    return np.fft.fftfreq(size, 1 / size).astype(np.int64)
+
+
+class FilterBank(object):
+    """
+    Overlap-save FFT filterbank. Every block of input samples is transformed once, and each channel is extracted
+    by picking the bins around its center, applying the filter response and running a small inverse FFT. This
+    shifts, filters and decimates in one step, so the cost per channel is independent of the input sample rate.
+    """
+    def __init__(self, sampleRate: int, fftSize: int = 65536):
+        self.sampleRate = sampleRate
+        self.fftSize = fftSize
+        # 25% overlap. this also bounds the filter length to fftSize / 4 + 1 taps.
+        self.hopSize = fftSize * 3 // 4
+        self.overlap = fftSize - self.hopSize
+        self.channels = ()
+        self.channelsLock = threading.Lock()
+        self.responses = {}
+        self.blockIndex = 0
+        self.block = np.zeros(fftSize, dtype=np.complex64)
+        # start with a full overlap worth of silence so that every block contributes exactly hopSize new samples
+        self.fill = self.overlap
+
+    def getDecimation(self, minRate: float) -> Optional[int]:
+        # the decimation must be a power of two so that it divides both the fft size and the hop size. the output
+        # rate has some headroom so that the filter transition band stays outside of the requested rate.
+        decimation = 1
+        while self.sampleRate / (decimation * 2) >= minRate * 1.25 and decimation * 2 <= self.overlap:
+            decimation *= 2
+        if decimation < 2:
+            return None
+        return decimation
+
+    def _getResponse(self, decimation: int) -> np.ndarray:
+        if decimation not in self.responses:
+            taps = self.overlap + 1
+            cutoff = 0.4 / decimation
+            n = np.arange(taps) - (taps - 1) / 2
+            h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(taps, 8.0)
+            h /= np.sum(h)
+            response = np.fft.fft(h, self.fftSize)
+            size = self.fftSize // decimation
+            # only keep the bins that end up in the decimated output, scaled for the smaller inverse transform
+            self.responses[decimation] = (response[_getRelativeBins(size)] / decimation).astype(np.complex64)
+        return self.responses[decimation]
+
+    def addChannel(self, offset: float, minRate: float) -> Optional["FilterBankChannel"]:
+        decimation = self.getDecimation(minRate)
+        if decimation is None:
+            return None
+        channel = FilterBankChannel(self, offset, decimation, self._getResponse(decimation))
+        with self.channelsLock:
+            self.channels = self.channels + (channel,)
+        return channel
+
+    def removeChannel(self, channel: "FilterBankChannel") -> None:
+        with self.channelsLock:
+            self.channels = tuple(c for c in self.channels if c is not channel)
+
+    def process(self, samples: np.ndarray) -> None:
+        position = 0
+        while position < len(samples):
+            count = min(self.fftSize - self.fill, len(samples) - position)
+            self.block[self.fill:self.fill + count] = samples[position:position + count]
+            self.fill += count
+            position += count
+            if self.fill == self.fftSize:
+                spectrum = np.fft.fft(self.block)
+                for channel in self.channels:
+                    channel.process(spectrum, self.blockIndex)
+                self.blockIndex += 1
+                self.block[:self.overlap] = self.block[self.hopSize:]
+                self.fill = self.overlap
+
+
+class FilterBankChannel(object):
+    def __init__(self, bank: FilterBank, offset: float, decimation: int, response: np.ndarray):
+        self.bank = bank
+        self.decimation = decimation
+        self.response = response
+        binWidth = bank.sampleRate / bank.fftSize
+        self.centerBin = int(round(offset / binWidth))
+        # the channel is centered on the closest bin, the remainder needs to be shifted by the consumer
+        self.residualOffset = offset - self.centerBin * binWidth
+        self.bins = (self.centerBin + _getRelativeBins(bank.fftSize // decimation)) % bank.fftSize
+        self.discard = bank.overlap // decimation
+        self.callback = None
+
+    def getSampleRate(self) -> float:
+        return self.bank.sampleRate / self.decimation
+
+    def getResidualOffset(self) -> float:
+        return self.residualOffset
+
+    def setCallback(self, callback) -> None:
+        self.callback = callback
+
+    def process(self, spectrum: np.ndarray, blockIndex: int) -> None:
+        # blocks start hopSize samples apart, so the downconversion phase advances by centerBin * hopSize / fftSize
+        # turns per block. keep this exact by using integer arithmetic.
+        turns = (self.centerBin * self.bank.hopSize * blockIndex) % self.bank.fftSize
+        phase = np.complex64(np.exp(-2j * np.pi * turns / self.bank.fftSize))
+        output = np.fft.ifft(spectrum[self.bins] * self.response * phase)[self.discard:]
+        if self.callback is not None:
+            self.callback(output.astype(np.complex64))
+
+
+class Channelizer(ThreadModule):
+    """
+    Reads an IQ stream once and provides many narrow channels, each with its own output buffer.
+    """
+    def __init__(self, sampleRate: int, fftSize: int = 65536):
+        self.bank = FilterBank(sampleRate, fftSize)
+        self.buffers = {}
+        super().__init__()
+
+    def getInputFormat(self) -> Format:
+        return Format.COMPLEX_FLOAT
+
+    def getOutputFormat(self) -> Format:
+        return Format.COMPLEX_FLOAT
+
+    def _checkStart(self) -> None:
+        # outputs are per channel, so there is no writer to wait for
+        if self.reader is not None:
+            self.start()
+
+    def addChannel(self, offset: float, minRate: float) -> Optional[FilterBankChannel]:
+        """
+        Adds a channel at the given offset from the center frequency, with a sample rate of at least minRate.
+        Returns None if the channel would not be decimated, in which case the caller should use the input directly.
+        """
+        channel = self.bank.addChannel(offset, minRate)
+        if channel is None:
+            return None
+        buffer = Buffer(Format.COMPLEX_FLOAT)
+        channel.setCallback(lambda data: buffer.write(data.tobytes()))
+        self.buffers[channel] = buffer
+        return channel
+
+    def removeChannel(self, channel: FilterBankChannel) -> None:
+        self.bank.removeChannel(channel)
+        self.buffers.pop(channel, None)
+
+    def getBuffer(self, channel: FilterBankChannel) -> Buffer:
+        return self.buffers[channel]
+
+    def run(self):
+        while self.doRun:
+            data = self.reader.read()
+            if data is None:
+                self.doRun = False
+                break
+            try:
+                self.bank.process(np.frombuffer(data, dtype=np.complex64))
+            except BrokenPipeError:
+                break
+            except Exception:
+                logger.exception("error while channelizing")
@@ -144,11 +144,14 @@ MapManager.prototype.process = function(e) {
 MapManager.prototype.connect = function() {
     var ws = new WebSocket(this.ws_url);
     var self = this;
+    this.ws = ws;
 
     // When socket opens...
     ws.onopen = function() {
-        ws.send("SERVER DE CLIENT client=map.js type=map");
+        ws.send("SERVER DE CLIENT client=map.js type=map viewport=1");
         self.reconnect_timeout = false
+        // after reconnecting, subscribe to the area already on display
+        self.sendViewport();
     };
 
     // When socket closes...
@@ -188,6 +191,17 @@ MapManager.prototype.connect = function() {
     };
 };
 
+//
+// Subscribe to positions within the currently visible map area
+//
+MapManager.prototype.sendViewport = function() {
+    if (!this.ws || this.ws.readyState !== WebSocket.OPEN) return;
+    var viewport = this.getViewport();
+    if (viewport) {
+        this.ws.send(JSON.stringify({ type: 'viewport', value: viewport }));
+    }
+};
+
 //
 // Set up legend filter toggles inside given HTML element.
 //
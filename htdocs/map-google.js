@@ -82,6 +82,17 @@ MapManager.prototype.removeReceiver = function() {
     if (receiverMarker) receiverMarker.setMap();
 }
 
+MapManager.prototype.getViewport = function() {
+    var bounds = map? map.getBounds() : null;
+    if (!bounds) return null;
+    return {
+        north : bounds.getNorthEast().lat(),
+        south : bounds.getSouthWest().lat(),
+        east  : bounds.getNorthEast().lng(),
+        west  : bounds.getSouthWest().lng()
+    };
+};
+
 MapManager.prototype.initializeMap = function(receiver_gps, api_key, weather_key) {
     var receiverPos = { lat: receiver_gps.lat, lng: receiver_gps.lon };
 
@@ -109,6 +120,9 @@ MapManager.prototype.initializeMap = function(receiver_gps, api_key, weather_key
                 zoom   : 5,
             });
 
+            // only receive positions for the visible area
+            map.addListener('idle', function() { self.sendViewport(); });
+
             // Load and initialize day-and-night overlay
             $.getScript("static/lib/nite-overlay.js").done(function() {
                 nite.init(map);
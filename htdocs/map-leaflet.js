@@ -244,6 +244,17 @@ MapManager.prototype.removeReceiver = function() {
     if (receiverMarker) receiverMarker.setMap();
 }
 
+MapManager.prototype.getViewport = function() {
+    if (!map) return null;
+    var bounds = map.getBounds();
+    return {
+        north : bounds.getNorth(),
+        south : bounds.getSouth(),
+        east  : bounds.getEast(),
+        west  : bounds.getWest()
+    };
+}
+
 MapManager.prototype.initializeMap = async function(receiver_gps, api_key, weather_key) {
     if (map) {
         receiverMarker.setLatLng(receiver_gps.lat, receiver_gps.lon);
@@ -266,6 +277,10 @@ MapManager.prototype.initializeMap = async function(receiver_gps, api_key, weath
         // add zoom control
         new L.Control.Zoom({ position: 'bottomright' }).addTo(map);
 
+        // only receive positions for the visible area
+        map.on('moveend', function() { self.sendViewport(); });
+        self.sendViewport();
+
         // add night overlay
         $.getScript('https://unpkg.com/@joergdietrich/leaflet.terminator@1.1.0/L.Terminator.js').done(function () {
             var pane = map.createPane('nite');
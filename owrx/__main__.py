@@ -8,6 +8,7 @@ logger = logging.getLogger(__name__)
 
 from http.server import HTTPServer
 from owrx.http import RequestHandler
+from owrx.asynchttp import AsyncHttpServer
 from owrx.config.core import CoreConfig
 from owrx.config import Config
 from owrx.config.commands import MigrateCommand
@@ -24,6 +25,7 @@ from owrx.reporting import ReportingEngine
 from owrx.markers import Markers
 from owrx.gps import GpsUpdater
 from owrx.wifi import WiFi
+from owrx.controllers.assets import AssetCache
 from datetime import datetime
 from pathlib import Path
 import signal
@@ -162,26 +164,35 @@ Support and info:       https://groups.io/g/openwebrx
     # Instantiate and refresh marker database
     Markers.start()
 
+    # Compile and compress javascript bundles in the background
+    AssetCache.getSharedInstance().start()
+
     # Report server started
     reportServerState("ServerStarted")
 
     try:
-        # This is our HTTP server
-        server = ThreadedHttpServer(coreConfig.get_web_port(), RequestHandler, coreConfig.get_web_ipv6(), coreConfig.get_web_bind_address())
         # We expect to find SSL certificate here
         keyFile  = "/etc/openwebrx/key.pem"
         certFile = "/etc/openwebrx/cert.pem"
         # If SSL certificate found, use HTTPS instead of HTTP
+        ctx = None
         if os.path.isfile(keyFile) and os.path.isfile(certFile):
             ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
             ctx.load_cert_chain(certFile, keyFile)
-            server.socket = ctx.wrap_socket(server.socket, server_side=True)
             logger.info("Found SSL certificate, using https:// protocol.")
         else:
             logger.info("No SSL certificate, using http:// protocol.")
             logger.info("To enable https://, supply SSL certificate:")
             logger.info("    " + certFile)
             logger.info("    " + keyFile)
+        # This is our HTTP server
+        if coreConfig.get_web_server() == "asyncio":
+            logger.info("Using asyncio web server.")
+            server = AsyncHttpServer(coreConfig.get_web_port(), coreConfig.get_web_ipv6(), coreConfig.get_web_bind_address(), ctx)
+        else:
+            server = ThreadedHttpServer(coreConfig.get_web_port(), RequestHandler, coreConfig.get_web_ipv6(), coreConfig.get_web_bind_address())
+            if ctx is not None:
+                server.socket = ctx.wrap_socket(server.socket, server_side=True)
         # Run the server
         logger.info("Ready to serve requests.")
         server.serve_forever()
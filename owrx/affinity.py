@@ -0,0 +1,130 @@
+from owrx.config import Config
+from contextlib import contextmanager
+from enum import Enum
+import threading
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CpuClass(Enum):
+    # latency sensitive work: SDR sources, FFT and client demodulators
+    REALTIME = "cpu_realtime_cores"
+    # throughput oriented work: decoder queue and decoder subprocesses
+    BATCH = "cpu_batch_cores"
+
+
+class CpuAffinity(object):
+    """
+    Pins threads and processes of a given class to a configurable set of cores, so that batch decoding can not
+    starve the realtime DSP. Core sets are configured as lists like "0-1,4". An empty setting disables pinning.
+    """
+    sharedInstance = None
+    creationLock = threading.Lock()
+
+    @staticmethod
+    def getSharedInstance():
+        with CpuAffinity.creationLock:
+            if CpuAffinity.sharedInstance is None:
+                CpuAffinity.sharedInstance = CpuAffinity()
+        return CpuAffinity.sharedInstance
+
+    @staticmethod
+    def parseCores(value: str):
+        if value is None or not value.strip():
+            return None
+        cores = set()
+        for part in value.split(","):
+            part = part.strip()
+            if "-" in part:
+                (first, last) = part.split("-", 1)
+                cores.update(range(int(first), int(last) + 1))
+            elif part:
+                cores.add(int(part))
+        available = CpuAffinity.getAvailableCores()
+        if available is not None:
+            cores &= available
+        return cores if cores else None
+
+    @staticmethod
+    def getAvailableCores():
+        if not hasattr(os, "sched_getaffinity"):
+            return None
+        return os.sched_getaffinity(0)
+
+    def __init__(self):
+        self.cores = {}
+        pm = Config.get()
+        self.subscriptions = [pm.wireProperty(c.value, self._getUpdater(c)) for c in CpuClass]
+
+    def _getUpdater(self, cpuClass: CpuClass):
+        def update(value):
+            try:
+                self.cores[cpuClass] = CpuAffinity.parseCores(value)
+            except ValueError:
+                logger.warning("invalid core list for %s: %s", cpuClass.name, value)
+                self.cores[cpuClass] = None
+        return update
+
+    def getCores(self, cpuClass: CpuClass):
+        return self.cores.get(cpuClass)
+
+    def applyToProcess(self, pid: int, cpuClass: CpuClass):
+        """
+        Pin an existing process. Batch processes are also moved to the SCHED_BATCH policy.
+        """
+        if cpuClass is CpuClass.BATCH and hasattr(os, "sched_setscheduler"):
+            try:
+                os.sched_setscheduler(pid, os.SCHED_BATCH, os.sched_param(0))
+            except OSError:
+                logger.debug("could not set scheduling policy for pid %i", pid)
+        cores = self.getCores(cpuClass)
+        if cores is None or not hasattr(os, "sched_setaffinity"):
+            return
+        try:
+            os.sched_setaffinity(pid, cores)
+        except OSError:
+            # the process may have ended already
+            logger.debug("could not set affinity for pid %i", pid)
+
+    def applyToCurrentThread(self, cpuClass: CpuClass):
+        # on linux, pid 0 refers to the calling thread, and threads started from here inherit its affinity
+        self.applyToProcess(0, cpuClass)
+
+    @contextmanager
+    def scope(self, cpuClass: CpuClass):
+        """
+        Temporarily pin the current thread, so that any threads created by native modules in the meantime inherit
+        the affinity.
+        """
+        cores = self.getCores(cpuClass)
+        if cores is None or not hasattr(os, "sched_setaffinity"):
+            yield
+            return
+        previous = os.sched_getaffinity(0)
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError:
+            logger.debug("could not set thread affinity")
+            yield
+            return
+        try:
+            yield
+        finally:
+            os.sched_setaffinity(0, previous)
+
+    def wrap(self, target, cpuClass: CpuClass):
+        """
+        Wrap a thread target so that the thread pins itself before running it.
+        """
+        def pinned(*args, **kwargs):
+            cores = self.getCores(cpuClass)
+            if cores is not None and hasattr(os, "sched_setaffinity"):
+                try:
+                    os.sched_setaffinity(0, cores)
+                except OSError:
+                    logger.debug("could not set thread affinity")
+            return target(*args, **kwargs)
+        return pinned
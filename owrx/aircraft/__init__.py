@@ -8,7 +8,6 @@ from owrx.reporting import ReportingEngine
 from datetime import datetime, timedelta, timezone
 
 import threading
-import pickle
 import json
 import time
 import re
@@ -686,10 +685,10 @@ class AdsbParser(AircraftParser):
                     parsed = self.parseJson(self.jsonFile)
                     if not self.service and self.writer and parsed > 0:
                         data = AircraftManager.getSharedInstance().getData("ADSB")
-                        self.writer.write(pickle.dumps({
+                        self.writeMessages([{
                             "mode"     : "ADSB-LIST",
                             "aircraft" : data
-                        }))
+                        }])
             except Exception as exptn:
                 logger.info("Failed to check file '{0}': {1}".format(self.jsonFile, exptn))
             # Wait until the next check or termination
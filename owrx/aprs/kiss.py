@@ -1,6 +1,5 @@
 from pycsdr.types import Format
 from csdr.module import ThreadModule
-import pickle
 
 import logging
 
@@ -24,14 +23,18 @@ class KissDeframer(ThreadModule):
     def getOutputFormat(self) -> Format:
         return Format.CHAR
 
+    def producesMessages(self) -> bool:
+        return True
+
     def run(self):
         while self.doRun:
             data = self.reader.read()
             if data is None:
                 self.doRun = False
             else:
-                for frame in self.parse(data):
-                    self.writer.write(pickle.dumps(frame))
+                frames = list(self.parse(data))
+                if frames:
+                    self.writeMessages(frames)
 
     def parse(self, input):
         for b in input:
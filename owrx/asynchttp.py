@@ -0,0 +1,162 @@
+from owrx.http import RequestHandler, Request
+from owrx.controllers.websocket import WebSocketController
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.client import parse_headers
+from email.utils import formatdate
+from io import BytesIO
+import asyncio
+import signal
+import socket
+import html
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRequestHandler(object):
+    """
+    Compatibility layer that looks like a BaseHTTPRequestHandler to the existing controllers.
+
+    The request body is read in advance, and the response is collected in memory and written to the
+    transport once the controller has finished.
+    """
+    server_version = RequestHandler.server_version
+    sys_version = RequestHandler.sys_version
+    protocol_version = "HTTP/1.0"
+
+    def __init__(self, client_address, method, path, headers, body: bytes):
+        self.client_address = client_address
+        self.command = method
+        self.path = path
+        self.headers = headers
+        self.rfile = BytesIO(body)
+        self.wfile = BytesIO()
+        self.headerBuffer = []
+
+    def send_response(self, code, message=None):
+        if message is None:
+            try:
+                message = HTTPStatus(code).phrase
+            except ValueError:
+                message = ""
+        self.headerBuffer.append("{0} {1} {2}\r\n".format(self.protocol_version, code, message))
+        self.send_header("Server", "{0} {1}".format(self.server_version, self.sys_version))
+        self.send_header("Date", formatdate(usegmt=True))
+
+    def send_header(self, key, value):
+        self.headerBuffer.append("{0}: {1}\r\n".format(key, value))
+
+    def end_headers(self):
+        self.headerBuffer.append("\r\n")
+        self.wfile.write("".join(self.headerBuffer).encode("latin-1", "strict"))
+        self.headerBuffer = []
+
+    def send_error(self, code, message=None, explain=None):
+        status = HTTPStatus(code)
+        message = status.phrase if message is None else message
+        explain = status.description if explain is None else explain
+        body = RequestHandler.error_message_format % {
+            "code": code,
+            "message": html.escape(message, quote=False),
+            "explain": html.escape(explain, quote=False),
+        }
+        self.send_response(code, message)
+        self.send_header("Content-Type", RequestHandler.error_content_type)
+        self.send_header("Connection", "close")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode("utf-8", "replace"))
+
+    def getResponse(self):
+        return self.wfile.getvalue()
+
+
+class AsyncHttpServer(object):
+    """
+    HTTP server running on an asyncio event loop.
+
+    Plain HTTP requests are routed through the regular Router and executed on a bounded thread pool, websockets
+    are served as coroutines instead of holding a thread each.
+    """
+    maxHeaderSize = 64 * 1024
+    maxBodySize = 16 * 1024 * 1024
+
+    def __init__(self, web_port, use_ipv6, bind_address=None, ssl_context=None, workers: int = 32):
+        if bind_address is None:
+            bind_address = "::" if use_ipv6 else "0.0.0.0"
+        self.address = bind_address
+        self.port = web_port
+        self.family = socket.AF_INET6 if use_ipv6 else socket.AF_INET
+        self.ssl_context = ssl_context
+        self.router = RequestHandler.router
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="owrx_http")
+        self.loop = None
+
+    async def _readHead(self, reader):
+        lines = []
+        size = 0
+        while True:
+            line = await reader.readline()
+            size += len(line)
+            if size > AsyncHttpServer.maxHeaderSize:
+                raise ValueError("request header too large")
+            if not line or line in (b"\r\n", b"\n"):
+                break
+            lines.append(line)
+        return lines
+
+    async def handleConnection(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        try:
+            lines = await self._readHead(reader)
+            if not lines:
+                return
+            (method, path, _) = lines[0].decode("latin-1").rstrip("\r\n").split(" ", 2)
+            headers = parse_headers(BytesIO(b"".join(lines[1:]) + b"\r\n"))
+
+            body = b""
+            if "Content-Length" in headers:
+                length = int(headers["Content-Length"])
+                if length > AsyncHttpServer.maxBodySize:
+                    raise ValueError("request body too large")
+                body = await reader.readexactly(length)
+
+            handler = AsyncRequestHandler(peer, method, path, headers, body)
+            request = Request(path, method, headers)
+            route = self.router.find_route(request)
+
+            if route is not None and issubclass(route.controller, WebSocketController):
+                controller = route.controller(handler, request, route.controllerOptions)
+                await controller.handleAsync(reader, writer, self.executor)
+                return
+
+            await self.loop.run_in_executor(self.executor, self.router.route, handler, request)
+            writer.write(handler.getResponse())
+            await writer.drain()
+        except (ValueError, asyncio.IncompleteReadError):
+            logger.debug("invalid request from %s", peer)
+        except OSError:
+            logger.debug("connection error while serving %s", peer)
+        except Exception:
+            logger.exception("exception while serving %s", peer)
+        finally:
+            writer.close()
+
+    def serve_forever(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(
+            asyncio.start_server(
+                self.handleConnection, self.address, self.port, family=self.family, ssl=self.ssl_context
+            )
+        )
+        for sig in [signal.SIGINT, signal.SIGTERM]:
+            self.loop.add_signal_handler(sig, self.loop.stop)
+        try:
+            self.loop.run_forever()
+        finally:
+            server.close()
+            self.loop.run_until_complete(server.wait_closed())
+            self.executor.shutdown(wait=False)
@@ -20,6 +20,14 @@ class AudioChopperProfile(ABC):
     def decoder_commandline(self, file):
         pass
 
+    @abstractmethod
+    def getMode(self):
+        pass
+
+    def getPriority(self):
+        # decoding jobs with a higher priority are preferred when the decoding queue is full
+        return 0
+
 
 class ProfileSourceSubscriber(ABC):
     @abstractmethod
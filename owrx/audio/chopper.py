@@ -3,11 +3,10 @@ from owrx.audio import AudioChopperProfile
 from itertools import groupby
 from owrx.audio import ProfileSourceSubscriber
 from owrx.audio.wav import AudioWriter
-from owrx.audio.queue import QueueJob
+from owrx.audio.queue import QueueJob, MemoryQueueJob
 from csdr.module import ThreadModule
 from pycsdr.types import Format
 from abc import ABC, abstractmethod
-import pickle
 
 import logging
 
@@ -84,8 +83,17 @@ class AudioChopper(ThreadModule, ProfileSourceSubscriber):
     def createJob(self, profile, filename):
         return QueueJob(profile, self.dialFrequency, self, filename)
 
+    def createMemoryJob(self, profile, name, data: bytes):
+        return MemoryQueueJob(profile, self.dialFrequency, self, name, data)
+
+    def producesMessages(self) -> bool:
+        return True
+
     def sendResult(self, result):
+        messages = []
         for line in result.lines:
             data = self.parser.parse(result.profile, result.frequency, line)
-            if data is not None and self.writer is not None:
-                self.writer.write(pickle.dumps(data))
+            if data is not None:
+                messages.append(data)
+        if messages and self.writer is not None:
+            self.writeMessages(messages)
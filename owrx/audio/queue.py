@@ -1,10 +1,13 @@
 from owrx.config import Config
 from owrx.config.core import CoreConfig
-from owrx.metrics import Metrics, CounterMetric, DirectMetric
-from queue import Queue, Full, Empty
+from owrx.metrics import Metrics, CounterMetric, DirectMetric, HistogramMetric
+from owrx.affinity import CpuAffinity, CpuClass
+from queue import Queue, Full
 import subprocess
+import heapq
 import os
 import threading
+import time
 
 import logging
 
@@ -25,16 +28,48 @@ class QueueJob(object):
         self.frequency = frequency
         self.writer = writer
         self.file = file
+        # set by the queue when the job is accepted
+        self.queuedAt = None
+        # jobs are created at the end of their interval, results arriving later than one more interval are useless
+        self.deadline = time.monotonic() + profile.getInterval()
+        self.priority = profile.getPriority()
+        # seconds spent writing and preparing the input, and running the decoder
+        self.ioTime = 0.0
+        self.decodeTime = None
+
+    def _prepare(self):
+        """
+        Make the audio available to the decoder. Returns the path to pass on the command line and the file
+        descriptors the decoder needs to inherit.
+        """
+        return self.file, ()
+
+    def _release(self):
+        pass
 
     def run(self):
         logger.debug("processing file %s", self.file)
         tmp_dir = CoreConfig().get_temporary_directory()
+        start = time.perf_counter()
+        (path, fds) = self._prepare()
+        self.ioTime += time.perf_counter() - start
+        start = time.perf_counter()
+        try:
+            self._decode(path, fds, tmp_dir)
+        finally:
+            self.decodeTime = time.perf_counter() - start
+            self._release()
+
+    def _decode(self, path, fds, tmp_dir):
         decoder = subprocess.Popen(
-            ["nice", "-n", "10"] + self.profile.decoder_commandline(self.file),
+            ["nice", "-n", "10"] + self.profile.decoder_commandline(path),
             stdout=subprocess.PIPE,
             cwd=tmp_dir,
             close_fds=True,
+            pass_fds=fds,
             )
+        # the decoder inherits the affinity of the worker thread, but the scheduling policy is set explicitly
+        CpuAffinity.getSharedInstance().applyToProcess(decoder.pid, CpuClass.BATCH)
         lines = None
         try:
             lines = [l for l in decoder.stdout]
@@ -63,6 +98,50 @@ class QueueJob(object):
             pass
 
 
+class MemoryQueueJob(QueueJob):
+    """
+    Decoding job for audio that is kept in memory. The audio is handed to the decoder as an anonymous memory file
+    (memfd) that is only visible to the decoder through /dev/fd. If memfd is not available, the audio is written
+    to a temporary file right before decoding.
+    """
+    def __init__(self, profile, frequency, writer, name, data: bytes):
+        super().__init__(profile, frequency, writer, name)
+        self.data = data
+        self.fd = None
+        self.tmpFile = None
+
+    def _prepare(self):
+        if hasattr(os, "memfd_create"):
+            try:
+                self.fd = os.memfd_create(os.path.basename(self.file))
+                os.write(self.fd, self.data)
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                return "/dev/fd/{}".format(self.fd), (self.fd,)
+            except OSError:
+                logger.warning("could not create memory file, falling back to temporary file")
+                self._release()
+        self.tmpFile = "{}/{}".format(CoreConfig().get_temporary_directory(), self.file)
+        with open(self.tmpFile, "wb") as f:
+            f.write(self.data)
+        return self.tmpFile, ()
+
+    def _release(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.tmpFile is not None:
+            try:
+                os.unlink(self.tmpFile)
+            except FileNotFoundError:
+                pass
+            self.tmpFile = None
+
+    def unlink(self):
+        self._release()
+        # release the memory even if the job object is still referenced somewhere
+        self.data = None
+
+
 PoisonPill = object()
 
 
@@ -70,21 +149,27 @@ class QueueWorker(threading.Thread):
     def __init__(self, queue):
         self.queue = queue
         self.doRun = True
+        self.busy = False
         super().__init__()
 
     def run(self) -> None:
+        CpuAffinity.getSharedInstance().applyToCurrentThread(CpuClass.BATCH)
         while self.doRun:
             job = self.queue.get()
             if job is PoisonPill:
                 self.stop()
             else:
+                self.busy = True
                 try:
-                    job.run()
+                    with self.queue.runTime.time():
+                        job.run()
                 except Exception:
                     logger.exception("failed to decode job")
                     self.queue.onError()
                 finally:
                     job.unlink()
+                    self.queue.onJobDone(job)
+                    self.busy = False
 
             self.queue.task_done()
 
@@ -93,8 +178,16 @@ class QueueWorker(threading.Thread):
 
 
 class DecoderQueue(Queue):
+    """
+    Decoding job queue ordered by deadline (earliest first), then by profile priority.
+
+    Jobs that have passed their deadline are dropped instead of being decoded. When the queue is full, the least
+    valuable job (lowest priority, latest deadline) is dropped, which is not necessarily the newest one.
+    """
     sharedInstance = None
     creationLock = threading.Lock()
+    # seconds between adjustments of the worker count in automatic mode
+    autoWorkersInterval = 10
 
     @staticmethod
     def getSharedInstance():
@@ -114,47 +207,135 @@ class DecoderQueue(Queue):
         pm = Config.get()
         super().__init__(pm["decoding_queue_length"])
         self.workers = []
-        self._setWorkers(pm["decoding_queue_workers"])
+        self.workersLock = threading.Lock()
+        self.autoWorkers = False
+        self.lastAdjustment = 0
+        self.sequence = 0
         self.subscriptions = [
             pm.wireProperty("decoding_queue_length", self._setMaxSize),
-            pm.wireProperty("decoding_queue_workers", self._setWorkers),
+            pm.wireProperty("decoding_queue_workers", self._setWorkerConfig),
         ]
         metrics = Metrics.getSharedInstance()
+        self.metrics = metrics
         metrics.addMetric("decoding.queue.length", DirectMetric(self.qsize))
+        metrics.addMetric("decoding.queue.workers", DirectMetric(lambda: len(self.workers)))
         self.inCounter = CounterMetric()
         metrics.addMetric("decoding.queue.in", self.inCounter)
         self.outCounter = CounterMetric()
         metrics.addMetric("decoding.queue.out", self.outCounter)
         self.overflowCounter = CounterMetric()
         metrics.addMetric("decoding.queue.overflow", self.overflowCounter)
+        self.expiredCounter = CounterMetric()
+        metrics.addMetric("decoding.queue.expired", self.expiredCounter)
         self.errorCounter = CounterMetric()
         metrics.addMetric("decoding.queue.error", self.errorCounter)
+        # decoder jobs take seconds rather than milliseconds
+        self.buckets = [0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0, 120.0]
+        self.waitTime = HistogramMetric(self.buckets)
+        metrics.addMetric("decoding.queue.wait_time", self.waitTime)
+        self.runTime = HistogramMetric(self.buckets)
+        metrics.addMetric("decoding.queue.run_time", self.runTime)
+        # time to make the audio available to the decoder, and time spent in the decoder itself
+        self.ioTime = HistogramMetric([0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0])
+        metrics.addMetric("decoding.job.io_time", self.ioTime)
+        self.decodeTime = HistogramMetric(self.buckets)
+        metrics.addMetric("decoding.job.decode_time", self.decodeTime)
+
+    # the following four methods replace the FIFO storage of Queue with a heap, see queue.PriorityQueue
+
+    def _init(self, maxsize):
+        self.queue = []
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        self.sequence += 1
+        if item is PoisonPill:
+            # shut down before processing any further jobs
+            key = (float("-inf"), 0)
+        else:
+            key = (item.deadline, -item.priority)
+        heapq.heappush(self.queue, (key, self.sequence, item))
+
+    def _get(self):
+        return heapq.heappop(self.queue)[2]
+
+    def _isExpired(self, job, now):
+        return isinstance(job, QueueJob) and job.deadline < now
+
+    def _purgeExpired(self):
+        # must be called with self.mutex held
+        now = time.monotonic()
+        expired = [entry for entry in self.queue if self._isExpired(entry[2], now)]
+        if not expired:
+            return
+        self.queue = [entry for entry in self.queue if not self._isExpired(entry[2], now)]
+        heapq.heapify(self.queue)
+        for entry in expired:
+            self._discard(entry[2])
+            self.expiredCounter.inc()
+
+    def _discard(self, job):
+        # must be called with self.mutex held, for jobs that were put() but will never be processed
+        job.unlink()
+        self.unfinished_tasks -= 1
+        if self.unfinished_tasks == 0:
+            self.all_tasks_done.notify_all()
+
+    def _value(self, job):
+        # higher is more valuable
+        return job.priority, -job.deadline
 
     def _setMaxSize(self, size):
         if self.maxsize == size:
             return
         self.maxsize = size
 
+    def _setWorkerConfig(self, workers):
+        # 0 selects automatic sizing based on the number of cpus and the system load
+        self.autoWorkers = workers <= 0
+        if self.autoWorkers:
+            self._adjustWorkers(force=True)
+        else:
+            self._setWorkers(workers)
+
+    def _getAutoWorkerCount(self):
+        cpus = os.cpu_count() or 1
+        try:
+            # load that is not caused by our own decoders
+            load = os.getloadavg()[0] - len([w for w in self.workers if w.busy])
+        except OSError:
+            load = 0
+        # leave one cpu for the realtime dsp
+        return max(1, min(cpus, int(cpus - 1 - max(0.0, load))))
+
+    def _adjustWorkers(self, force: bool = False):
+        if not self.autoWorkers:
+            return
+        now = time.monotonic()
+        if not force and now - self.lastAdjustment < DecoderQueue.autoWorkersInterval:
+            return
+        self.lastAdjustment = now
+        self._setWorkers(self._getAutoWorkerCount())
+
     def _setWorkers(self, workers):
-        while len(self.workers) > workers:
-            logger.debug("stopping one worker")
-            self.workers.pop().stop()
-        while len(self.workers) < workers:
-            logger.debug("starting one worker")
-            self.workers.append(self.newWorker())
+        with self.workersLock:
+            while len(self.workers) > workers:
+                logger.debug("stopping one worker")
+                self.workers.pop().stop()
+            while len(self.workers) < workers:
+                logger.debug("starting one worker")
+                self.workers.append(self.newWorker())
 
     def stop(self):
         logger.debug("shutting down the queue")
         while self.subscriptions:
             self.subscriptions.pop().cancel()
-        try:
-            # purge all remaining jobs
-            while not self.empty():
-                job = self.get()
-                job.unlink()
-                self.task_done()
-        except Empty:
-            pass
+        # purge all remaining jobs
+        with self.mutex:
+            while self.queue:
+                self._discard(self._get())
         # put() a PoisonPill for all active workers to shut them down
         for w in self.workers:
             if w.is_alive():
@@ -163,18 +344,49 @@ class DecoderQueue(Queue):
 
     def put(self, item, **kwargs):
         self.inCounter.inc()
-        try:
+        if item is PoisonPill:
             super(DecoderQueue, self).put(item, block=False)
-        except Full:
-            self.overflowCounter.inc()
-            raise
+            return
+        self._adjustWorkers()
+        item.queuedAt = time.monotonic()
+        with self.not_full:
+            if 0 < self.maxsize <= self._qsize():
+                self._purgeExpired()
+            if 0 < self.maxsize <= self._qsize():
+                victim = min(self.queue, key=lambda entry: self._value(entry[2]))
+                if self._value(victim[2]) >= self._value(item):
+                    self.overflowCounter.inc()
+                    raise Full()
+                logger.debug("decoding queue full, replacing a less important job")
+                self.queue.remove(victim)
+                heapq.heapify(self.queue)
+                self._discard(victim[2])
+                self.overflowCounter.inc()
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
 
     def get(self, **kwargs):
-        # super.get() is blocking, so it would mess up the stats to inc() first
-        out = super(DecoderQueue, self).get(**kwargs)
+        while True:
+            # super.get() is blocking, so it would mess up the stats to inc() first
+            out = super(DecoderQueue, self).get(**kwargs)
+            if not self._isExpired(out, time.monotonic()):
+                break
+            logger.debug("dropping expired decoding job")
+            self.expiredCounter.inc()
+            out.unlink()
+            self.task_done()
         self.outCounter.inc()
+        if isinstance(out, QueueJob) and out.queuedAt is not None:
+            wait = time.monotonic() - out.queuedAt
+            self.waitTime.observe(wait)
+            self._getModeWaitTime(out.profile).observe(wait)
         return out
 
+    def _getModeWaitTime(self, profile):
+        name = "decoding.queue.{}.wait_time".format(profile.getMode().lower())
+        return self.metrics.getOrAddMetric(name, lambda: HistogramMetric(self.buckets))
+
     def newWorker(self):
         worker = QueueWorker(self)
         worker.start()
@@ -182,3 +394,8 @@ class DecoderQueue(Queue):
 
     def onError(self):
         self.errorCounter.inc()
+
+    def onJobDone(self, job):
+        self.ioTime.observe(job.ioTime)
+        if job.decodeTime is not None:
+            self.decodeTime.observe(job.decodeTime)
@@ -1,8 +1,11 @@
+from owrx.config import Config
 from owrx.config.core import CoreConfig
 from owrx.audio import AudioChopperProfile
 from owrx.audio.queue import DecoderQueue
+from io import BytesIO
 import threading
 import wave
+import time
 import os
 from datetime import datetime, timedelta
 from queue import Full
@@ -53,6 +56,35 @@ class WaveFile(object):
         self.waveFile = None
 
 
+class MemoryWaveFile(WaveFile):
+    """
+    Wave file that is assembled in memory instead of the temporary directory.
+    """
+    def __init__(self, writer_id):
+        self.timestamp = datetime.utcnow()
+        self.writer_id = writer_id
+        self.filename = "openwebrx-audiochopper-master-{id}-{timestamp}.wav".format(
+            id=self.writer_id,
+            timestamp=self.timestamp.strftime("%y%m%d_%H%M%S"),
+        )
+        self.buffer = BytesIO()
+        self.waveFile = wave.open(self.buffer, "wb")
+        self.waveFile.setnchannels(1)
+        self.waveFile.setsampwidth(2)
+        self.waveFile.setframerate(12000)
+
+    def close(self):
+        # the wave module does not close file objects it has been given
+        self.waveFile.close()
+
+    def getData(self) -> bytes:
+        return self.buffer.getvalue()
+
+    def unlink(self):
+        self.buffer = None
+        self.waveFile = None
+
+
 class AudioWriter(object):
     def __init__(self, chopper, interval, profiles: List[AudioChopperProfile]):
         self.chopper = chopper
@@ -61,8 +93,12 @@ class AudioWriter(object):
         self.wavefile = None
         self.switchingLock = threading.Lock()
         self.timer = None
+        # seconds spent writing the current interval
+        self.ioTime = 0.0
 
     def getWaveFile(self):
+        if Config.get()["decoding_in_memory"]:
+            return MemoryWaveFile(id(self))
         return WaveFile(id(self))
 
     def getNextDecodingTime(self):
@@ -91,28 +127,41 @@ class AudioWriter(object):
         with self.switchingLock:
             file = self.wavefile
             self.wavefile = self.getWaveFile()
+            ioTime = self.ioTime
+            self.ioTime = 0.0
 
         if file is None:
             logger.warning("switchfiles() with no wave file. sequencing problem?")
             return
 
+        start = time.perf_counter()
         file.close()
-        tmp_dir = CoreConfig().get_temporary_directory()
-
-        for profile in self.profiles:
-            # create hardlinks for the individual profiles
-            filename = "{tmp_dir}/openwebrx-audiochopper-{pid}-{timestamp}.wav".format(
-                tmp_dir=tmp_dir,
-                pid=id(profile),
-                timestamp=file.getTimestamp().strftime(profile.getFileTimestampFormat()),
-            )
-            try:
-                os.link(file.getFileName(), filename)
-            except OSError:
-                logger.exception("Error while linking job files")
-                continue
-
-            job = self.chopper.createJob(profile, filename)
+        ioTime += time.perf_counter() - start
+
+        if isinstance(file, MemoryWaveFile):
+            # all profiles share the same immutable buffer, no copies or links required
+            data = file.getData()
+            jobs = [
+                self.chopper.createMemoryJob(profile, self._getJobFileName(profile, file), data)
+                for profile in self.profiles
+            ]
+        else:
+            jobs = []
+            tmp_dir = CoreConfig().get_temporary_directory()
+            for profile in self.profiles:
+                # create hardlinks for the individual profiles
+                filename = "{tmp_dir}/{name}".format(tmp_dir=tmp_dir, name=self._getJobFileName(profile, file))
+                try:
+                    start = time.perf_counter()
+                    os.link(file.getFileName(), filename)
+                    ioTime += time.perf_counter() - start
+                except OSError:
+                    logger.exception("Error while linking job files")
+                    continue
+                jobs.append(self.chopper.createJob(profile, filename))
+
+        for job in jobs:
+            job.ioTime = ioTime
             try:
                 DecoderQueue.getSharedInstance().put(job)
             except Full:
@@ -127,6 +176,12 @@ class AudioWriter(object):
 
         self._scheduleNextSwitch()
 
+    def _getJobFileName(self, profile, file):
+        return "openwebrx-audiochopper-{pid}-{timestamp}.wav".format(
+            pid=id(profile),
+            timestamp=file.getTimestamp().strftime(profile.getFileTimestampFormat()),
+        )
+
     def start(self):
         if self.wavefile is not None:
             logger.warning("wavefile is not none on startup, sequencing problem?")
@@ -135,7 +190,9 @@ class AudioWriter(object):
 
     def write(self, data):
         with self.switchingLock:
+            start = time.perf_counter()
             self.wavefile.writeframes(data)
+            self.ioTime += time.perf_counter() - start
 
     def stop(self):
         self.cancelTimer()
@@ -1,6 +1,9 @@
 from owrx.modes import Modes, DigitalMode
 from datetime import datetime, timezone
 from owrx.config import Config
+from owrx.watcher import FileWatcher
+from bisect import bisect_left, bisect_right
+import threading
 import json
 import os
 
@@ -74,6 +77,55 @@ class Band(object):
         return [e for e in self.frequencies if low <= e["frequency"] <= hi]
 
 
+class BandIndex(object):
+    """
+    Bands split into elementary intervals between all band edges, each listing the bands that cover it, plus all
+    dial frequencies sorted by frequency. Lookups bisect these, and return results in bandplan order.
+    """
+    def __init__(self, bands: list):
+        self.bands = bands
+        self.edges = sorted({e for b in bands for e in b.getBounds()})
+        # bands covering exactly an edge, and bands covering the open interval before an edge
+        self.atEdge = [tuple(i for i, b in enumerate(bands) if b.inBand(e)) for e in self.edges]
+        self.beforeEdge = [
+            tuple(i for i, b in enumerate(bands) if b.lower_bound <= self.edges[k - 1] and b.upper_bound >= self.edges[k])
+            if 0 < k < len(self.edges) else ()
+            for k in range(len(self.edges) + 1)
+        ]
+        dials = sorted(
+            (f["frequency"], i, j) for i, b in enumerate(bands) for j, f in enumerate(b.frequencies)
+        )
+        self.dialFrequencies = [f for f, _, _ in dials]
+        self.dials = [(i, j) for _, i, j in dials]
+
+    def findBands(self, freq) -> list:
+        k = bisect_right(self.edges, freq)
+        if k > 0 and self.edges[k - 1] == freq:
+            indices = self.atEdge[k - 1]
+        else:
+            indices = self.beforeEdge[k]
+        return [self.bands[i] for i in indices]
+
+    def findBandsInRange(self, low_freq, high_freq) -> list:
+        # same as Band.inRange(): bands overlapping the open interval between low_freq and high_freq
+        if low_freq >= high_freq:
+            return [b for b in self.bands if b.inRange(low_freq, high_freq)]
+        first = bisect_right(self.edges, low_freq)
+        last = bisect_left(self.edges, high_freq)
+        indices = set()
+        for k in range(first, last + 1):
+            indices.update(self.beforeEdge[k])
+        for k in range(first, last):
+            indices.update(self.atEdge[k])
+        return [self.bands[i] for i in sorted(indices)]
+
+    def collectDialFrequencies(self, range) -> list:
+        (low, hi) = range
+        first = bisect_left(self.dialFrequencies, low)
+        last = bisect_right(self.dialFrequencies, hi)
+        return [self.bands[i].frequencies[j] for i, j in sorted(self.dials[first:last])]
+
+
 class Bandplan(object):
     sharedInstance = None
 
@@ -85,20 +137,47 @@ class Bandplan(object):
 
     def __init__(self):
         self.bands = []
+        self.index = BandIndex([])
         self.file_modified = None
         self.fileList = ["/etc/openwebrx/bands{0}.json", "bands{0}.json"]
+        # files are only checked after the watcher has seen a change
+        self.changed = True
+        self.watch = None
+        self.lock = threading.Lock()
+        # bumped whenever the bands are reloaded
+        self.version = 0
         Config().get().wireProperty("bandplan_region", self._updateRegion)
 
     def _updateRegion(self, region):
-        # Make sure band plan is refreshed the next time it is queried
+        # Watch the files for the new region, and make sure band plan
+        # is refreshed the next time it is queried
+        if self.watch is not None:
+            self.watch.cancel()
+        self.watch = FileWatcher.getSharedInstance().watch(
+            [self._getRegionFile(file) for file in self.fileList], self._onFileChange
+        )
         self.file_modified = None
+        self.changed = True
+
+    def _onFileChange(self):
+        self.changed = True
 
     def _refresh(self):
-        modified = self._getFileModifiedTimestamp()
-        if self.file_modified is None or modified > self.file_modified:
-            logger.debug("reloading bands from disk due to file modification")
-            self.bands = self._loadBands()
-            self.file_modified = modified
+        if not self.changed:
+            return
+        with self.lock:
+            self.changed = False
+            modified = self._getFileModifiedTimestamp()
+            if self.file_modified is None or modified > self.file_modified:
+                logger.debug("reloading bands from disk due to file modification")
+                self.bands = self._loadBands()
+                self.index = BandIndex(self.bands)
+                self.file_modified = modified
+                self.version += 1
+
+    def getVersion(self):
+        self._refresh()
+        return self.version
 
     def _getRegionFile(self, file):
         region = Config.get()["bandplan_region"]
@@ -135,11 +214,11 @@ class Bandplan(object):
 
     def findBandsInRange(self, low_freq, high_freq):
         self._refresh()
-        return [band for band in self.bands if band.inRange(low_freq, high_freq)]
+        return self.index.findBandsInRange(low_freq, high_freq)
 
     def findBands(self, freq):
         self._refresh()
-        return [band for band in self.bands if band.inBand(freq)]
+        return self.index.findBands(freq)
 
     def findBand(self, freq):
         bands = self.findBands(freq)
@@ -150,4 +229,4 @@ class Bandplan(object):
 
     def collectDialFrequencies(self, range):
         self._refresh()
-        return [e for b in self.bands for e in b.getDialFrequencies(range)]
+        return self.index.collectDialFrequencies(range)
@@ -1,6 +1,9 @@
 from datetime import datetime, timezone
 from owrx.config.core import CoreConfig
 from owrx.config import Config
+from owrx.watcher import FileWatcher
+from bisect import bisect_left, bisect_right
+import threading
 import json
 import os.path
 import os
@@ -88,7 +91,15 @@ class Bookmarks(object):
     def __init__(self):
         self.file_modified = None
         self.bookmarks = []
+        # bookmarks sorted by frequency, rebuilt after changes
+        self.index = None
         self.subscriptions = []
+        # files are only checked after the watcher has seen a change
+        self.changed = True
+        self.watch = None
+        self.lock = threading.Lock()
+        # bumped whenever bookmarks are reloaded or edited
+        self.version = 0
         # Find all known bookmark files
         self.fileList = self._getBookmarkFiles()
         # Subscribe to region and country changes
@@ -97,11 +108,21 @@ class Bookmarks(object):
         pm.wireProperty("bandplan_region", self._updateLocation)
 
     def _updateLocation(self, region_or_country):
-        # Refresh the list of known bookmark files
-        self.fileList = self._getBookmarkFiles()
+        # Watch the bookmark folders for the new location
+        if self.watch is not None:
+            self.watch.cancel()
+        self.watch = FileWatcher.getSharedInstance().watch(
+            self._getBookmarkDirectories() + [Bookmarks._getMainBookmarkFile()], self._onFileChange
+        )
+        self._onFileChange()
         # Make sure bookmarks are refreshed the next time they are queried
         self.file_modified = None
 
+    def _onFileChange(self):
+        # Refresh the list of known bookmark files
+        self.fileList = self._getBookmarkFiles()
+        self.changed = True
+
     def _listJsonFiles(self, path: str):
         try:
             # Return list of all .json files
@@ -113,30 +134,53 @@ class Bookmarks(object):
         # Something happened
         return []
 
-    def _getBookmarkFiles(self):
-        # Bookmarks added later override ones added earlier !
+    def _getBookmarkDirectories(self):
         pm = Config().get()
         # 1) General default bookmark files
-        result = self._listJsonFiles(Bookmarks.MAIN_DIR)
+        result = [ Bookmarks.MAIN_DIR ]
         # 2) Region-specific bookmark files
         region = pm["bandplan_region"]
         if region > 0:
-            result += self._listJsonFiles("{0}/r{1}".format(Bookmarks.MAIN_DIR, region))
+            result += [ "{0}/r{1}".format(Bookmarks.MAIN_DIR, region) ]
         # 3) Country-specific bookmark files
         country = pm["receiver_country"].lower()
         if country != "":
-            result += self._listJsonFiles("{0}/{1}".format(Bookmarks.MAIN_DIR, country))
+            result += [ "{0}/{1}".format(Bookmarks.MAIN_DIR, country) ]
+        return result
+
+    def _getBookmarkFiles(self):
+        # Bookmarks added later override ones added earlier !
+        result = []
+        for path in self._getBookmarkDirectories():
+            result += self._listJsonFiles(path)
         # 4) Main bookmark file editable by admin
         result += [ Bookmarks._getMainBookmarkFile() ]
         # Return the final list of bookmark files
         return result
 
     def _refresh(self):
-        modified = self._getFileModifiedTimestamp()
-        if self.file_modified is None or modified > self.file_modified:
-            logger.debug("reloading bookmarks from disk due to file modification")
-            self.bookmarks = self._loadBookmarks()
-            self.file_modified = modified
+        if not self.changed:
+            return
+        with self.lock:
+            self.changed = False
+            modified = self._getFileModifiedTimestamp()
+            if self.file_modified is None or modified > self.file_modified:
+                logger.debug("reloading bookmarks from disk due to file modification")
+                self.bookmarks = self._loadBookmarks()
+                self.index = None
+                self.file_modified = modified
+                self.version += 1
+
+    def getVersion(self):
+        self._refresh()
+        return self.version
+
+    def _getIndex(self):
+        index = self.index
+        if index is None:
+            bookmarks = sorted(self.bookmarks, key=lambda b: b.getFrequency())
+            index = self.index = ([b.getFrequency() for b in bookmarks], bookmarks)
+        return index
 
     def _getFileModifiedTimestamp(self):
         timestamp = 0
@@ -181,7 +225,8 @@ class Bookmarks(object):
             return self.bookmarks
         else:
             (lo, hi) = range
-            return [b for b in self.bookmarks if lo <= b.getFrequency() <= hi]
+            (frequencies, bookmarks) = self._getIndex()
+            return bookmarks[bisect_left(frequencies, lo):bisect_right(frequencies, hi)]
 
     @staticmethod
     def _getMainBookmarkFile():
@@ -198,15 +243,22 @@ class Bookmarks(object):
         with open(Bookmarks._getMainBookmarkFile(), "w") as file:
             file.write(jsonContent)
         self.file_modified = self._getFileModifiedTimestamp()
+        # Bookmarks may have been edited in place
+        self.index = None
+        self.version += 1
 
     def addBookmark(self, bookmark: Bookmark):
         self.bookmarks.append(bookmark)
+        self.index = None
+        self.version += 1
         self.notifySubscriptions(bookmark)
 
     def removeBookmark(self, bookmark: Bookmark):
         if bookmark not in self.bookmarks:
             return
         self.bookmarks.remove(bookmark)
+        self.index = None
+        self.version += 1
         self.notifySubscriptions(bookmark)
 
     def notifySubscriptions(self, bookmark: Bookmark):
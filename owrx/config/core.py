@@ -18,6 +18,8 @@ class CoreConfig(object):
         "web": {
             "port": 8073,
             "ipv6": True,
+            # "threaded" runs one thread per connection, "asyncio" serves connections from an event loop
+            "server": "threaded",
             # won't work this way because values must be strings, but this is effectively the way it behaves.
             #"bind_address": None,
         },
@@ -70,6 +72,9 @@ class CoreConfig(object):
         self.web_ipv6 = config.getboolean("web", "ipv6")
         self.web_bind_address = config.get("web", "bind_address", fallback=None)
         self.web_trusted_proxies = config.get("web", "trusted_proxies", fallback=None)
+        self.web_server = config.get("web", "server")
+        if self.web_server not in ["threaded", "asyncio"]:
+            raise ConfigError("server", "unknown web server type: {0}".format(self.web_server))
         self.aprs_symbols_path = config.get("aprs", "symbols_path")
         self.temperature_sensor = config.get("core", "temperature_sensor")
 
@@ -95,6 +100,9 @@ class CoreConfig(object):
     def get_web_bind_address(self) -> Optional[str]:
         return self.web_bind_address
 
+    def get_web_server(self) -> str:
+        return self.web_server
+
     def get_web_trusted_proxies(self) -> Optional[List[str]]:
         return self.web_trusted_proxies
 
@@ -382,6 +382,9 @@ defaultConfig = PropertyLayer(
     keep_files=20,
     decoding_queue_workers=2,
     decoding_queue_length=10,
+    decoding_in_memory=False,
+    cpu_realtime_cores="",
+    cpu_batch_cores="",
     wsjt_decoding_depth=3,
     wsjt_decoding_depths=PropertyLayer(jt65=1),
     fst4_enabled_intervals=[15, 30],
@@ -391,6 +394,7 @@ defaultConfig = PropertyLayer(
     js8_decoding_depth=3,
     services_enabled=False,
     services_decoders=["ft8", "ft4", "wspr", "packet"],
+    services_channelizer=False,
     aprs_callsign="N0CALL",
     aprs_igate_enabled=False,
     aprs_igate_legacy=False,
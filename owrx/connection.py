@@ -4,19 +4,22 @@ from owrx.cpu import CpuUsageThread
 from owrx.sdr import SdrService
 from owrx.source import SdrSourceState, SdrClientClass, SdrSourceEventClient
 from owrx.client import ClientRegistry, TooManyClientsException, BannedClientException
-from owrx.feature import FeatureDetector
+from owrx.feature import FeatureDetector, FeatureCache
 from owrx.version import openwebrx_version
 from owrx.bands import Bandplan
 from owrx.bookmarks import Bookmarks
 from owrx.web.repeaters import Repeaters
 from owrx.web.eibi import EIBI
-from owrx.map import Map
+from owrx.map import Map, MapViewport
 from owrx.property import PropertyStack, PropertyDeleted
 from owrx.modes import Modes, DigitalMode
 from owrx.config import Config
 from owrx.waterfall import WaterfallOptions
-from owrx.websocket import Handler
-from queue import Queue, Full, Empty
+from owrx.websocket import Handler, WebSocketFrame
+from owrx.payload import PayloadCache
+from owrx.outbox import Outbox, OutboxClosed
+from queue import Full
+from functools import partial
 from abc import ABCMeta, abstractmethod
 import json
 import threading
@@ -27,60 +30,35 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-PoisonPill = object()
-
 
 class Client(Handler, metaclass=ABCMeta):
     def __init__(self, conn):
         self.conn = conn
-        self.multithreadingQueue = Queue(100)
-
-        def mp_passthru():
-            run = True
-            while run:
-                try:
-                    data = self.multithreadingQueue.get()
-                    if data is PoisonPill:
-                        run = False
-                    else:
-                        self.send(data)
-                    self.multithreadingQueue.task_done()
-                except (EOFError, OSError, ValueError):
-                    run = False
-                except Exception:
-                    logger.exception("Exception on client multithreading queue")
-
-            # unset the queue object to free shared memory file descriptors
-            self.multithreadingQueue = None
-
-        threading.Thread(target=mp_passthru, name="connection_mp_passthru").start()
+        # sent by the shared dispatcher pool instead of a thread per client. the pool never waits for the client;
+        # the outbox is parked until the connection has written its pending data.
+        self.multithreadingQueue = Outbox(100, partial(self.send, block=False), conn.whenWritable)
 
-    def send(self, data):
+    def send(self, data, block: bool = True):
         try:
-            self.conn.send(data)
+            self.conn.send(data, block)
         except IOError:
             logger.exception("error in Client::send()")
             self.close(error=True)
 
     def close(self, error: bool = False):
-        if self.multithreadingQueue is not None:
-            while True:
-                try:
-                    self.multithreadingQueue.get(block=False)
-                except Empty:
-                    break
-            try:
-                self.multithreadingQueue.put(PoisonPill, block=False)
-            except Full:
-                # this shouldn't happen, we just emptied the queue, but it's not worth risking the exception
-                logger.exception("impossible queue state: Full after Empty")
+        queue = self.multithreadingQueue
+        if queue is not None:
+            queue.close()
         self.conn.close(socketError=error)
 
     def mp_send(self, data):
-        if self.multithreadingQueue is None:
+        queue = self.multithreadingQueue
+        if queue is None:
             return
         try:
-            self.multithreadingQueue.put(data, block=False)
+            queue.put(data)
+        except OutboxClosed:
+            pass
         except Full:
             self.close(error=True)
 
@@ -99,17 +77,12 @@ class OpenWebRxClient(Client, metaclass=ABCMeta):
     def __init__(self, conn):
         super().__init__(conn)
 
-        receiver_details = ReceiverDetails()
-
-        def send_receiver_info(*args):
-            receiver_info = receiver_details.__dict__()
-            self.write_receiver_details(receiver_info)
+        self._detailsSubscription = ReceiverDetails.getSharedInstance().wire(self.write_receiver_details)
+        self.write_receiver_details()
 
-        self._detailsSubscription = receiver_details.wire(send_receiver_info)
-        send_receiver_info()
-
-    def write_receiver_details(self, details):
-        self.send({"type": "receiver_details", "value": details})
+    def write_receiver_details(self, *args):
+        details = ReceiverDetails.getSharedInstance()
+        self.send(PayloadCache.getSharedInstance().get("receiver_details", details.__dict__, version=details.getVersion()))
 
     def close(self, error: bool = False):
         self._detailsSubscription.cancel()
@@ -186,11 +159,8 @@ class OpenWebRxReceiverClient(OpenWebRxClient, SdrSourceEventClient):
 
         self.setSdr()
 
-        features = FeatureDetector().feature_availability()
-        self.write_features(features)
-
-        modes = Modes.getAvailableClientModes()
-        self.write_modes(modes)
+        self.write_features()
+        self.write_modes()
 
         self.configSubs.append(SdrService.getActiveSources().wire(self._onSdrDeviceChanges))
         self.configSubs.append(SdrService.getAvailableProfiles().wire(self._sendProfiles))
@@ -221,37 +191,22 @@ class OpenWebRxReceiverClient(OpenWebRxClient, SdrSourceEventClient):
                 config["sdr_id"] = self.sdr.getId()
             self.write_config(config)
 
-        def sendBookmarks(*args):
-            cf = configProps["center_freq"]
-            srh = configProps["samp_rate"] / 2
-            dial_frequencies = []
-            bookmarks = []
-            if "center_freq" in configProps and "samp_rate" in configProps:
-                frequencyRange = (cf - srh, cf + srh)
-                dial_frequencies = Bandplan.getSharedInstance().collectDialFrequencies(frequencyRange)
-                bookmarks = [b.__dict__() for b in Bookmarks.getSharedInstance().getBookmarks(frequencyRange)]
-                # Search EIBI schedule for bookmarks, if enabled
-                range = self.stack["eibi_bookmarks_range"]
-                if range > 0:
-                    bookmarks += [b.__dict__() for b in EIBI.getSharedInstance().currentBookmarks(frequencyRange, rangeKm=range)]
-                # Search RepeaterBook for bookmarks, if enabled
-                range = self.stack["repeater_range"]
-                if range > 0:
-                    bookmarks += [b.__dict__() for b in Repeaters.getSharedInstance().getBookmarks(frequencyRange, rangeKm=range)]
-            self.write_dial_frequencies(dial_frequencies)
-            self.write_bookmarks(bookmarks)
-
-        def sendBands(*args):
+        def getFrequencyRange():
             if "center_freq" in configProps and "samp_rate" in configProps:
                 cf = configProps["center_freq"]
                 srh = configProps["samp_rate"] / 2
-                bands = Bandplan.getSharedInstance().findBandsInRange(cf - srh, cf + srh)
-                self.write_bands([{
-                    "name"       : x.getName(),
-                    "low_bound"  : x.getBounds()[0],
-                    "high_bound" : x.getBounds()[1],
-                    "tags"       : x.getTags()
-                } for x in bands])
+                return (cf - srh, cf + srh)
+            return None
+
+        def sendBookmarks(*args):
+            frequencyRange = getFrequencyRange()
+            self.write_dial_frequencies(frequencyRange)
+            self.write_bookmarks(frequencyRange)
+
+        def sendBands(*args):
+            frequencyRange = getFrequencyRange()
+            if frequencyRange is not None:
+                self.write_bands(frequencyRange)
 
         def updateBookmarkSubscription(*args):
             if self.bookmarkSub is not None:
@@ -313,8 +268,7 @@ class OpenWebRxReceiverClient(OpenWebRxClient, SdrSourceEventClient):
             self.setSdr()
 
     def _sendProfiles(self, *args):
-        profiles = [{"id": pid, "name": name} for pid, name in SdrService.getAvailableProfileNames().items()]
-        self.write_profiles(profiles)
+        self.write_profiles(SdrService.getAvailableProfileNames())
 
     def handleTextMessage(self, conn, message):
         try:
@@ -472,8 +426,8 @@ class OpenWebRxReceiverClient(OpenWebRxClient, SdrSourceEventClient):
                 self.dsp.setProperties(self.connectionProperties)
         return self.dsp
 
-    def write_spectrum_data(self, data):
-        self.mp_send(bytes([0x01]) + data)
+    def write_spectrum_frame(self, frame: WebSocketFrame):
+        self.mp_send(frame)
 
     def write_dsp_data(self, data):
         self.send(bytes([0x02]) + data)
@@ -502,10 +456,10 @@ class OpenWebRxReceiverClient(OpenWebRxClient, SdrSourceEventClient):
         self.mp_send({"type": "clients", "value": clients})
 
     def write_secondary_fft(self, data):
-        self.send(bytes([0x03]) + data)
+        self.mp_send(bytes([0x03]) + data)
 
     def write_secondary_demod(self, message):
-        self.send({"type": "secondary_demod", "value": message})
+        self.mp_send({"type": "secondary_demod", "value": message})
 
     def write_secondary_dsp_config(self, cfg):
         self.send({"type": "secondary_config", "value": cfg})
@@ -513,23 +467,79 @@ class OpenWebRxReceiverClient(OpenWebRxClient, SdrSourceEventClient):
     def write_config(self, cfg):
         self.send({"type": "config", "value": cfg})
 
-    def write_profiles(self, profiles):
-        self.send({"type": "profiles", "value": profiles})
-
-    def write_features(self, features):
-        self.send({"type": "features", "value": features})
+    def write_profiles(self, names: dict):
+        # the list is cheap to collect, but not to encode, so it serves as its own version
+        self.send(PayloadCache.getSharedInstance().get(
+            "profiles",
+            lambda: [{"id": pid, "name": name} for pid, name in names.items()],
+            key=tuple(names.items()),
+        ))
+
+    def write_features(self):
+        self.send(PayloadCache.getSharedInstance().get(
+            "features",
+            FeatureDetector().feature_availability,
+            version=FeatureCache.getSharedInstance().getVersion(),
+        ))
 
     def write_metadata(self, metadata):
         self.send({"type": "metadata", "value": metadata})
 
-    def write_dial_frequencies(self, frequencies):
-        self.send({"type": "dial_frequencies", "value": frequencies})
-
-    def write_bookmarks(self, bookmarks):
-        self.send({"type": "bookmarks", "value": bookmarks})
-
-    def write_bands(self, bands):
-        self.send({"type": "bands", "value": bands})
+    def write_dial_frequencies(self, frequencyRange: tuple = None):
+        bandplan = Bandplan.getSharedInstance()
+
+        def build():
+            if frequencyRange is None:
+                return []
+            return bandplan.collectDialFrequencies(frequencyRange)
+
+        self.send(PayloadCache.getSharedInstance().get(
+            "dial_frequencies", build, key=frequencyRange, version=bandplan.getVersion()
+        ))
+
+    def write_bookmarks(self, frequencyRange: tuple = None):
+        eibiRange = self.stack["eibi_bookmarks_range"]
+        repeaterRange = self.stack["repeater_range"]
+        gps = self.stack["receiver_gps"]
+
+        def build():
+            if frequencyRange is None:
+                return []
+            bookmarks = [b.__dict__() for b in Bookmarks.getSharedInstance().getBookmarks(frequencyRange)]
+            # Search EIBI schedule for bookmarks, if enabled
+            if eibiRange > 0:
+                bookmarks += [b.__dict__() for b in EIBI.getSharedInstance().currentBookmarks(frequencyRange, rangeKm=eibiRange)]
+            # Search RepeaterBook for bookmarks, if enabled
+            if repeaterRange > 0:
+                bookmarks += [b.__dict__() for b in Repeaters.getSharedInstance().getBookmarks(frequencyRange, rangeKm=repeaterRange)]
+            return bookmarks
+
+        version = (
+            Bookmarks.getSharedInstance().getVersion(),
+            EIBI.getSharedInstance().getVersion() if eibiRange > 0 else None,
+            Repeaters.getSharedInstance().getVersion() if repeaterRange > 0 else None,
+            # the EIBI schedule changes by the minute
+            int(time.time() // 60) if eibiRange > 0 else None,
+        )
+        self.send(PayloadCache.getSharedInstance().get(
+            "bookmarks",
+            build,
+            key=(frequencyRange, eibiRange, repeaterRange, gps["lat"], gps["lon"]),
+            version=version,
+        ))
+
+    def write_bands(self, frequencyRange: tuple):
+        bandplan = Bandplan.getSharedInstance()
+
+        def build():
+            return [{
+                "name"       : x.getName(),
+                "low_bound"  : x.getBounds()[0],
+                "high_bound" : x.getBounds()[1],
+                "tags"       : x.getTags()
+            } for x in bandplan.findBandsInRange(*frequencyRange)]
+
+        self.send(PayloadCache.getSharedInstance().get("bands", build, key=frequencyRange, version=bandplan.getVersion()))
 
     def write_log_message(self, message):
         self.send({"type": "log_message", "value": message})
@@ -551,7 +561,7 @@ class OpenWebRxReceiverClient(OpenWebRxClient, SdrSourceEventClient):
             "color": color
         })
 
-    def write_modes(self, modes):
+    def write_modes(self):
         def to_json(m):
             res = {
                 "modulation": m.modulation,
@@ -569,11 +579,15 @@ class OpenWebRxReceiverClient(OpenWebRxClient, SdrSourceEventClient):
                 res["secondaryFft"] = m.secondaryFft
             return res
 
-        self.send({"type": "modes", "value": [to_json(m) for m in modes]})
+        self.send(PayloadCache.getSharedInstance().get(
+            "modes",
+            lambda: [to_json(m) for m in Modes.getAvailableClientModes()],
+            version=FeatureCache.getSharedInstance().getVersion(),
+        ))
 
 
 class MapConnection(OpenWebRxClient):
-    def __init__(self, conn):
+    def __init__(self, conn, viewport: bool = False):
         super().__init__(conn)
 
         pm = Config.get()
@@ -597,10 +611,24 @@ class MapConnection(OpenWebRxClient):
 
         self.write_config(filtered_config.__dict__())
 
-        Map.getSharedInstance().addClient(self)
+        # clients announcing viewport support will subscribe to the visible area before receiving any positions
+        Map.getSharedInstance().addClient(self, False if viewport else None)
 
     def handleTextMessage(self, conn, message):
-        pass
+        try:
+            message = json.loads(message)
+        except json.JSONDecodeError:
+            logger.warning("message is not json: {0}".format(message))
+            return
+        if "type" in message and message["type"] == "viewport":
+            try:
+                viewport = MapViewport.fromJson(message["value"])
+            except (ValueError, KeyError, TypeError):
+                logger.warning("invalid viewport: {0}".format(message))
+                return
+            Map.getSharedInstance().setViewport(self, viewport)
+        else:
+            logger.warning("received message without type: {0}".format(message))
 
     def close(self, error: bool = False):
         Map.getSharedInstance().removeClient(self)
@@ -610,8 +638,8 @@ class MapConnection(OpenWebRxClient):
     def write_config(self, cfg):
         self.send({"type": "config", "value": cfg})
 
-    def write_update(self, update):
-        self.mp_send({"type": "update", "value": update})
+    def write_update(self, update, version: int = None):
+        self.mp_send({"type": "update", "value": update, "version": version})
 
 
 class HandshakeMessageHandler(Handler):
@@ -627,11 +655,13 @@ class HandshakeMessageHandler(Handler):
             logger.debug("client connection initialized")
 
             client = None
+            options = {}
             if "type" in handshake:
                 if handshake["type"] == "receiver":
                     client = OpenWebRxReceiverClient
                 elif handshake["type"] == "map":
                     client = MapConnection
+                    options["viewport"] = handshake.get("viewport") == "1"
                 else:
                     logger.warning("invalid connection type: %s", handshake["type"])
 
@@ -639,7 +669,7 @@ class HandshakeMessageHandler(Handler):
                 logger.debug("handshake complete, handing off to %s", client.__name__)
                 # hand off all further communication to the correspondig connection
                 conn.send("CLIENT DE SERVER server=openwebrx version={version}".format(version=openwebrx_version))
-                conn.setMessageHandler(client(conn))
+                conn.setMessageHandler(client(conn, **options))
             else:
                 logger.warning('invalid handshake received')
         else:
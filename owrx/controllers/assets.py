@@ -1,37 +1,245 @@
 from . import Controller
 from owrx.config.core import CoreConfig
+from owrx.watcher import FileWatcher
 from datetime import datetime, timezone
+from collections import OrderedDict
 import mimetypes
 import os
 import pkg_resources
 from abc import ABCMeta, abstractmethod
+import threading
+import hashlib
 import gzip
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def zipable(content_type):
+    types = ["application/json", "application/javascript", "text/javascript", "text/css", "text/html", "image/svg+xml"]
+    return content_type in types
+
+
+class Asset(object):
+    """
+    Immutable response body, with its compressed variants and a content hash, so that it can be served over and
+    over without reading or compressing anything.
+    """
+    def __init__(self, content: bytes, content_type: str, modified: datetime, brotliQuality: int = 11):
+        self.content = content
+        self.content_type = content_type
+        self.modified = modified
+        self.hash = hashlib.sha256(content).hexdigest()[:32]
+        # encoding -> body. variants are only kept if they actually save something.
+        self.variants = {}
+        if zipable(content_type):
+            if brotli is not None:
+                self._addVariant("br", brotli.compress(content, quality=brotliQuality))
+            self._addVariant("gzip", gzip.compress(content, compresslevel=9))
+
+    def _addVariant(self, encoding: str, content: bytes):
+        if len(content) < len(self.content):
+            self.variants[encoding] = content
+
+    def getVariant(self, accepted: list):
+        """
+        Returns the encoding (None for identity) and body to send to a client accepting the given encodings.
+        """
+        for encoding in ["br", "gzip"]:
+            if encoding in accepted and encoding in self.variants:
+                return encoding, self.variants[encoding]
+        return None, self.content
+
+    def getETag(self, encoding: str = None) -> str:
+        # every representation needs a different strong etag
+        if encoding is None:
+            return '"{0}"'.format(self.hash)
+        return '"{0}-{1}"'.format(self.hash, encoding)
+
+    def getSize(self) -> int:
+        return len(self.content) + sum(len(v) for v in self.variants.values())
+
+
+class AssetCache(object):
+    """
+    Keeps compiled bundles and static files in memory, together with their compressed variants.
+
+    Bundles are built in the background on startup and rebuilt when one of their source files changes. Static files
+    are built on first use and revalidated against their size and modification time on every request.
+    """
+    sharedInstance = None
+    creationLock = threading.Lock()
+
+    # larger files are served directly, since they are unlikely to be requested often
+    maxFileSize = 1024 * 1024
+    # total size of the cached files including their compressed variants. the least recently used files are
+    # dropped beyond that; the web interface itself needs less than half of it.
+    maxCacheSize = 8 * 1024 * 1024
+
+    @staticmethod
+    def getSharedInstance():
+        with AssetCache.creationLock:
+            if AssetCache.sharedInstance is None:
+                AssetCache.sharedInstance = AssetCache()
+        return AssetCache.sharedInstance
+
+    def __init__(self):
+        self.bundles = {}
+        # path -> (signature, asset), in order of use
+        self.files = OrderedDict()
+        self.filesSize = 0
+        self.watches = {}
+        self.lock = threading.Lock()
+        self.bundleLock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._buildBundles, name="AssetCache", daemon=True).start()
+
+    def _buildBundles(self):
+        for profileName in CompiledAssetsController.profiles:
+            try:
+                self.getBundle(profileName)
+            except OSError:
+                logger.exception("could not build bundle %s", profileName)
+
+    def getBundle(self, profileName: str) -> Asset:
+        if profileName in self.bundles:
+            return self.bundles[profileName]
+        # building takes a while, and requests arriving in the meantime should wait for the result
+        with self.bundleLock:
+            if profileName not in self.bundles:
+                self.bundles[profileName] = self._buildBundle(profileName)
+                if profileName not in self.watches:
+                    files = CompiledAssetsController.getFiles(profileName)
+                    self.watches[profileName] = FileWatcher.getSharedInstance().watch(
+                        files, lambda: self._rebuildBundle(profileName)
+                    )
+            return self.bundles[profileName]
+
+    def _buildBundle(self, profileName: str) -> Asset:
+        files = CompiledAssetsController.getFiles(profileName)
+        contents = []
+        modified = 0
+        for file in files:
+            with open(file, "rb") as f:
+                contents.append(f.read())
+            modified = max(modified, os.path.getmtime(file))
+        (content_type, encoding) = mimetypes.guess_type(profileName)
+        asset = Asset(b"\n".join(contents), content_type, datetime.fromtimestamp(modified, timezone.utc))
+        logger.debug("built bundle %s (%i bytes, variants: %s)", profileName, len(asset.content), list(asset.variants))
+        return asset
+
+    def _rebuildBundle(self, profileName: str):
+        logger.info("source files of %s have changed, rebuilding", profileName)
+        try:
+            asset = self._buildBundle(profileName)
+        except OSError:
+            # keep serving the current bundle until the next change
+            logger.exception("could not rebuild bundle %s", profileName)
+            return
+        with self.bundleLock:
+            self.bundles[profileName] = asset
+
+    def getFile(self, path: str, content_type: str):
+        """
+        Returns the cached asset for a file, or None if the file is too large to be cached.
+        Raises FileNotFoundError if the file does not exist.
+        """
+        st = os.stat(path)
+        signature = (st.st_mtime_ns, st.st_size)
+        with self.lock:
+            entry = self.files.get(path)
+            if entry is not None and entry[0] == signature:
+                self.files.move_to_end(path)
+                return entry[1]
+        if st.st_size > AssetCache.maxFileSize:
+            return None
+        with open(path, "rb") as f:
+            content = f.read()
+        # built on demand, so use a faster brotli setting
+        asset = Asset(content, content_type, datetime.fromtimestamp(st.st_mtime, timezone.utc), brotliQuality=9)
+        with self.lock:
+            self._removeFile(path)
+            self.files[path] = (signature, asset)
+            self.filesSize += asset.getSize()
+            while self.filesSize > AssetCache.maxCacheSize:
+                self._removeFile(next(iter(self.files)))
+        return asset
+
+    def _removeFile(self, path: str):
+        # must be called with the lock held
+        entry = self.files.pop(path, None)
+        if entry is not None:
+            self.filesSize -= entry[1].getSize()
+
+
 class GzipMixin(object):
-    def send_response(self, content, code=200, headers=None, content_type="text/html", *args, **kwargs):
-        if self.zipable(content_type) and "accept-encoding" in self.request.headers:
-            accepted = [s.strip().lower() for s in self.request.headers["accept-encoding"].split(",")]
-            if "gzip" in accepted:
-                if type(content) == str:
-                    content = content.encode()
-                content = self.gzip(content)
-                if headers is None:
-                    headers = {}
-                headers["Content-Encoding"] = "gzip"
+    def send_response(self, content, code=200, headers=None, content_type="text/html", *args, compress=True, **kwargs):
+        if compress and self.zipable(content_type) and "gzip" in self.getAcceptedEncodings():
+            if type(content) == str:
+                content = content.encode()
+            content = self.gzip(content)
+            if headers is None:
+                headers = {}
+            headers["Content-Encoding"] = "gzip"
         super().send_response(content, code, headers=headers, content_type=content_type, *args, **kwargs)
 
+    def getAcceptedEncodings(self):
+        if "accept-encoding" not in self.request.headers:
+            return []
+        accepted = []
+        for s in self.request.headers["accept-encoding"].split(","):
+            (encoding, *params) = [p.strip().lower() for p in s.split(";")]
+            # explicitly refused, i.e. "gzip;q=0"
+            if any(p.replace(" ", "") in ["q=0", "q=0.0", "q=0.00", "q=0.000"] for p in params):
+                continue
+            accepted.append(encoding)
+        return accepted
+
     def zipable(self, content_type):
-        types = ["application/json", "application/javascript", "text/javascript", "text/css", "text/html", "image/svg+xml"]
-        return content_type in types
+        return zipable(content_type)
 
     def gzip(self, content):
         return gzip.compress(content)
 
+    def serve_asset(self, asset: Asset, max_age=3600):
+        (encoding, content) = asset.getVariant(self.getAcceptedEncodings())
+        etag = asset.getETag(encoding)
+        headers = {"ETag": etag}
+        if asset.variants:
+            headers["Vary"] = "Accept-Encoding"
+        # If-None-Match takes precedence over If-Modified-Since
+        if "If-None-Match" in self.request.headers:
+            modified = not self.matchesETag(etag)
+        else:
+            modified = self.isModifiedSince(asset.modified)
+        if not modified:
+            self.send_response(
+                "", code=304, content_type=None, max_age=max_age, headers=headers, compress=False
+            )
+            return
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        self.send_response(
+            content,
+            content_type=asset.content_type,
+            last_modified=asset.modified,
+            max_age=max_age,
+            headers=headers,
+            compress=False,
+        )
+
+    def matchesETag(self, etag):
+        tags = [t.strip() for t in self.request.headers["If-None-Match"].split(",")]
+        # weak comparison, as required for If-None-Match
+        return any(t == "*" or t.replace("W/", "", 1) == etag for t in tags)
+
 
 class ModificationAwareController(Controller, metaclass=ABCMeta):
     @abstractmethod
@@ -40,21 +248,24 @@ class ModificationAwareController(Controller, metaclass=ABCMeta):
 
     def wasModified(self, file):
         try:
-            modified = self.getModified(file).replace(microsecond=0)
-
-            if modified is not None and "If-Modified-Since" in self.handler.headers:
-                client_modified = datetime.strptime(
-                    self.handler.headers["If-Modified-Since"], "%a, %d %b %Y %H:%M:%S %Z"
-                ).replace(tzinfo=timezone.utc)
-                if modified <= client_modified:
-                    return False
+            return self.isModifiedSince(self.getModified(file))
         except FileNotFoundError:
-            pass
-
+            return True
+
+    def isModifiedSince(self, modified):
+        if modified is not None and "If-Modified-Since" in self.handler.headers:
+            client_modified = datetime.strptime(
+                self.handler.headers["If-Modified-Since"], "%a, %d %b %Y %H:%M:%S %Z"
+            ).replace(tzinfo=timezone.utc)
+            if modified.replace(microsecond=0) <= client_modified:
+                return False
         return True
 
 
 class AssetsController(GzipMixin, ModificationAwareController, metaclass=ABCMeta):
+    # whether files are kept in the AssetCache. only suitable for a limited set of files that change rarely.
+    cacheable = False
+
     def getModified(self, file):
         return datetime.fromtimestamp(os.path.getmtime(self.getFilePath(file)), timezone.utc)
 
@@ -67,6 +278,15 @@ class AssetsController(GzipMixin, ModificationAwareController, metaclass=ABCMeta
 
     def serve_file(self, file, content_type=None):
         try:
+            if self.cacheable:
+                path = self.getFilePath(file)
+                if content_type is None:
+                    (content_type, encoding) = mimetypes.guess_type(path)
+                asset = AssetCache.getSharedInstance().getFile(path, content_type)
+                if asset is not None:
+                    self.serve_asset(asset)
+                    return
+
             modified = self.getModified(file)
 
             if not self.wasModified(file):
@@ -89,6 +309,8 @@ class AssetsController(GzipMixin, ModificationAwareController, metaclass=ABCMeta
 
 
 class OwrxAssetsController(AssetsController):
+    cacheable = True
+
     def getFilePath(self, file):
         mappedFiles = {
             "gfx/openwebrx-avatar.png": "receiver_avatar",
@@ -104,6 +326,8 @@ class OwrxAssetsController(AssetsController):
 
 
 class AprsSymbolsController(AssetsController):
+    cacheable = True
+
     def __init__(self, handler, request, options):
         path = CoreConfig().get_aprs_symbols_path()
         if not path.endswith("/"):
@@ -196,29 +420,23 @@ class CompiledAssetsController(GzipMixin, ModificationAwareController):
         ],
     }
 
+    @staticmethod
+    def getFiles(profileName):
+        return [pkg_resources.resource_filename("htdocs", f) for f in CompiledAssetsController.profiles[profileName]]
+
     def indexAction(self):
         profileName = self.request.matches.group(1)
         if profileName not in CompiledAssetsController.profiles:
             self.send_response("profile not found", code=404)
             return
 
-        files = CompiledAssetsController.profiles[profileName]
-        files = [pkg_resources.resource_filename("htdocs", f) for f in files]
-
-        modified = self.getModified(files)
-
-        if not self.wasModified(files):
-            self.send_response("", code=304)
+        try:
+            asset = AssetCache.getSharedInstance().getBundle(profileName)
+        except FileNotFoundError:
+            self.send_response("file not found", code=404)
             return
 
-        contents = [self.getContents(f) for f in files]
-
-        (content_type, encoding) = mimetypes.guess_type(profileName)
-        self.send_response("\n".join(contents), content_type=content_type, last_modified=modified, max_age=3600)
-
-    def getContents(self, file):
-        with open(file) as f:
-            return f.read()
+        self.serve_asset(asset)
 
     def getModified(self, files):
         modified = [os.path.getmtime(f) for f in files]
@@ -1,5 +1,9 @@
 from . import Controller
-from owrx.metrics import CounterMetric, DirectMetric, Metrics
+from owrx.controllers.admin import AuthorizationMixin
+from owrx.controllers.template import WebpageController
+from owrx.metrics import CounterMetric, DirectMetric, GaugeMetric, HistogramMetric, Metrics
+from owrx.profiler import SamplingProfiler
+from owrx.property import DispatchStatistics
 import json
 import re
 
@@ -14,19 +18,48 @@ class MetricsController(Controller):
         metrics = Metrics.getSharedInstance().getFlatMetrics()
 
         def prometheusFormat(key, metric):
+            key = re.sub('[^a-zA-Z0-9:_]', '_', key)
             value = metric.getValue()
             if isinstance(metric, CounterMetric):
-                key += "_total"
-                value = value["count"]
+                return ["# TYPE {key}_total counter".format(key=key), "{key}_total {value}".format(key=key, value=value["count"])]
+            elif isinstance(metric, GaugeMetric):
+                return ["# TYPE {key} gauge".format(key=key), "{key} {value}".format(key=key, value=value)]
+            elif isinstance(metric, HistogramMetric):
+                lines = ["# TYPE {key} histogram".format(key=key)]
+                lines += [
+                    '{key}_bucket{{le="{le}"}} {value}'.format(key=key, le=le, value=count)
+                    for le, count in value["buckets"].items()
+                ]
+                lines.append("{key}_sum {value}".format(key=key, value=value["sum"]))
+                lines.append("{key}_count {value}".format(key=key, value=value["count"]))
+                return lines
             elif isinstance(metric, DirectMetric):
-                pass
+                return ["{key} {value}".format(key=key, value=value)]
             else:
                 raise ValueError("Unexpected metric type for metric {}".format(repr(metric)))
 
-            return "{key} {value}".format(key=re.sub('[^a-zA-Z0-9:_]', '_', key), value=value)
-
-        data = ["# https://prometheus.io/docs/instrumenting/exposition_formats/"] + [
-            prometheusFormat(k, v) for k, v in metrics.items()
-        ]
+        data = ["# https://prometheus.io/docs/instrumenting/exposition_formats/"]
+        for k, v in metrics.items():
+            data += prometheusFormat(k, v)
 
         self.send_response("\n".join(data) + "\n", content_type="text/plain; version=0.0.4")
+
+
+class ProfilerController(AuthorizationMixin, WebpageController):
+    def indexAction(self):
+        try:
+            duration = min(float(self.request.query["duration"][0]), SamplingProfiler.maxDuration)
+        except (KeyError, ValueError):
+            duration = 5.0
+        try:
+            interval = max(float(self.request.query["interval"][0]), SamplingProfiler.minInterval)
+        except (KeyError, ValueError):
+            interval = 0.01
+        profile = SamplingProfiler(interval).run(duration)
+        self.send_response(profile.toCollapsed(), content_type="text/plain")
+
+
+class PropertyStatisticsController(AuthorizationMixin, WebpageController):
+    def indexAction(self):
+        data = json.dumps(DispatchStatistics.getSharedInstance().getStatistics())
+        self.send_response(data, content_type="application/json")
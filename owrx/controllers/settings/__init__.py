@@ -1,4 +1,5 @@
 from owrx.config import Config
+from owrx.property import PropertyTransaction
 from owrx.controllers.admin import AuthorizationMixin
 from owrx.controllers.template import WebpageController
 from owrx.controllers.clients import ClientController
@@ -140,7 +141,9 @@ class SettingsFormController(AuthorizationMixin, BreadcrumbMixin, WebpageControl
 
     def processData(self, data):
         config = self.getData()
-        self._applyConfigData(config, data)
+        # subscribers see all changes of the form at once
+        with PropertyTransaction():
+            self._applyConfigData(config, data)
 
     def store(self):
         Config.get().store()
@@ -21,5 +21,10 @@ class BackgroundDecodingController(SettingsFormController):
                     "Enable background decoding services",
                 ),
                 ServicesCheckboxInput("services_decoders", "Enabled services"),
+                CheckboxInput(
+                    "services_channelizer",
+                    "Use a shared channelizer for all services",
+                    infotext="Extracts all service channels from the SDR signal in a single pass. Requires numpy.",
+                ),
             ),
         ]
@@ -261,10 +261,34 @@ class DecodingSettingsController(SettingsFormController):
                     ]
                 )
             ),
+            Section(
+                "CPU usage",
+                TextInput(
+                    "cpu_realtime_cores",
+                    "Cores for realtime processing",
+                    infotext="CPU cores used by SDR devices, waterfalls and demodulators, such as 0-3 or 0,2. "
+                    + "Leave empty to use all cores. Applies to newly started processing only.",
+                ),
+                TextInput(
+                    "cpu_batch_cores",
+                    "Cores for background decoding",
+                    infotext="CPU cores used by the decoding queue and external decoders, such as 4-7. "
+                    + "Leave empty to use all cores. Applies to newly started processing only.",
+                ),
+            ),
             Section(
                 "WSJT decoders",
-                NumberInput("decoding_queue_workers", "Number of decoding workers"),
+                NumberInput(
+                    "decoding_queue_workers",
+                    "Number of decoding workers",
+                    infotext="Set to 0 to size the worker pool based on the number of CPUs and the system load",
+                ),
                 NumberInput("decoding_queue_length", "Maximum length of decoding job queue"),
+                CheckboxInput(
+                    "decoding_in_memory",
+                    "Keep audio for decoding in memory",
+                    infotext="Avoids writing temporary files to disk, useful for SD card based systems",
+                ),
                 NumberInput(
                     "wsjt_decoding_depth",
                     "Default WSJT decoding depth",
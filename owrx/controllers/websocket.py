@@ -1,5 +1,5 @@
 from . import Controller
-from owrx.websocket import WebSocketConnection
+from owrx.websocket import WebSocketConnection, AsyncWebSocketConnection
 from owrx.connection import HandshakeMessageHandler
 
 
@@ -8,3 +8,8 @@ class WebSocketController(Controller):
         conn = WebSocketConnection(self.handler, HandshakeMessageHandler())
         # enter read loop
         conn.handle()
+
+    async def handleAsync(self, reader, writer, executor=None):
+        conn = AsyncWebSocketConnection(self.handler, HandshakeMessageHandler(), reader, writer, executor)
+        # enter read loop
+        await conn.handle()
@@ -1,4 +1,5 @@
 from owrx.config.core import CoreConfig
+from owrx.metrics import Metrics, DirectMetric
 
 import threading
 import os.path
@@ -26,6 +27,9 @@ class CpuUsageThread(threading.Thread):
         self.doRun = True
         self.last_worktime = 0
         self.last_idletime = 0
+        # per-core (worktime, idletime) from the previous run, and the resulting usage
+        self.last_core_times = {}
+        self.core_usage = {}
 
         # Determine where to read CPU temperature from
         tempFile = CoreConfig().get_temperature_sensor()
@@ -68,6 +72,7 @@ class CpuUsageThread(threading.Thread):
         logger.debug("cpu usage thread starting up")
         while self.doRun:
             try:
+                self.update_core_usage()
                 cpu_usage = self.get_cpu_usage()
                 temperature = self.get_temperature()
                 (voltage, current, charge, charger) = self.get_battery()
@@ -129,6 +134,47 @@ class CpuUsageThread(threading.Thread):
             return 0
         return rate
 
+    def update_core_usage(self):
+        try:
+            with open("/proc/stat", "r") as f:
+                lines = [l for l in f if re.match(r"cpu\d+ ", l)]
+        except OSError:
+            return
+        usage = {}
+        for line in lines:
+            spl = line.split()
+            core = int(spl[0][3:])
+            worktime = int(spl[1]) + int(spl[2]) + int(spl[3])
+            idletime = int(spl[4])
+            if core in self.last_core_times:
+                (last_worktime, last_idletime) = self.last_core_times[core]
+                dworktime = worktime - last_worktime
+                didletime = idletime - last_idletime
+                total = dworktime + didletime
+                usage[core] = float(dworktime) / total if total > 0 else 0.0
+            self.last_core_times[core] = (worktime, idletime)
+        self.core_usage = usage
+        metrics = Metrics.getSharedInstance()
+        for core in usage:
+            name = "openwebrx.cpu.core{}.usage".format(core)
+            if not metrics.hasMetric(name):
+                metrics.addMetric(name, DirectMetric(self._getCoreUsageGetter(core)))
+
+    def _getCoreUsageGetter(self, core):
+        def getter():
+            # the shared instance changes whenever the thread is restarted
+            instance = CpuUsageThread.sharedInstance
+            if instance is None:
+                return 0
+            return instance.get_core_usage().get(core, 0)
+        return getter
+
+    def get_core_usage(self):
+        """
+        Returns the usage (0..1) of each cpu core, keyed by core number.
+        """
+        return self.core_usage
+
     def get_battery(self):
         voltage = 0.0
         current = 0.0
@@ -2,12 +2,23 @@ from owrx.config import Config
 from owrx.locator import Locator
 from owrx.property import PropertyFilter
 from owrx.property.filter import ByPropertyName
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 class ReceiverDetails(PropertyFilter):
+    sharedInstance = None
+    creationLock = threading.Lock()
+
+    @staticmethod
+    def getSharedInstance():
+        with ReceiverDetails.creationLock:
+            if ReceiverDetails.sharedInstance is None:
+                ReceiverDetails.sharedInstance = ReceiverDetails()
+        return ReceiverDetails.sharedInstance
+
     def __init__(self):
         super().__init__(
             Config.get(),
@@ -24,6 +35,15 @@ class ReceiverDetails(PropertyFilter):
                 "keep_files",
             )
         )
+        self.version = 0
+        # wired first, so that the version is bumped before any other subscriber is notified
+        self.wire(self._bumpVersion)
+
+    def _bumpVersion(self, changes):
+        self.version += 1
+
+    def getVersion(self):
+        return self.version
 
     def __dict__(self):
         receiver_info = super().__dict__()
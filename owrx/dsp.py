@@ -3,6 +3,7 @@ from owrx.property import PropertyStack, PropertyLayer, PropertyValidator, Prope
 from owrx.property.validators import OrValidator, RegexValidator, BoolValidator
 from owrx.modes import Modes, DigitalMode
 from owrx.rigcontrol import RigControl
+from owrx.affinity import CpuAffinity, CpuClass
 from csdr.chain import Chain
 from csdr.chain.demodulator import BaseDemodulatorChain, FixedIfSampleRateChain, FixedAudioRateChain, HdAudio, \
     SecondaryDemodulator, DialFrequencyReceiver, MetaProvider, SlotFilterChain, SecondarySelectorChain, \
@@ -11,10 +12,10 @@ from csdr.chain.selector import Selector, SecondarySelector
 from csdr.chain.clientaudio import ClientAudioChain
 from csdr.chain.fft import FftChain
 from csdr.chain.dummy import DummyDemodulator
+from csdr.module import unpickleMessages, producesMessages, MessageWriter, MessageSink
 from pycsdr.modules import Buffer, Writer
 from pycsdr.types import Format, AgcProfile
 from typing import Union, Optional
-from io import BytesIO
 from abc import ABC, abstractmethod
 import threading
 import re
@@ -64,6 +65,7 @@ class ClientDemodulatorChain(Chain):
         self.metaWriter = None
         self.secondaryFftWriter = None
         self.secondaryWriter = None
+        self.secondaryMessageWriter = None
         self.squelchLevel = -150
         self.secondarySelector = None
         self.secondaryFrequencyOffset = None
@@ -215,7 +217,7 @@ class ClientDemodulatorChain(Chain):
                 self.secondaryDemodulator.setReader(self.selectorBuffer.getReader())
             else:
                 self.secondaryDemodulator.setReader(self.audioBuffer.getReader())
-            self.secondaryDemodulator.setWriter(self.secondaryWriter)
+            self.secondaryDemodulator.setWriter(self._getSecondaryWriter())
 
         if (self.secondaryDemodulator is None or not self.secondaryDemodulator.isSecondaryFftShown()) and self.secondaryFftChain is not None:
             self.secondaryFftChain.stop()
@@ -347,7 +349,20 @@ class ClientDemodulatorChain(Chain):
             return
         self.secondaryWriter = writer
         if self.secondaryDemodulator is not None:
-            self.secondaryDemodulator.setWriter(writer)
+            self.secondaryDemodulator.setWriter(self._getSecondaryWriter())
+
+    def setSecondaryMessageWriter(self, writer: MessageWriter) -> None:
+        if writer is self.secondaryMessageWriter:
+            return
+        self.secondaryMessageWriter = writer
+        if self.secondaryDemodulator is not None:
+            self.secondaryDemodulator.setWriter(self._getSecondaryWriter())
+
+    def _getSecondaryWriter(self):
+        # decoders written in python pass their messages on directly, everything else goes through the buffer
+        if self.secondaryMessageWriter is not None and producesMessages(self.secondaryDemodulator):
+            return self.secondaryMessageWriter
+        return self.secondaryWriter
 
     def setSlotFilter(self, filter: int) -> None:
         if not isinstance(self.demodulator, SlotFilterChain):
@@ -583,6 +598,7 @@ class DspManager(SdrSourceEventClient, ClientDemodulatorSecondaryDspEventClient)
         buffer = Buffer(Format.CHAR)
         self.chain.setSecondaryWriter(buffer)
         self.wireOutput("secondary_demod", buffer)
+        self.chain.setSecondaryMessageWriter(MessageSink(self.handler.write_secondary_demod))
 
         self.startOnAvailable = False
 
@@ -879,7 +895,9 @@ class DspManager(SdrSourceEventClient, ClientDemodulatorSecondaryDspEventClient)
 
     def start(self):
         if self.sdrSource.isAvailable():
-            self.chain.setReader(self.sdrSource.getBuffer().getReader())
+            # native worker threads started by the chain inherit the realtime affinity
+            with CpuAffinity.getSharedInstance().scope(CpuClass.REALTIME):
+                self.chain.setReader(self.sdrSource.getBuffer().getReader())
         else:
             self.startOnAvailable = True
 
@@ -905,7 +923,8 @@ class DspManager(SdrSourceEventClient, ClientDemodulatorSecondaryDspEventClient)
 
         reader = buffer.getReader()
         self.readers[t] = reader
-        threading.Thread(target=self.chain.pump(reader.read, write), name="dsp_pump_{}".format(t)).start()
+        pump = CpuAffinity.getSharedInstance().wrap(self.chain.pump(reader.read, write), CpuClass.REALTIME)
+        threading.Thread(target=pump, name="dsp_pump_{}".format(t)).start()
 
     def _unpickle(self, callback):
         def unpickler(data):
@@ -918,12 +937,9 @@ class DspManager(SdrSourceEventClient, ClientDemodulatorSecondaryDspEventClient)
                     logger.debug("Unpickler: %s" % e)
                 return
 
-            io = BytesIO(b)
             try:
-                while True:
-                    callback(pickle.load(io))
-            except EOFError:
-                pass
+                for message in unpickleMessages(b):
+                    callback(message)
             except pickle.UnpicklingError:
                 callback(b.decode("ascii", errors="replace"))
 
@@ -960,7 +976,8 @@ class DspManager(SdrSourceEventClient, ClientDemodulatorSecondaryDspEventClient)
         if state is SdrSourceState.RUNNING:
             logger.debug("received STATE_RUNNING, attempting DspSource restart")
             if self.startOnAvailable:
-                self.chain.setReader(self.sdrSource.getBuffer().getReader())
+                with CpuAffinity.getSharedInstance().scope(CpuClass.REALTIME):
+                    self.chain.setReader(self.sdrSource.getBuffer().getReader())
                 self.startOnAvailable = False
         elif state is SdrSourceState.STOPPING:
             logger.debug("received STATE_STOPPING, shutting down DspSource")
@@ -4,7 +4,6 @@ from csdr.module import ThreadModule
 from pycsdr.types import Format
 from datetime import datetime
 import base64
-import pickle
 import os
 
 import logging
@@ -83,6 +82,9 @@ class FaxParser(DataRecorder, ThreadModule):
         self.lpm    = 0
         self.colors = None
 
+    def producesMessages(self) -> bool:
+        return True
+
     def run(self):
         logger.debug("%s starting..." % self.myName())
         # Run while there is input data
@@ -100,7 +102,7 @@ class FaxParser(DataRecorder, ThreadModule):
             # Keep processing while there is input to parse
             while out is not None:
                 if len(out)>0:
-                    self.writer.write(pickle.dumps(out))
+                    self.writeMessages([out])
                 out = self.process()
         # Done with whatever we are decoding
         logger.debug("%s exiting..." % self.myName())
@@ -31,21 +31,37 @@ class FeatureCache(object):
     def __init__(self):
         self.cache = {}
         self.cachetime = timedelta(hours=2)
+        # bumped whenever a result differs from the previous one, and when a result expires
+        self.version = 0
+
+    def _isExpired(self, entry, now):
+        if entry["valid_to"] >= now:
+            return False
+        if not entry["expired"]:
+            # once per entry, the result needs to be detected again anyway
+            entry["expired"] = True
+            self.version += 1
+        return True
 
     def has(self, feature):
         if feature not in self.cache:
             return False
-        now = datetime.now()
-        if self.cache[feature]["valid_to"] < now:
-            return False
-        return True
+        return not self._isExpired(self.cache[feature], datetime.now())
 
     def get(self, feature):
         return self.cache[feature]["value"]
 
     def set(self, feature, value):
+        if feature in self.cache and self.cache[feature]["value"] != value:
+            self.version += 1
         valid_to = datetime.now() + self.cachetime
-        self.cache[feature] = {"value": value, "valid_to": valid_to}
+        self.cache[feature] = {"value": value, "valid_to": valid_to, "expired": False}
+
+    def getVersion(self):
+        now = datetime.now()
+        for entry in list(self.cache.values()):
+            self._isExpired(entry, now)
+        return self.version
 
 
 class FeatureDetector(object):
@@ -114,6 +130,7 @@ class FeatureDetector(object):
         "mp3": ["lame"],
         "lora": ["lorarx"],
         "meshtastic": ["lorarx", "py_meshtastic"],
+        "channelizer": ["numpy"],
     }
 
     def feature_availability(self):
@@ -912,6 +929,20 @@ class FeatureDetector(object):
         """
         return self.command_is_runnable("lorarx -h")
 
+    def has_numpy(self):
+        """
+        OpenWebRX can use the [NumPy](https://numpy.org/) library to extract
+        all background decoding channels from the SDR signal in a single
+        pass. The `python3-numpy` package is available in most Linux
+        distributions. Do not forget to restart OpenWebRX after installing
+        this package.
+        """
+        try:
+            import numpy
+            return True
+        except ImportError:
+            return False
+
     def has_py_meshtastic(self):
         """
         OpenWebRX uses [Meshtastic](https://pypi.org/project/meshtastic/) Python library
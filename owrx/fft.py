@@ -2,6 +2,7 @@ from owrx.config import Config
 from csdr.chain.fft import FftChain
 from owrx.source import SdrSourceEventClient, SdrSourceState, SdrClientClass
 from owrx.property import PropertyStack
+from owrx.affinity import CpuAffinity, CpuClass
 from pycsdr.modules import Buffer
 import threading
 
@@ -37,13 +38,15 @@ class SpectrumThread(SdrSourceEventClient):
         if self.dsp is not None:
             return
 
-        self.dsp = FftChain(
-            self.props['samp_rate'],
-            self.props['fft_size'],
-            self.props['fft_voverlap_factor'],
-            self.props['fft_fps'],
-            self.props['fft_compression']
-        )
+        affinity = CpuAffinity.getSharedInstance()
+        with affinity.scope(CpuClass.REALTIME):
+            self.dsp = FftChain(
+                self.props['samp_rate'],
+                self.props['fft_size'],
+                self.props['fft_voverlap_factor'],
+                self.props['fft_fps'],
+                self.props['fft_compression']
+            )
         self.sdrSource.addClient(self)
 
         self.subscriptions += [
@@ -56,7 +59,8 @@ class SpectrumThread(SdrSourceEventClient):
         ]
 
         if self.sdrSource.isAvailable():
-            self.dsp.setReader(self.sdrSource.getBuffer().getReader())
+            with affinity.scope(CpuClass.REALTIME):
+                self.dsp.setReader(self.sdrSource.getBuffer().getReader())
 
     def _setCompression(self, compression):
         if self.reader:
@@ -70,7 +74,8 @@ class SpectrumThread(SdrSourceEventClient):
         buffer = Buffer(self.dsp.getOutputFormat())
         self.dsp.setWriter(buffer)
         self.reader = buffer.getReader()
-        threading.Thread(target=self.dsp.pump(self.reader.read, self.sdrSource.writeSpectrumData)).start()
+        pump = self.dsp.pump(self.reader.read, self.sdrSource.writeSpectrumData)
+        threading.Thread(target=CpuAffinity.getSharedInstance().wrap(pump, CpuClass.REALTIME)).start()
 
     def stopDsp(self):
         if self.dsp is not None:
@@ -100,7 +105,8 @@ class SpectrumThread(SdrSourceEventClient):
             if self.dsp is None:
                 self.start()
             else:
-                self.dsp.setReader(self.sdrSource.getBuffer().getReader())
+                with CpuAffinity.getSharedInstance().scope(CpuClass.REALTIME):
+                    self.dsp.setReader(self.sdrSource.getBuffer().getReader())
 
     def onFail(self):
         self.stopDsp()
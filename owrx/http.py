@@ -4,7 +4,7 @@ from owrx.controllers.feature import FeatureController
 from owrx.controllers.assets import OwrxAssetsController, AprsSymbolsController, CompiledAssetsController
 from owrx.controllers.websocket import WebSocketController
 from owrx.controllers.api import ApiController
-from owrx.controllers.metrics import MetricsController
+from owrx.controllers.metrics import MetricsController, ProfilerController, PropertyStatisticsController
 from owrx.controllers.file import FilesController, FileController
 from owrx.controllers.clients import ClientController
 from owrx.controllers.services import ServiceController
@@ -104,6 +104,8 @@ class Router(object):
             StaticRoute("/api/features", ApiController),
             StaticRoute("/metrics", MetricsController, options={"action": "prometheusAction"}),
             StaticRoute("/metrics.json", MetricsController),
+            StaticRoute("/debug/profile", ProfilerController),
+            StaticRoute("/debug/properties", PropertyStatisticsController),
             StaticRoute("/settings", SettingsController),
             StaticRoute("/settings/general", GeneralSettingsController),
             StaticRoute(
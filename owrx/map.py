@@ -3,6 +3,7 @@ from owrx.config import Config
 from owrx.bands import Band
 from abc import abstractmethod, ABC, ABCMeta
 import threading
+import heapq
 import time
 import sys
 
@@ -16,12 +17,114 @@ class Location(object):
         pm = Config.get()
         return timedelta(seconds=pm["map_position_retention_time"])
 
+    def getLatLon(self):
+        """
+        Coordinates used to index the location on the map, or None if it can not be placed.
+        """
+        return None
+
     def __dict__(self):
         return {
             "ttl": self.getTTL().total_seconds() * 1000
         }
 
 
+class MapRecord(object):
+    __slots__ = ["key", "location", "updated", "expires", "mode", "band", "hops", "tile", "version", "message"]
+
+    def __init__(self, key):
+        self.key = key
+        self.location = None
+        self.updated = None
+        self.expires = 0.0
+        self.mode = None
+        self.band = None
+        self.hops = []
+        self.tile = None
+        self.version = 0
+        self.message = None
+
+    def update(self, loc: "Location", timestamp: datetime, mode: str, band: Band, hops: list[str], version: int):
+        self.location = loc
+        self.updated = timestamp
+        self.expires = (timestamp + loc.getTTL()).timestamp()
+        self.mode = mode
+        self.band = band
+        self.hops = hops
+        self.tile = MapViewport.getTile(loc.getLatLon())
+        self.version = version
+        self.message = None
+
+    def getMessage(self):
+        # serialized form is cached until the next update
+        if self.message is None:
+            self.message = {
+                "callsign": self.key,
+                "location": self.location.__dict__(),
+                "lastseen": self.updated.timestamp() * 1000,
+                "mode": self.mode,
+                "band": self.band.getName() if self.band is not None else None,
+                "hops": self.hops,
+                "version": self.version,
+            }
+        return self.message
+
+
+class MapViewport(object):
+    """
+    Visible area of a map client, at the granularity of the tile grid used to index the map positions.
+    """
+    # tile edge length in degrees
+    tileSize = 2.0
+    rows = int(180 / tileSize)
+    columns = int(360 / tileSize)
+
+    @staticmethod
+    def getTile(latlon):
+        if latlon is None:
+            return None
+        (lat, lon) = latlon
+        row = min(max(int((lat + 90) // MapViewport.tileSize), 0), MapViewport.rows - 1)
+        column = int(((lon + 180) % 360) // MapViewport.tileSize)
+        return row, column
+
+    @staticmethod
+    def fromJson(data):
+        if data is None:
+            return None
+        return MapViewport(float(data["north"]), float(data["south"]), float(data["east"]), float(data["west"]))
+
+    def __init__(self, north: float, south: float, east: float, west: float):
+        (firstRow, _) = MapViewport.getTile((min(north, south), 0))
+        (lastRow, _) = MapViewport.getTile((max(north, south), 0))
+        self.rows = range(firstRow, lastRow + 1)
+        # map libraries may report longitudes beyond +/-180 when the map has been panned around the globe
+        if east - west >= 360:
+            self.columns = set(range(0, MapViewport.columns))
+        else:
+            (_, firstColumn) = MapViewport.getTile((0, west))
+            (_, lastColumn) = MapViewport.getTile((0, east))
+            if lastColumn >= firstColumn:
+                self.columns = set(range(firstColumn, lastColumn + 1))
+            else:
+                # viewport crosses the antimeridian
+                self.columns = set(range(firstColumn, MapViewport.columns)) | set(range(0, lastColumn + 1))
+
+    def getTileCount(self):
+        return len(self.rows) * len(self.columns)
+
+    def getTiles(self):
+        for row in self.rows:
+            for column in self.columns:
+                yield row, column
+
+    def contains(self, tile):
+        # positions without coordinates are always visible
+        if tile is None:
+            return True
+        return tile[0] in self.rows and tile[1] in self.columns
+
+
 class Map(object):
     sharedInstance = None
     creationLock = threading.Lock()
@@ -34,51 +137,104 @@ class Map(object):
         return Map.sharedInstance
 
     def __init__(self):
-        self.clients = []
+        # maps clients to their viewport. None means the whole map, False means nothing has been subscribed yet.
+        self.clients = {}
         self.positions = {}
+        self.peakSize = 0
+        # tile -> {key: record}
+        self.tiles = {}
+        # min-heap of (expiry timestamp, sequence, record) with exactly one entry per live record
+        self.expiryHeap = []
+        self.expirySequence = 0
         self.calls = []
-        self.positionsLock = threading.Lock()
+        self.version = 0
+        self.positionsLock = threading.RLock()
+        self.retentionSub = Config.get().wireProperty("map_position_retention_time", self._onRetentionChange)
 
         def removeLoop():
-            loops = 0
             while True:
                 try:
                     self.removeOldPositions()
                 except Exception:
                     logger.exception("error while removing old map positions")
-                loops += 1
-                # rebuild the positions dictionary every once in a while, it consumes lots of memory otherwise
-                if loops == 60:
-                    try:
-                        self.rebuildPositions()
-                    except Exception:
-                        logger.exception("error while rebuilding positions")
-                    loops = 0
-                time.sleep(60)
+                time.sleep(10)
 
         threading.Thread(target=removeLoop, daemon=True, name="map_removeloop").start()
         super().__init__()
 
-    def broadcast(self, update):
-        for c in self.clients:
-            c.write_update(update)
+    def _nextVersion(self):
+        self.version += 1
+        return self.version
 
-    def addClient(self, client):
-        self.clients.append(client)
+    def broadcast(self, update):
+        # legacy interface for updates that are not associated with a position in the index
+        with self.positionsLock:
+            # copied, clients with a full outbox remove themselves on this thread
+            for c in list(self.clients):
+                c.write_update(update, self.version)
+
+    def _broadcast(self, message, tiles):
+        # must be called with positionsLock held, so that messages can not overtake a viewport snapshot.
+        # copied, clients with a full outbox remove themselves on this thread (the lock is reentrant).
+        for client, viewport in list(self.clients.items()):
+            if viewport is False:
+                continue
+            if viewport is None or any(viewport.contains(t) for t in tiles):
+                client.write_update([message], self.version)
+
+    def addClient(self, client, viewport=None):
+        """
+        Adds a client. Without a viewport, the client receives the complete map. Clients passing False will not
+        receive anything until they subscribe to a viewport using setViewport().
+        """
         with self.positionsLock:
-            positions = [
-                self._makeRecord(key, record) for (key, record) in self.positions.items()
-            ] + [
-                self._makeCall(call) for call in self.calls
-            ]
+            self.clients[client] = False
+            self._setViewport(client, viewport)
 
-        client.write_update(positions)
+    def setViewport(self, client, viewport: MapViewport = None):
+        with self.positionsLock:
+            if client not in self.clients:
+                return
+            self._setViewport(client, viewport)
+
+    def _setViewport(self, client, viewport):
+        previous = self.clients[client]
+        self.clients[client] = viewport
+        if viewport is False:
+            return
+        # send the delta: everything in the new viewport the client has not been sent before
+        if previous is False:
+            records = self._getRecordsInViewport(viewport)
+        elif previous is None:
+            records = []
+        else:
+            records = [r for r in self._getRecordsInViewport(viewport) if not previous.contains(r.tile)]
+        updates = [r.getMessage() for r in records]
+        if previous is False:
+            updates += [self._makeCall(call) for call in self._getCallsInViewport(viewport)]
+        if updates or previous is False:
+            client.write_update(updates, self.version)
+
+    def _getRecordsInViewport(self, viewport):
+        if viewport is None:
+            return list(self.positions.values())
+        if viewport.getTileCount() > len(self.tiles):
+            # cheaper to check the occupied tiles than to enumerate the viewport
+            tiles = [t for t in self.tiles.keys() if viewport.contains(t)]
+        else:
+            tiles = [t for t in viewport.getTiles() if t in self.tiles]
+            if None in self.tiles:
+                tiles.append(None)
+        return [r for t in tiles for r in self.tiles[t].values()]
+
+    def _getCallsInViewport(self, viewport):
+        if viewport is None:
+            return self.calls
+        return [call for call in self.calls if viewport.contains(call["srcTile"]) or viewport.contains(call["dstTile"])]
 
     def removeClient(self, client):
-        try:
-            self.clients.remove(client)
-        except ValueError:
-            pass
+        with self.positionsLock:
+            self.clients.pop(client, None)
 
     def _makeCall(self, call):
         return {
@@ -88,42 +244,35 @@ class Map(object):
             "dst": call["dst"].__dict__(),
             "lastseen": call["timestamp"].timestamp() * 1000,
             "mode": call["mode"],
-            "band": call["band"].getName() if call["band"] is not None else None
-        }
-
-    def _makeRecord(self, callsign, record):
-        return {
-            "callsign": callsign,
-            "location": record["location"].__dict__(),
-            "lastseen": record["updated"].timestamp() * 1000,
-            "mode": record["mode"],
-            "band": record["band"].getName() if record["band"] is not None else None,
-            "hops": record["hops"]
+            "band": call["band"].getName() if call["band"] is not None else None,
+            "version": call["version"],
         }
 
     def updateCall(self, key, callee, mode: str, band: Band = None, timestamp: datetime = None):
         # if we get an external timestamp, make sure it's not already expired
         if timestamp is None:
             timestamp = datetime.now(timezone.utc)
-        elif datetime.now(timezone.utc) - loc.getTTL() > timestamp:
+        elif datetime.now(timezone.utc) - timedelta(seconds=Config.get()["map_call_retention_time"]) > timestamp:
             return
 
         max_calls = Config.get()["map_max_calls"]
-        broadcast = None
 
         # update the list of callees for existing callsigns
         with self.positionsLock:
             if key in self.positions and callee in self.positions:
-                src = self.positions[key]["location"]
-                dst = self.positions[callee]["location"]
+                src = self.positions[key]
+                dst = self.positions[callee]
                 call = {
                     "caller": key,
                     "callee": callee,
                     "timestamp": timestamp,
                     "mode": mode,
                     "band": band,
-                    "src": src,
-                    "dst": dst
+                    "src": src.location,
+                    "dst": dst.location,
+                    "srcTile": src.tile,
+                    "dstTile": dst.tile,
+                    "version": self._nextVersion(),
                 }
                 #logger.debug("{0} call from {1} to {2}".format(mode, key, callee))
                 # remove excessive calls
@@ -131,11 +280,8 @@ class Map(object):
                     self.calls.pop(0)
                 # add a new call
                 if len(self.calls) < max_calls:
-                    broadcast = self._makeCall(call)
                     self.calls.append(call)
-
-        if broadcast is not None:
-            self.broadcast([broadcast])
+                    self._broadcast(self._makeCall(call), [src.tile, dst.tile])
 
     def updateLocation(self, key, loc: Location, mode: str, band: Band = None, hops: list[str] = [], timestamp: datetime = None):
         # if we get an external timestamp, make sure it's not already expired
@@ -147,53 +293,96 @@ class Map(object):
         pm = Config.get()
         ignoreIndirect = pm["map_ignore_indirect_reports"]
         preferRecent = pm["map_prefer_recent_reports"]
-        broadcast = None
 
         # ignore indirect reports if ignoreIndirect set
-        if not ignoreIndirect or len(hops)==0:
+        if ignoreIndirect and len(hops) > 0:
+            return
+
+        with self.positionsLock:
+            record = self.positions.get(key)
+            if record is None:
+                record = MapRecord(key)
+                self.positions[key] = record
+                self.peakSize = max(self.peakSize, len(self.positions))
+                self._pushExpiry(record)
+                previousTile = None
             # prefer messages with shorter hop count unless preferRecent set
-            with self.positionsLock:
-                if key not in self.positions:
-                    self.positions[key] = { "location": loc, "updated": timestamp, "mode": mode, "band": band, "hops": hops }
-                    broadcast = self._makeRecord(key, self.positions[key])
-                elif preferRecent or len(hops) <= len(self.positions[key]["hops"]):
-                    if isinstance(loc, IncrementalUpdate):
-                        loc.update(self.positions[key]["location"])
-                    self.positions[key].update({ "location": loc, "updated": timestamp, "mode": mode, "band": band, "hops": hops })
-                    broadcast = self._makeRecord(key, self.positions[key])
-
-        if broadcast is not None:
-            self.broadcast([broadcast])
+            elif preferRecent or len(hops) <= len(record.hops):
+                if isinstance(loc, IncrementalUpdate):
+                    loc.update(record.location)
+                previousTile = record.tile
+            else:
+                return
+
+            self._unindex(record)
+            record.update(loc, timestamp, mode, band, hops, self._nextVersion())
+            self.tiles.setdefault(record.tile, {})[key] = record
+            # clients need to see the update if either the old or the new position is visible to them
+            self._broadcast(record.getMessage(), [record.tile, previousTile] if previousTile != record.tile else [record.tile])
 
     def touchLocation(self, key):
         # not implemented on the client side yet, so do not use!
         ts = datetime.now(timezone.utc)
         with self.positionsLock:
             if key in self.positions:
-                self.positions[key]["updated"] = ts
-        self.broadcast([{"callsign": key, "lastseen": ts.timestamp() * 1000}])
+                record = self.positions[key]
+                record.updated = ts
+                record.expires = (ts + record.location.getTTL()).timestamp()
+                record.message = None
+                self._broadcast({"callsign": key, "lastseen": ts.timestamp() * 1000}, [record.tile])
 
     def removeLocation(self, key):
         with self.positionsLock:
             if key in self.positions:
-                del self.positions[key]
+                self._unindex(self.positions.pop(key))
                 # TODO broadcast removal to clients
+                # the expiry heap entry is discarded lazily once it reaches the top
+
+    def _unindex(self, record: MapRecord):
+        if record.tile not in self.tiles:
+            return
+        tile = self.tiles[record.tile]
+        tile.pop(record.key, None)
+        if not tile:
+            del self.tiles[record.tile]
+
+    def _pushExpiry(self, record: MapRecord):
+        self.expirySequence += 1
+        heapq.heappush(self.expiryHeap, (record.expires, self.expirySequence, record))
+
+    def _onRetentionChange(self, *args):
+        # all expiry times change, so recalculate them and rebuild the heap
+        with self.positionsLock:
+            self.expiryHeap = []
+            for record in self.positions.values():
+                record.expires = (record.updated + record.location.getTTL()).timestamp()
+                self._pushExpiry(record)
 
     def removeOldPositions(self):
-        now = datetime.now(timezone.utc)
+        now = datetime.now(timezone.utc).timestamp()
 
         with self.positionsLock:
-            to_be_removed = [
-                key for (key, pos) in self.positions.items() if now - pos["location"].getTTL() > pos["updated"]
-            ]
-        for key in to_be_removed:
-            self.removeLocation(key)
+            while self.expiryHeap and self.expiryHeap[0][0] <= now:
+                (_, _, record) = heapq.heappop(self.expiryHeap)
+                if self.positions.get(record.key) is not record:
+                    # removed or replaced in the meantime
+                    continue
+                if record.expires > now:
+                    # record has been updated since the heap entry was created
+                    self._pushExpiry(record)
+                    continue
+                self.removeLocation(record.key)
+
+            # dicts don't shrink on deletion, so rebuild the index once it has shrunk considerably
+            if len(self.positions) < self.peakSize // 2:
+                self.rebuildPositions()
 
     def rebuildPositions(self):
         logger.debug("rebuilding map storage; size before: %i", sys.getsizeof(self.positions))
         with self.positionsLock:
-            p = {key: value for key, value in self.positions.items()}
-            self.positions = p
+            self.positions = {key: value for key, value in self.positions.items()}
+            self.tiles = {tile: dict(records) for tile, records in self.tiles.items()}
+            self.peakSize = len(self.positions)
         logger.debug("rebuild complete; size after: %i", sys.getsizeof(self.positions))
 
 
@@ -202,6 +391,9 @@ class LatLngLocation(Location):
         self.lat = lat
         self.lon = lon
 
+    def getLatLon(self):
+        return self.lat, self.lon
+
     def __dict__(self):
         res = super().__dict__()
         res.update(
@@ -214,6 +406,28 @@ class LocatorLocation(Location):
     def __init__(self, locator: str):
         self.locator = locator
 
+    def getLatLon(self):
+        # center of the maidenhead square
+        loc = self.locator.upper()
+        try:
+            lon = (ord(loc[0]) - ord("A")) * 20 - 180
+            lat = (ord(loc[1]) - ord("A")) * 10 - 90
+            width = 20.0
+            height = 10.0
+            if len(loc) >= 4:
+                lon += int(loc[2]) * 2
+                lat += int(loc[3])
+                width = 2.0
+                height = 1.0
+            if len(loc) >= 6:
+                lon += (ord(loc[4]) - ord("A")) * 2 / 24
+                lat += (ord(loc[5]) - ord("A")) / 24
+                width = 2 / 24
+                height = 1 / 24
+        except (IndexError, ValueError):
+            return None
+        return lat + height / 2, lon + width / 2
+
     def __dict__(self):
         res = super().__dict__()
         res.update(
@@ -6,6 +6,7 @@ from owrx.aprs import getSymbolData
 from owrx.web.receivers import Receivers
 from owrx.web.repeaters import Repeaters
 from owrx.web.eibi import EIBI
+from owrx.watcher import FileWatcher
 from json import JSONEncoder
 from datetime import datetime, timedelta, timezone
 
@@ -36,6 +37,11 @@ class MarkerLocation(Location):
     def getMode(self):
         return self.attrs["mode"]
 
+    def getLatLon(self):
+        if "lat" in self.attrs and "lon" in self.attrs:
+            return self.attrs["lat"], self.attrs["lon"]
+        return None
+
     def __dict__(self):
         return self.attrs
 
@@ -44,6 +50,8 @@ class MarkerLocation(Location):
 
 
 class Markers(object):
+    MARKERS_FILES = ["markers.json", "/etc/openwebrx/markers.json"]
+    MARKERS_DIR = "/etc/openwebrx/markers.d"
     sharedInstance = None
     creationLock = threading.Lock()
 
@@ -79,19 +87,36 @@ class Markers(object):
         self.wmarkers = {}
         self.smarkers = {}
         self.thread = None
+        self.watch = None
         # Known database files
-        self.fileList = [
-            "markers.json",
-            "/etc/openwebrx/markers.json",
-        ]
-        # Find additional marker files in the markers.d folder
+        self.fileList = self._getMarkerFiles()
+
+    # Find marker files, including additional files in the markers.d folder
+    def _getMarkerFiles(self):
+        result = list(Markers.MARKERS_FILES)
         try:
-            markersDir = "/etc/openwebrx/markers.d"
-            self.fileList += [ markersDir + "/" + file
-                for file in os.listdir(markersDir) if file.endswith(".json")
+            result += [ Markers.MARKERS_DIR + "/" + file
+                for file in os.listdir(Markers.MARKERS_DIR) if file.endswith(".json")
             ]
         except Exception:
             pass
+        return result
+
+    # Load miscellaneous markers from local files
+    def _loadStaticMarkers(self):
+        result = {}
+        for file in self.fileList:
+            if os.path.isfile(file):
+                result.update(self.loadMarkers(file))
+        return result
+
+    # Reload miscellaneous markers when marker files change
+    def _onFileChange(self):
+        if self.thread is None:
+            return
+        logger.info("Marker files changed, reloading...")
+        self.fileList = self._getMarkerFiles()
+        self.applyUpdate(self.markers, self._loadStaticMarkers())
 
     # Start the main thread
     def startThread(self):
@@ -117,10 +142,11 @@ class Markers(object):
         self.txmarkers = {} # Current transmitters (EIBI)
         self.remarkers = {} # Current repeaters (RepeaterBook)
 
-        # Load miscellaneous markers from local files
-        for file in self.fileList:
-            if os.path.isfile(file):
-                self.markers.update(self.loadMarkers(file))
+        # Load miscellaneous markers from local files, and watch them for changes
+        self.markers = self._loadStaticMarkers()
+        self.watch = FileWatcher.getSharedInstance().watch(
+            Markers.MARKERS_FILES + [ Markers.MARKERS_DIR ], self._onFileChange
+        )
 
         # Load list of online SDR receivers
         self.rxmarkers = self.loadReceivers()
@@ -179,6 +205,9 @@ class Markers(object):
         # Done with the thread
         logger.info("Stopped marker database thread.")
         self.thread = None
+        if self.watch is not None:
+            self.watch.cancel()
+            self.watch = None
 
     # Load markers from a given file
     def loadMarkers(self, file: str):
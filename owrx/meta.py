@@ -1,7 +1,6 @@
 import json
 import logging
 import threading
-import pickle
 import re
 from abc import ABC, ABCMeta, abstractmethod
 from datetime import datetime, timedelta
@@ -318,7 +317,7 @@ class MetaParser(PickleModule):
         # we may have moved on in the meantime
         if meta is not self.currentMetaData:
             return
-        self.writer.write(pickle.dumps(meta))
+        self.writeMessages([meta])
 
     def setDialFrequency(self, freq):
         self.band = Bandplan.getSharedInstance().findBand(freq)
@@ -1,5 +1,5 @@
 import threading
-from owrx.client import ClientRegistry
+import time
 
 
 class Metric(object):
@@ -7,15 +7,134 @@ class Metric(object):
         return 0
 
 
+class ThreadLocalCells(object):
+    """
+    Per-thread accumulator cells. Each thread only ever writes to its own cell, so updates do not need a lock;
+    cells of threads that have ended are folded into a common base whenever a cell is added or the cells are read.
+    """
+    def __init__(self, factory, merge):
+        self.factory = factory
+        self.merge = merge
+        self.local = threading.local()
+        self.cells = []
+        self.cellsLock = threading.Lock()
+        self.base = factory()
+
+    def get(self):
+        try:
+            return self.local.cell
+        except AttributeError:
+            cell = self.factory()
+            with self.cellsLock:
+                # short-lived threads would otherwise pile up cells until the next read
+                self._prune()
+                self.cells.append((threading.current_thread(), cell))
+            self.local.cell = cell
+            return cell
+
+    def _prune(self):
+        # must be called with cellsLock held
+        alive = []
+        for thread, cell in self.cells:
+            if thread.is_alive():
+                alive.append((thread, cell))
+            else:
+                self.merge(self.base, cell)
+        self.cells = alive
+
+    def collect(self):
+        with self.cellsLock:
+            self._prune()
+            result = self.factory()
+            self.merge(result, self.base)
+            for _, cell in self.cells:
+                self.merge(result, cell)
+            return result
+
+
 class CounterMetric(Metric):
     def __init__(self):
-        self.counter = 0
+        self.cells = ThreadLocalCells(lambda: [0], self._merge)
 
     def inc(self, increment=1):
-        self.counter += increment
+        self.cells.get()[0] += increment
+
+    def _merge(self, target, source):
+        target[0] += source[0]
 
     def getValue(self):
-        return {"count": self.counter}
+        return {"count": self.cells.collect()[0]}
+
+
+class GaugeMetric(Metric):
+    def __init__(self, value=0):
+        self.value = value
+        self.lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, increment=1):
+        with self.lock:
+            self.value += increment
+
+    def dec(self, decrement=1):
+        with self.lock:
+            self.value -= decrement
+
+    def getValue(self):
+        return self.value
+
+
+class HistogramMetric(Metric):
+    # default buckets in seconds, same as the prometheus client libraries
+    defaultBuckets = [0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0]
+
+    def __init__(self, buckets=None):
+        self.buckets = sorted(buckets if buckets is not None else HistogramMetric.defaultBuckets)
+        size = len(self.buckets)
+        # one counter per bucket plus +Inf, followed by sum and count
+        self.cells = ThreadLocalCells(lambda: [0] * (size + 1) + [0.0, 0], self._merge)
+
+    def observe(self, value):
+        cell = self.cells.get()
+        index = 0
+        for le in self.buckets:
+            if value <= le:
+                break
+            index += 1
+        cell[index] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def time(self):
+        return HistogramTimer(self)
+
+    def _merge(self, target, source):
+        for i in range(len(target)):
+            target[i] += source[i]
+
+    def getValue(self):
+        cells = self.cells.collect()
+        buckets = {}
+        cumulative = 0
+        for le, count in zip(self.buckets + ["+Inf"], cells):
+            cumulative += count
+            buckets[str(le)] = cumulative
+        return {"buckets": buckets, "sum": cells[-2], "count": cells[-1]}
+
+
+class HistogramTimer(object):
+    def __init__(self, histogram: HistogramMetric):
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.histogram.observe(time.perf_counter() - self.start)
 
 
 class DirectMetric(Metric):
@@ -38,11 +157,22 @@ class Metrics(object):
         return Metrics.sharedInstance
 
     def __init__(self):
+        from owrx.client import ClientRegistry
+        from owrx.property import PropertyManager
+
         self.metrics = {}
+        self.metricsLock = threading.Lock()
         self.addMetric("openwebrx.users", DirectMetric(ClientRegistry.getSharedInstance().clientCount))
+        # spectrum frames replaced by newer ones before being sent to slow clients
+        self.addMetric("openwebrx.outbox.coalesced", CounterMetric())
+        # messages discarded due to full or closed client outboxes
+        self.addMetric("openwebrx.outbox.dropped", CounterMetric())
+        self.addMetric("openwebrx.websocket.send_time", HistogramMetric())
+        self.addMetric("openwebrx.property.fanout_time", PropertyManager.fanoutTime)
 
     def addMetric(self, name, metric):
-        self.metrics[name] = metric
+        with self.metricsLock:
+            self.metrics[name] = metric
 
     def hasMetric(self, name):
         return name in self.metrics
@@ -52,13 +182,20 @@ class Metrics(object):
             return None
         return self.metrics[name]
 
+    def getOrAddMetric(self, name, factory):
+        with self.metricsLock:
+            if name not in self.metrics:
+                self.metrics[name] = factory()
+            return self.metrics[name]
+
     def getFlatMetrics(self):
-        return self.metrics
+        with self.metricsLock:
+            return self.metrics.copy()
 
     def getHierarchicalMetrics(self):
         result = {}
 
-        for (key, metric) in self.metrics.items():
+        for (key, metric) in self.getFlatMetrics().items():
             partial = result
             keys = key.split(".")
             for keypart in keys[0:-1]:
@@ -0,0 +1,180 @@
+from owrx.websocket import WebSocketFrame
+from owrx.metrics import Metrics, DirectMetric
+from queue import Full, SimpleQueue
+from collections import deque
+import threading
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+PoisonPill = object()
+
+
+class OutboxClosed(Exception):
+    pass
+
+
+class Outbox(object):
+    """
+    Outgoing message queue for a single client.
+
+    If a sender is given, queued data is passed to it by the shared OutboxDispatcher, otherwise it has to be
+    consumed with get(). The sender must not block; if it can not take more data, waiter(callback) returns False
+    and calls the callback once it can. The outbox keeps (and coalesces) its data in the meantime.
+
+    Binary frames whose type byte is in COALESCED_TYPES only keep the latest unsent frame per type; a new frame
+    replaces the pending one in place. Everything else is delivered in FIFO order and limited to maxsize entries.
+    """
+    # 0x01: spectrum (FFT) data, 0x03: secondary FFT data
+    COALESCED_TYPES = [0x01, 0x03]
+
+    def __init__(self, maxsize: int = 100, sender: callable = None, waiter: callable = None):
+        self.maxsize = maxsize
+        self.sender = sender
+        self.waiter = waiter
+        # True while the outbox is waiting for, or being serviced by, a dispatcher thread, and while it is waiting
+        # for the sender to become ready again
+        self.scheduled = False
+        self.order = deque()
+        self.fifoCount = 0
+        self.latest = {}
+        self.closed = False
+        self.condition = threading.Condition()
+        metrics = Metrics.getSharedInstance()
+        self.coalescedCounter = metrics.getMetric("openwebrx.outbox.coalesced")
+        self.droppedCounter = metrics.getMetric("openwebrx.outbox.dropped")
+
+    def _getKey(self, data):
+        if isinstance(data, WebSocketFrame):
+            return data.key
+        if isinstance(data, (bytes, bytearray)) and len(data) and data[0] in Outbox.COALESCED_TYPES:
+            return data[0]
+        return None
+
+    def put(self, data):
+        """
+        Queue data for sending. Raises Full if FIFO capacity is exhausted and OutboxClosed after close().
+        """
+        with self.condition:
+            if self.closed:
+                raise OutboxClosed()
+            key = self._getKey(data)
+            if key is None:
+                if self.fifoCount >= self.maxsize:
+                    self.droppedCounter.inc()
+                    raise Full()
+                self.fifoCount += 1
+                self.order.append((None, data))
+            elif key in self.latest:
+                # keep the queue position, just replace the frame
+                self.latest[key] = data
+                self.coalescedCounter.inc()
+            else:
+                self.latest[key] = data
+                self.order.append((key, None))
+            self.condition.notify()
+            if self.sender is None or self.scheduled:
+                return
+            self.scheduled = True
+        OutboxDispatcher.getSharedInstance().schedule(self)
+
+    def get(self):
+        """
+        Block until data is available. Returns PoisonPill once the outbox has been closed and emptied.
+        """
+        with self.condition:
+            while not self.order:
+                if self.closed:
+                    return PoisonPill
+                self.condition.wait()
+            return self._pop()
+
+    def _pop(self):
+        key, data = self.order.popleft()
+        if key is None:
+            self.fifoCount -= 1
+            return data
+        return self.latest.pop(key)
+
+    def _resume(self):
+        OutboxDispatcher.getSharedInstance().schedule(self)
+
+    def dispatch(self, limit: int = 32) -> bool:
+        """
+        Pass up to limit queued entries to the sender. Returns True if more data is pending, in which case the
+        outbox stays scheduled and must be dispatched again.
+
+        If the sender is not ready, False is returned while the outbox stays scheduled; it is handed back to the
+        dispatcher by the waiter callback.
+        """
+        for _ in range(limit):
+            if self.waiter is not None and not self.waiter(self._resume):
+                return False
+            with self.condition:
+                if not self.order:
+                    self.scheduled = False
+                    return False
+                data = self._pop()
+            try:
+                self.sender(data)
+            except (EOFError, OSError, ValueError):
+                self.close()
+            except Exception:
+                logger.exception("Exception while dispatching client message")
+        with self.condition:
+            if not self.order:
+                self.scheduled = False
+            return self.scheduled
+
+    def close(self):
+        with self.condition:
+            if self.order:
+                self.droppedCounter.inc(len(self.order))
+            self.order.clear()
+            self.latest.clear()
+            self.fifoCount = 0
+            self.closed = True
+            self.condition.notify_all()
+
+
+class OutboxDispatcher(object):
+    """
+    Fixed pool of threads sending the queued data of all client outboxes. Every outbox is serviced by a single
+    thread at a time, so its messages stay in order; outboxes with a backlog are requeued after a few messages, so
+    that a busy client does not starve the others. Outboxes of clients that are not reading are parked until their
+    connection drains, so no thread ever waits for a client.
+    """
+    sharedInstance = None
+    creationLock = threading.Lock()
+
+    @staticmethod
+    def getSharedInstance():
+        with OutboxDispatcher.creationLock:
+            if OutboxDispatcher.sharedInstance is None:
+                OutboxDispatcher.sharedInstance = OutboxDispatcher()
+        return OutboxDispatcher.sharedInstance
+
+    def __init__(self, size: int = None):
+        if size is None:
+            size = min(8, max(2, os.cpu_count() or 1))
+        self.queue = SimpleQueue()
+        self.threads = [
+            threading.Thread(target=self.run, name="outbox_dispatcher_{}".format(i), daemon=True) for i in range(size)
+        ]
+        for thread in self.threads:
+            thread.start()
+        Metrics.getSharedInstance().addMetric("openwebrx.outbox.dispatcher_threads", DirectMetric(lambda: size))
+
+    def schedule(self, outbox: Outbox):
+        self.queue.put(outbox)
+
+    def run(self):
+        while True:
+            outbox = self.queue.get()
+            try:
+                if outbox.dispatch():
+                    self.queue.put(outbox)
+            except Exception:
+                logger.exception("Exception in outbox dispatcher")
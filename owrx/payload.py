@@ -0,0 +1,70 @@
+from owrx.websocket import SharedMessage
+from owrx.metrics import Metrics, CounterMetric
+from collections import OrderedDict
+import threading
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PayloadEntry(object):
+    def __init__(self):
+        # held while building, so that clients asking at the same time wait for a single build
+        self.lock = threading.Lock()
+        self.version = None
+        self.message = None
+
+
+class PayloadCache(object):
+    """
+    Encoded messages that are the same for many clients, like the list of modes or the bookmarks of a profile.
+
+    Messages are stored by type and an optional key for the parameters they were built from (e.g. the frequency
+    range), together with the version of the data. The subsystem owning the data bumps its version on every change,
+    and the next request rebuilds the message. Everybody else gets the same SharedMessage.
+    """
+    sharedInstance = None
+    creationLock = threading.Lock()
+
+    @staticmethod
+    def getSharedInstance():
+        with PayloadCache.creationLock:
+            if PayloadCache.sharedInstance is None:
+                PayloadCache.sharedInstance = PayloadCache()
+        return PayloadCache.sharedInstance
+
+    def __init__(self, maxEntries: int = 256):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        metrics = Metrics.getSharedInstance()
+        self.hitCounter = metrics.getOrAddMetric("openwebrx.payloads.hits", CounterMetric)
+        self.missCounter = metrics.getOrAddMetric("openwebrx.payloads.misses", CounterMetric)
+
+    def get(self, type: str, builder: callable, key=None, version=None) -> SharedMessage:
+        """
+        Get the message {"type": type, "value": builder()}. The builder is only called if there is no message for
+        the same type and key, or if it was built from a different version.
+        """
+        with self.lock:
+            entry = self.entries.get((type, key))
+            if entry is None:
+                entry = self.entries[(type, key)] = PayloadEntry()
+                while len(self.entries) > self.maxEntries:
+                    self.entries.popitem(last=False)
+            else:
+                self.entries.move_to_end((type, key))
+
+        with entry.lock:
+            if entry.message is not None and entry.version == version:
+                self.hitCounter.inc()
+                return entry.message
+            self.missCounter.inc()
+            entry.message = SharedMessage({"type": type, "value": builder()})
+            entry.version = version
+            return entry.message
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
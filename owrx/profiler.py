@@ -0,0 +1,65 @@
+import sys
+import threading
+import time
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Profile(object):
+    def __init__(self, samples: dict, count: int, duration: float):
+        # sample counts keyed by (thread name, stack tuple)
+        self.samples = samples
+        self.count = count
+        self.duration = duration
+
+    def toCollapsed(self):
+        """
+        Render the samples in the "collapsed stack" format understood by flamegraph.pl and speedscope,
+        one line per unique stack, most frequent first.
+        """
+        lines = [
+            "# {count} samples over {duration:.2f} seconds".format(count=self.count, duration=self.duration)
+        ]
+        for (thread, stack), count in sorted(self.samples.items(), key=lambda x: x[1], reverse=True):
+            lines.append("{0} {1}".format(";".join((thread,) + stack), count))
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler(object):
+    """
+    Statistical profiler that periodically records the stack of every running thread.
+    """
+    maxDuration = 60.0
+    minInterval = 0.001
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+
+    def _getStack(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append("{0} ({1}:{2})".format(code.co_name, code.co_filename, frame.f_lineno))
+            frame = frame.f_back
+        # outermost frame first
+        return tuple(reversed(stack))
+
+    def run(self, duration: float) -> Profile:
+        samples = {}
+        count = 0
+        ownId = threading.get_ident()
+        start = time.monotonic()
+        end = start + duration
+        while time.monotonic() < end:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == ownId:
+                    continue
+                key = (names.get(ident, str(ident)), self._getStack(frame))
+                samples[key] = samples.get(key, 0) + 1
+            count += 1
+            time.sleep(self.interval)
+        logger.debug("collected %i profiling samples", count)
+        return Profile(samples, count, time.monotonic() - start)
@@ -1,6 +1,11 @@
 from abc import ABC, abstractmethod
 from owrx.property.validators import Validator
 from owrx.property.filter import Filter, ByPropertyName
+from owrx.metrics import HistogramMetric
+import itertools
+import threading
+import weakref
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,25 +25,203 @@ class PropertyDeletion(object):
 PropertyDeleted = PropertyDeletion()
 
 
+class DispatchStatistics(object):
+    """
+    Number of calls and time spent per subscriber callback, summed up over all subscriptions of the same callback.
+    Times include everything the callback triggers, including further property changes.
+    """
+    sharedInstance = None
+    creationLock = threading.Lock()
+
+    @staticmethod
+    def getSharedInstance():
+        with DispatchStatistics.creationLock:
+            if DispatchStatistics.sharedInstance is None:
+                DispatchStatistics.sharedInstance = DispatchStatistics()
+        return DispatchStatistics.sharedInstance
+
+    @staticmethod
+    def getCallbackName(callback) -> str:
+        function = getattr(callback, "__func__", callback)
+        if hasattr(function, "__qualname__"):
+            return "{0}.{1}".format(function.__module__, function.__qualname__)
+        # partials and callable objects
+        return "{0}.{1}".format(type(callback).__module__, type(callback).__qualname__)
+
+    def __init__(self):
+        self.cells = {}
+        self.lock = threading.Lock()
+
+    def getCell(self, name: str) -> list:
+        with self.lock:
+            if name not in self.cells:
+                # call count, total time
+                self.cells[name] = [0, 0.0]
+            return self.cells[name]
+
+    def record(self, cell: list, duration: float):
+        with self.lock:
+            cell[0] += 1
+            cell[1] += duration
+
+    def getStatistics(self) -> list:
+        with self.lock:
+            stats = [{"subscriber": name, "count": c[0], "time": c[1]} for name, c in self.cells.items() if c[0]]
+        return sorted(stats, key=lambda s: s["time"], reverse=True)
+
+
 class Subscription(object):
-    def __init__(self, subscriptee, name, subscriber):
-        self.subscriptee = subscriptee
+    # orders subscriptions by the time they were wired
+    sequence = itertools.count()
+
+    def __init__(self, subscriptee, name, subscriber, downstream=None, keys=None):
+        # a subscription does not keep the property manager alive
+        self.subscriptee = weakref.ref(subscriptee)
         self.name = name
         self.subscriber = subscriber
+        # property manager that this subscription forwards changes to, if any
+        self.downstream = downstream
+        # property names a subscription to all changes is limited to, if known
+        self.keys = keys
+        self.order = next(Subscription.sequence)
+        self.dispatchCount = 0
+        self.dispatchTime = 0.0
+        self.statistics = DispatchStatistics.getSharedInstance()
+        self.cell = self.statistics.getCell(DispatchStatistics.getCallbackName(subscriber))
 
     def getName(self):
         return self.name
 
+    def getDownstream(self):
+        return self.downstream
+
+    def getSubscriptee(self):
+        return self.subscriptee()
+
+    def getKeys(self):
+        return self.keys
+
+    def getDispatchCount(self):
+        return self.dispatchCount
+
+    def getDispatchTime(self):
+        return self.dispatchTime
+
     def call(self, *args, **kwargs):
-        self.subscriber(*args, **kwargs)
+        if self.downstream is not None:
+            # forwarding is part of the dispatch, only count the time spent in actual subscribers
+            self.subscriber(*args, **kwargs)
+            return
+        start = time.perf_counter()
+        try:
+            self.subscriber(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            self.dispatchCount += 1
+            self.dispatchTime += duration
+            self.statistics.record(self.cell, duration)
 
     def cancel(self):
-        self.subscriptee.unwire(self)
+        subscriptee = self.subscriptee()
+        if subscriptee is not None:
+            subscriptee.unwire(self)
+
+
+class PropertyTransaction(object):
+    """
+    Batches property changes made by the current thread. Values are written immediately, and changes propagate
+    through filters, stacks and delegators as usual, but calls to all other subscribers are held back until the
+    outermost transaction ends. Each subscriber is then called once, with the net changes: properties that have
+    returned to their value from before the transaction are left out.
+
+    Changes are not rolled back if the transaction is left with an exception.
+
+    Usage:
+        with PropertyTransaction():
+            layer["samp_rate"] = 2400000
+            layer["center_freq"] = 14100000
+    """
+    local = threading.local()
+
+    @staticmethod
+    def getCurrent():
+        return getattr(PropertyTransaction.local, "current", None)
+
+    def __init__(self):
+        self.outer = None
+        # (manager, key) -> value before the transaction
+        self.originals = {}
+        # subscription -> (manager, merged changes), in order of the first deferred call
+        self.calls = {}
+
+    def __enter__(self):
+        self.outer = PropertyTransaction.getCurrent()
+        if self.outer is None:
+            PropertyTransaction.local.current = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.outer is None:
+            PropertyTransaction.local.current = None
+            self._commit()
+
+    def snapshot(self, manager, keys):
+        """
+        Remember the current values of the given keys in a manager and everything downstream of it, before they
+        are modified for the first time.
+        """
+        pending = [manager]
+        visited = set()
+        while pending:
+            m = pending.pop()
+            if id(m) in visited:
+                continue
+            visited.add(id(m))
+            for key in keys:
+                if (m, key) not in self.originals:
+                    self.originals[(m, key)] = m[key] if key in m else PropertyDeleted
+            pending += m._getDownstream()
+
+    def defer(self, manager, subscription, changes):
+        if subscription in self.calls:
+            self.calls[subscription][1].update(changes)
+        else:
+            self.calls[subscription] = (manager, dict(changes))
+
+    def _isUnchanged(self, manager, key, value):
+        if (manager, key) not in self.originals:
+            return False
+        original = self.originals[(manager, key)]
+        return original is value or original == value
+
+    def _commit(self):
+        # subscribers run outside of the transaction, any changes they make are dispatched immediately
+        for subscription, (manager, changes) in self.calls.items():
+            if not manager._isWired(subscription):
+                # cancelled in the meantime
+                continue
+            changes = {k: v for k, v in changes.items() if not self._isUnchanged(manager, k, v)}
+            if not changes:
+                continue
+            try:
+                if subscription.getName() is None:
+                    subscription.call(changes)
+                else:
+                    subscription.call(changes[subscription.getName()])
+            except Exception:
+                logger.exception("exception while firing changes")
 
 
 class PropertyManager(ABC):
+    # time spent dispatching change events to subscribers, registered as openwebrx.property.fanout_time
+    fanoutTime = HistogramMetric([0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0])
+
     def __init__(self):
-        self.subscribers = []
+        # subscriptions to all changes, those limited to some property names indexed by name, and subscriptions to
+        # single properties by name. dicts keep the wiring order and allow removal in constant time.
+        self.subscribers = {}
+        self.keyedSubscribers = {}
+        self.propertySubscribers = {}
 
     @abstractmethod
     def __getitem__(self, item):
@@ -83,38 +266,112 @@ class PropertyManager(ABC):
 
     def wire(self, callback):
         sub = Subscription(self, None, callback)
-        self.subscribers.append(sub)
+        self.subscribers[sub] = None
+        return sub
+
+    def wireDownstream(self, manager, callback, keys=None):
+        """
+        Wire a callback that forwards changes into another property manager. These callbacks are part of the
+        change propagation, and are called immediately even during a transaction.
+
+        If the other manager only uses some properties, their names can be passed as keys, so that the callback is
+        only called when one of them changes.
+        """
+        sub = Subscription(self, None, callback, manager, None if keys is None else frozenset(keys))
+        if sub.getKeys() is None:
+            self.subscribers[sub] = None
+        else:
+            for key in sub.getKeys():
+                self.keyedSubscribers.setdefault(key, {})[sub] = None
         return sub
 
     def wireProperty(self, name, callback):
         sub = Subscription(self, name, callback)
-        self.subscribers.append(sub)
+        self.propertySubscribers.setdefault(name, {})[sub] = None
         if name in self:
             sub.call(self[name])
         return sub
 
     def unwire(self, sub):
-        try:
-            self.subscribers.remove(sub)
-        except ValueError:
-            # happens when already removed before
-            pass
+        # subscriptions may already have been removed before
+        if sub.getName() is not None:
+            self._removeFromIndex(self.propertySubscribers, sub.getName(), sub)
+        elif sub.getKeys() is not None:
+            for key in sub.getKeys():
+                self._removeFromIndex(self.keyedSubscribers, key, sub)
+        else:
+            self.subscribers.pop(sub, None)
         return self
 
+    def _removeFromIndex(self, index, key, sub):
+        subs = index.get(key)
+        if subs is not None:
+            subs.pop(sub, None)
+            if not subs:
+                del index[key]
+
+    def _isWired(self, sub):
+        if sub.getSubscriptee() is not self:
+            return False
+        if sub.getName() is not None:
+            return sub in self.propertySubscribers.get(sub.getName(), ())
+        if sub.getKeys() is not None:
+            return any(sub in self.keyedSubscribers.get(key, ()) for key in sub.getKeys())
+        return sub in self.subscribers
+
+    def _getDownstream(self):
+        downstream = [s.getDownstream() for s in self.subscribers if s.getDownstream() is not None]
+        for subs in self.keyedSubscribers.values():
+            downstream += [s.getDownstream() for s in subs]
+        return downstream
+
+    def hasSubscribers(self, changes) -> bool:
+        """
+        Whether any subscriber is interested in at least one of the changed properties.
+        """
+        if self.subscribers:
+            return True
+        for name in changes:
+            if name in self.propertySubscribers or name in self.keyedSubscribers:
+                return True
+        return False
+
+    def _snapshot(self, keys):
+        # record values before they are modified within a transaction
+        transaction = PropertyTransaction.getCurrent()
+        if transaction is not None:
+            transaction.snapshot(self, keys)
+
     def _fireCallbacks(self, changes):
-        if not changes:
+        if not changes or not self.hasSubscribers(changes):
             return
-        subscribers = self.subscribers.copy()
+        with PropertyManager.fanoutTime.time():
+            self._dispatch(changes, PropertyTransaction.getCurrent())
+
+    def _dispatch(self, changes, transaction=None):
+        # collect everything up front, subscriptions added while dispatching do not receive this event
+        subscribers = list(self.subscribers)
+        keyed = {s for name in changes for s in self.keyedSubscribers.get(name, ())}
+        if keyed:
+            subscribers = sorted(subscribers + list(keyed), key=lambda s: s.order)
+        propertySubscribers = [
+            (name, list(self.propertySubscribers[name])) for name in changes if name in self.propertySubscribers
+        ]
+
         for c in subscribers:
             try:
-                if c.getName() is None:
+                if transaction is not None and c.getDownstream() is None:
+                    transaction.defer(self, c, changes)
+                else:
                     c.call(changes)
             except Exception:
                 logger.exception("exception while firing changes")
-        for name in changes:
-            for c in subscribers:
+        for name, subs in propertySubscribers:
+            for c in subs:
                 try:
-                    if c.getName() == name:
+                    if transaction is not None:
+                        transaction.defer(self, c, {name: changes[name]})
+                    else:
                         c.call(changes[name])
                 except Exception:
                     logger.exception("exception while firing changes")
@@ -135,6 +392,7 @@ class PropertyLayer(PropertyManager):
     def __setitem__(self, name, value):
         if name in self.properties and self.properties[name] == value:
             return
+        self._snapshot([name])
         self.properties[name] = value
         self._fireCallbacks({name: value})
 
@@ -142,6 +400,7 @@ class PropertyLayer(PropertyManager):
         return {k: v for k, v in self.properties.items()}
 
     def __delitem__(self, key):
+        self._snapshot([key])
         self.properties.__delitem__(key)
         self._fireCallbacks({key: PropertyDeleted})
 
@@ -160,9 +419,12 @@ class PropertyFilter(PropertyManager):
         super().__init__()
         self.pm = pm
         self._filter = filter
-        self.pm.wire(self.receiveEvent)
+        # any object with an apply() method will do as a filter, but only Filters know their keys
+        self.pm.wireDownstream(self, self.receiveEvent, filter.getKeys() if isinstance(filter, Filter) else None)
 
     def receiveEvent(self, changes):
+        if not self.hasSubscribers(changes):
+            return
         changesToForward = {name: value for name, value in changes.items() if self._filter.apply(name)}
         self._fireCallbacks(changesToForward)
 
@@ -202,7 +464,7 @@ class PropertyFilter(PropertyManager):
 class PropertyDelegator(PropertyManager):
     def __init__(self, pm: PropertyManager):
         self.pm = pm
-        self.subscription = self.pm.wire(self._fireCallbacks)
+        self.subscription = self.pm.wireDownstream(self, self._fireCallbacks)
         super().__init__()
 
     def __getitem__(self, item):
@@ -279,6 +541,7 @@ class PropertyStack(PropertyManager):
         """
         highest priority = 0
         """
+        self._snapshot(pm.keys())
         self._fireCallbacks(self._addLayer(priority, pm))
 
     def _addLayer(self, priority: int, pm: PropertyManager):
@@ -290,9 +553,11 @@ class PropertyStack(PropertyManager):
         def eventClosure(changes):
             self.receiveEvent(pm, changes)
 
-        sub = pm.wire(eventClosure)
+        sub = pm.wireDownstream(self, eventClosure)
 
         self.layers.append({"priority": priority, "props": pm, "sub": sub})
+        # keep the layers ordered by priority, layers with the same priority stay in the order they were added
+        self.layers.sort(key=lambda la: la["priority"])
 
         return changes
 
@@ -304,6 +569,7 @@ class PropertyStack(PropertyManager):
     def removeLayer(self, pm: PropertyManager):
         for layer in self.layers:
             if layer["props"] == pm:
+                self._snapshot(pm.keys())
                 self._fireCallbacks(self._removeLayer(layer))
 
     def _removeLayer(self, layer):
@@ -322,6 +588,7 @@ class PropertyStack(PropertyManager):
     def replaceLayer(self, priority: int, pm: PropertyManager):
         layers = [x for x in self.layers if x["priority"] == priority]
 
+        self._snapshot(set(pm.keys()).union(*[x["props"].keys() for x in layers]))
         originalState = self.__dict__()
 
         changes = self._removeLayer(layers[0]) if layers else {}
@@ -331,6 +598,8 @@ class PropertyStack(PropertyManager):
         self._fireCallbacks(changes)
 
     def receiveEvent(self, layer, changes):
+        if not self.hasSubscribers(changes):
+            return
         changesToForward = {name: value for name, value in changes.items() if layer == self._getTopLayer(name)}
         # deletions need to be handled separately:
         # * send a deletion if the key was deleted in all layers
@@ -343,13 +612,12 @@ class PropertyStack(PropertyManager):
         self._fireCallbacks({**changesToForward, **deletionsToForward})
 
     def _getTopLayer(self, item, fallback=True):
-        layers = [la["props"] for la in sorted(self.layers, key=lambda l: l["priority"])]
-        for m in layers:
-            if item in m:
-                return m
+        for la in self.layers:
+            if item in la["props"]:
+                return la["props"]
         # return top layer as fallback
-        if fallback and layers:
-            return layers[0]
+        if fallback and self.layers:
+            return self.layers[0]["props"]
 
     def __getitem__(self, item):
         layer = self._getTopLayer(item)
@@ -408,9 +676,11 @@ class PropertyCarousel(PropertyDelegator):
 
     def switch(self, key=None):
         before = self.pm
+        after = self._getDefaultLayer() if key is None else self.layers[key]
+        self._snapshot(set(before.keys()) | set(after.keys()))
         self.subscription.cancel()
-        self.pm = self._getDefaultLayer() if key is None else self.layers[key]
-        self.subscription = self.pm.wire(self._fireCallbacks)
+        self.pm = after
+        self.subscription = self.pm.wireDownstream(self, self._fireCallbacks)
         changes = {}
         for key in set(list(before.keys()) + list(self.keys())):
             if key not in self:
@@ -6,14 +6,23 @@ class Filter(ABC):
     def apply(self, prop) -> bool:
         pass
 
+    def getKeys(self):
+        """
+        The property names this filter can let through, or None if that is not known in advance.
+        """
+        return None
+
 
 class ByPropertyName(Filter):
     def __init__(self, *props):
-        self.props = props
+        self.props = frozenset(props)
 
     def apply(self, prop) -> bool:
         return prop in self.props
 
+    def getKeys(self):
+        return self.props
+
 
 class ByLambda(Filter):
     def __init__(self, func):
@@ -7,9 +7,12 @@ from owrx.source.resampler import Resampler
 from owrx.property import PropertyLayer, PropertyDeleted
 from owrx.service.schedule import ServiceScheduler
 from owrx.service.chain import ServiceDemodulatorChain
+from owrx.service.cost import ResamplingCostModel
 from owrx.modes import Modes, DigitalMode
+from owrx.feature import FeatureDetector
 from typing import Union, Optional
 from csdr.chain.demodulator import BaseDemodulatorChain, ServiceDemodulator, DialFrequencyReceiver, FixedAudioRateChain
+from csdr.module import producesMessages, MessageSink
 from pycsdr.modules import Buffer
 
 import sys
@@ -23,6 +26,7 @@ class ServiceHandler(SdrSourceEventClient):
         self.lock = threading.RLock()
         self.services = []
         self.resamplers = []
+        self.channelizer = None
         self.source = source
         self.startupTimer = None
         self.activitySub = None
@@ -103,8 +107,10 @@ class ServiceHandler(SdrSourceEventClient):
         with self.lock:
             resamplers = self.resamplers
             services = self.services
+            channelizer = self.channelizer
             self.resamplers = []
             self.services = []
+            self.channelizer = None
 
         for service in services:
             service.stop()
@@ -116,6 +122,9 @@ class ServiceHandler(SdrSourceEventClient):
             resampler.stop()
         resamplers.clear()
 
+        if channelizer is not None:
+            channelizer.stop()
+
     def onFrequencyChange(self, changes):
         self.stopServices()
         if not self.source.isAvailable():
@@ -133,9 +142,9 @@ class ServiceHandler(SdrSourceEventClient):
         self.startupTimer.start()
 
     def updateServices(self):
-        def addService(dial, source):
+        def addService(dial, source, channelizer=None):
             try:
-                service = self.setupService(dial, source)
+                service = self.setupService(dial, source, channelizer)
                 self.services.append(service)
             except Exception:
                 logger.exception("Error setting up service {mode} on frequency {frequency}".format(**dial))
@@ -161,6 +170,14 @@ class ServiceHandler(SdrSourceEventClient):
                 logger.debug("no services available")
                 return
 
+            self.channelizer = self._getChannelizer(sr)
+            if self.channelizer is not None:
+                # the channelizer replaces the resamplers: all services attach to a single shared filterbank
+                for dial in dials:
+                    addService(dial, self.source, self.channelizer)
+                self.channelizer.setReader(self.source.getBuffer().getReader())
+                return
+
             groups = self.optimizeResampling(dials, sr)
             if groups is None:
                 for dial in dials:
@@ -183,6 +200,12 @@ class ServiceHandler(SdrSourceEventClient):
                         dial = group[0]
                         addService(dial, self.source)
 
+    def _getChannelizer(self, sampleRate):
+        if not Config.get()["services_channelizer"] or not FeatureDetector().is_available("channelizer"):
+            return None
+        from csdr.module.channelizer import Channelizer
+        return Channelizer(sampleRate)
+
     def get_min_max(self, group):
         minFreq = sys.maxsize
         maxFreq = 0
@@ -203,65 +226,59 @@ class ServiceHandler(SdrSourceEventClient):
 
     def get_bandwidth(self, group):
         minFreq, maxFreq = self.get_min_max(group)
+        return self._getGroupBandwidth(minFreq, maxFreq)
+
+    def _getGroupBandwidth(self, minFreq, maxFreq):
         # minimum bandwidth for a resampler: 25kHz
         return max((maxFreq - minFreq) * 1.15, 25000)
 
     def optimizeResampling(self, freqs, bandwidth):
+        """
+        Partitions the dial frequencies into groups of neighbours that share a resampler, so that the predicted CPU
+        load is minimal. Groups of a single dial run directly on the SDR. Returns None if no resampler is worth it.
+        """
         freqs = sorted(freqs, key=lambda f: f["frequency"])
-        distances = [
-            {
-                "frequency": freqs[i]["frequency"],
-                "distance": freqs[i + 1]["frequency"] - freqs[i]["frequency"],
-            }
-            for i in range(0, len(freqs) - 1)
-        ]
-
-        distances = [d for d in distances if d["distance"] > 0]
-
-        distances = sorted(distances, key=lambda f: f["distance"], reverse=True)
-
-        def calculate_usage(num_splits):
-            splits = sorted([f["frequency"] for f in distances[0:num_splits]])
-            previous = 0
-            groups = []
-            for split in splits:
-                groups.append([f for f in freqs if previous < f["frequency"] <= split])
-                previous = split
-            groups.append([f for f in freqs if previous < f["frequency"]])
-
-            def get_total_bandwidth(group):
-                if len(group) > 1:
-                    return bandwidth + len(group) * self.get_bandwidth(group)
-                else:
-                    return bandwidth
-
-            total_bandwidth = sum([get_total_bandwidth(group) for group in groups])
-            return {
-                "num_splits": num_splits,
-                "total_bandwidth": total_bandwidth,
-                "groups": groups,
-            }
-
-        usages = [calculate_usage(i) for i in range(0, len(freqs))]
-        # another possible outcome might be that it's best not to resample at all. this is a special case.
-        usages += [
-            {
-                "num_splits": None,
-                "total_bandwidth": bandwidth * len(freqs),
-                "groups": [freqs],
-            }
-        ]
-        results = sorted(usages, key=lambda f: f["total_bandwidth"])
-
-        for r in results:
-            logger.debug("splits: {0}, total: {1}".format(r["num_splits"], r["total_bandwidth"]))
-
-        best = results[0]
-        if best["num_splits"] is None:
+        model = ResamplingCostModel.getSharedInstance()
+        # service selectors decimate to their audio rate. their cost hardly depends on it, so assume a typical one.
+        audioRate = 12000
+        edges = [self.get_min_max([f]) for f in freqs]
+        directCost = model.getSelectorCost(bandwidth, audioRate)
+
+        # best[j] holds the lowest cost for the first j dials, and where the last group of that solution starts.
+        # since any optimal partition is made of contiguous groups, this covers every reasonable grouping.
+        best = [(0.0, 0)]
+        for j in range(1, len(freqs) + 1):
+            candidate = (best[j - 1][0] + directCost, j - 1)
+            minFreq, maxFreq = edges[j - 1]
+            for i in range(j - 2, -1, -1):
+                minFreq = min(minFreq, edges[i][0])
+                maxFreq = max(maxFreq, edges[i][1])
+                groupRate = self._getGroupBandwidth(minFreq, maxFreq)
+                # groups only get wider from here, and a resampler needs to decimate by at least 2
+                if groupRate * 2 > bandwidth:
+                    break
+                ifRate = bandwidth / int(bandwidth / groupRate)
+                cost = model.getResamplerCost(bandwidth, groupRate) + (j - i) * model.getSelectorCost(ifRate, audioRate)
+                if best[i][0] + cost < candidate[0]:
+                    candidate = (best[i][0] + cost, i)
+            best.append(candidate)
+
+        groups = []
+        end = len(freqs)
+        while end > 0:
+            start = best[end][1]
+            groups.insert(0, freqs[start:end])
+            end = start
+
+        logger.debug(
+            "resampling: %i groups, predicted cpu %.1f%% (%.1f%% without resampling)",
+            len(groups), best[-1][0] * 100, directCost * len(freqs) * 100,
+        )
+        if all(len(group) == 1 for group in groups):
             return None
-        return best["groups"]
+        return groups
 
-    def setupService(self, dial, source):
+    def setupService(self, dial, source, channelizer=None):
         logger.debug("setting up service {mode} on frequency {frequency}".format(**dial))
 
         modeObject = Modes.findByModulation(dial["mode"])
@@ -282,20 +299,36 @@ class ServiceHandler(SdrSourceEventClient):
 
         center_freq = source.getProps()["center_freq"]
         sampleRate = source.getProps()["samp_rate"]
+        offset = dial["frequency"] - center_freq
+        reader = None
+
+        if channelizer is not None:
+            channel = channelizer.addChannel(offset, demod2.getFixedAudioRate())
+            # modes with high sample rates can not be decimated by the channelizer and read the source directly
+            if channel is not None:
+                sampleRate = channel.getSampleRate()
+                offset = channel.getResidualOffset()
+                reader = channelizer.getBuffer(channel).getReader()
 
-        chain = ServiceDemodulatorChain(demod, demod2, sampleRate, dial["frequency"] - center_freq)
+        if reader is None:
+            reader = source.getBuffer().getReader()
+
+        chain = ServiceDemodulatorChain(demod, demod2, sampleRate, offset)
         bandpass = modeObject.get_bandpass()
         if bandpass:
             chain.setBandPass(bandpass.low_cut, bandpass.high_cut)
         else:
             chain.setBandPass(None, None)
-        chain.setReader(source.getBuffer().getReader())
+        chain.setReader(reader)
         chain.setFrequency(dial["frequency"])
         chain.setMode(dial["mode"])
 
-        # dummy buffer, we don't use the output right now
-        buffer = Buffer(chain.getOutputFormat())
-        chain.setWriter(buffer)
+        # decoded messages are only used through the map and reporting, so there is no consumer for the output
+        if producesMessages(chain):
+            chain.setWriter(MessageSink())
+        else:
+            buffer = Buffer(chain.getOutputFormat())
+            chain.setWriter(buffer)
         return chain
 
     # TODO move this elsewhere
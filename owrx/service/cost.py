@@ -0,0 +1,208 @@
+from owrx.config.core import CoreConfig
+from owrx.version import openwebrx_version
+import subprocess
+import threading
+import platform
+import json
+import time
+import sys
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ResamplingCostModel(object):
+    """
+    Predicts the CPU load of the resampling stages used by background services, in CPU seconds per second.
+
+    The coefficients are measured on this host by running pycsdr's Shift and FirDecimate modules in a separate
+    process, and are stored in the data directory together with a fingerprint of the host and software. Until the
+    measurement is done, conservative defaults are used.
+    """
+    sharedInstance = None
+    creationLock = threading.Lock()
+
+    # bump when the measurement changes, so that stored coefficients are calibrated again
+    calibrationVersion = 2
+
+    calibrationScript = (
+        "import json; from owrx.service.cost import ResamplingCostModel; "
+        "print(json.dumps(ResamplingCostModel.measureCoefficients()))"
+    )
+
+    # conservative fallback values in seconds, used until the calibration is done, or if it fails
+    defaultCoefficients = {
+        # per input sample
+        "shift": 5e-9,
+        # per tap and output sample
+        "fir": 1e-9,
+    }
+
+    @staticmethod
+    def getSharedInstance():
+        with ResamplingCostModel.creationLock:
+            if ResamplingCostModel.sharedInstance is None:
+                ResamplingCostModel.sharedInstance = ResamplingCostModel()
+        return ResamplingCostModel.sharedInstance
+
+    def __init__(self):
+        self.coefficients = self._loadCoefficients()
+        if self.coefficients is None:
+            # the calibration takes a few seconds, which the service setup should not wait for
+            self.coefficients = ResamplingCostModel.defaultCoefficients.copy()
+            threading.Thread(target=self._calibrate, name="resampling_cost_calibration", daemon=True).start()
+
+    def _getCoefficientsFile(self):
+        return "{data_directory}/resampling_costs.json".format(data_directory=CoreConfig().get_data_directory())
+
+    @staticmethod
+    def _getCpuModel():
+        try:
+            with open("/proc/cpuinfo", "r") as f:
+                for line in f:
+                    if line.startswith("model name") or line.startswith("Model"):
+                        return line.split(":", 1)[1].strip()
+        except OSError:
+            pass
+        return platform.processor()
+
+    @staticmethod
+    def getFingerprint() -> dict:
+        """
+        Everything the coefficients depend on. Stored coefficients with a different fingerprint are stale.
+        """
+        try:
+            from pycsdr.modules import csdr_version, version as pycsdr_version
+        except ImportError:
+            csdr_version = pycsdr_version = None
+        return {
+            "calibration": ResamplingCostModel.calibrationVersion,
+            "openwebrx": openwebrx_version,
+            "csdr": str(csdr_version),
+            "pycsdr": str(pycsdr_version),
+            "machine": platform.machine(),
+            "cpu": ResamplingCostModel._getCpuModel(),
+            "cpus": os.cpu_count(),
+        }
+
+    def _loadCoefficients(self):
+        try:
+            with open(self._getCoefficientsFile(), "r") as f:
+                stored = json.load(f)
+            if stored.get("fingerprint") != ResamplingCostModel.getFingerprint():
+                logger.info("stored resampling cost coefficients are stale; recalibrating")
+                return None
+            coefficients = stored["coefficients"]
+            if all(k in coefficients for k in ResamplingCostModel.defaultCoefficients):
+                return coefficients
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            logger.warning("could not read resampling cost coefficients; recalibrating")
+        return None
+
+    def _storeCoefficients(self, coefficients):
+        stored = json.dumps({"fingerprint": ResamplingCostModel.getFingerprint(), "coefficients": coefficients})
+        try:
+            with open(self._getCoefficientsFile(), "w") as f:
+                f.write(stored)
+        except OSError:
+            logger.warning("could not store resampling cost coefficients")
+
+    def _calibrate(self):
+        # the cpu time of a separate process only contains the measurement, not the load of the running receiver
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        command = [sys.executable, "-c", ResamplingCostModel.calibrationScript]
+        try:
+            result = subprocess.run(command, cwd=root, capture_output=True, timeout=60, check=True)
+            coefficients = json.loads(result.stdout)
+            if not all(k in coefficients for k in ResamplingCostModel.defaultCoefficients):
+                raise ValueError("incomplete coefficients: {}".format(coefficients))
+        except subprocess.CalledProcessError as e:
+            logger.warning("resampling cost calibration failed; using defaults: %s", e.stderr.decode(errors="replace"))
+            return
+        except (OSError, ValueError, subprocess.SubprocessError):
+            logger.exception("resampling cost calibration failed; using defaults")
+            return
+        logger.info("calibrated resampling cost model: %s", coefficients)
+        self.coefficients = coefficients
+        self._storeCoefficients(coefficients)
+
+    @staticmethod
+    def measureCoefficients() -> dict:
+        """
+        Run the measurement in the current process. Used by the calibration subprocess.
+        """
+        from pycsdr.modules import Shift, FirDecimate
+
+        sampleRate = 1000000
+        decimation = 8
+        shift = ResamplingCostModel._measure(Shift(0.1), sampleRate) / sampleRate
+        fir = ResamplingCostModel._measure(FirDecimate(decimation, 0.15 / decimation), sampleRate)
+        return {
+            "shift": shift,
+            "fir": fir / (ResamplingCostModel.getTaps(decimation) * sampleRate / decimation),
+        }
+
+    @staticmethod
+    def _measure(module, sampleRate: int, duration: float = 0.5) -> float:
+        """
+        Feed the module at realtime speed and return the CPU seconds spent per second of signal.
+        """
+        from pycsdr.modules import Buffer
+        from pycsdr.types import Format
+
+        source = Buffer(Format.COMPLEX_FLOAT)
+        output = Buffer(Format.COMPLEX_FLOAT)
+        module.setReader(source.getReader())
+        module.setWriter(output)
+        reader = output.getReader()
+
+        def drain():
+            while reader.read() is not None:
+                pass
+
+        thread = threading.Thread(target=drain, daemon=True)
+        thread.start()
+
+        steps = 20
+        block = bytes(int(sampleRate * duration / steps) * 8)
+        # the module runs on its own native thread, so this is process time. the calibration process does nothing
+        # else, and feeding and draining the buffers are part of the cost of a real chain, too.
+        start = time.process_time()
+        wallStart = time.monotonic()
+        for i in range(steps):
+            source.write(block)
+            delay = wallStart + (i + 1) * duration / steps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        cpu = time.process_time() - start
+        module.stop()
+        reader.stop()
+        return cpu / duration
+
+    @staticmethod
+    def getTaps(decimation: float) -> float:
+        # filter length for the transition bandwidth of 0.15 * output rate used throughout the decimation chains
+        return 4 / (0.15 / decimation)
+
+    def getShiftCost(self, inputRate: float) -> float:
+        return self.coefficients["shift"] * inputRate
+
+    def getDecimationCost(self, inputRate: float, decimation: float) -> float:
+        if decimation <= 1:
+            return 0.0
+        return self.coefficients["fir"] * self.getTaps(decimation) * inputRate / decimation
+
+    def getSelectorCost(self, inputRate: float, outputRate: float) -> float:
+        """
+        Cost of a service Selector, which shifts and decimates the input down to the service audio rate.
+        """
+        return self.getShiftCost(inputRate) + self.getDecimationCost(inputRate, inputRate / outputRate)
+
+    def getResamplerCost(self, inputRate: float, outputRate: float) -> float:
+        decimation = int(inputRate / outputRate)
+        return self.getShiftCost(inputRate) + self.getDecimationCost(inputRate, decimation)
+
@@ -93,6 +93,10 @@ class Schedule(ABC):
     def getNextEntry(self):
         pass
 
+    @abstractmethod
+    def getEntryAt(self, dt):
+        pass
+
 
 class TimerangeSchedule(Schedule, metaclass=ABCMeta):
     @abstractmethod
@@ -100,7 +104,10 @@ class TimerangeSchedule(Schedule, metaclass=ABCMeta):
         pass
 
     def getCurrentEntry(self):
-        current = [p for p in self.getEntries() if p.isCurrent(datetime.utcnow())]
+        return self.getEntryAt(datetime.utcnow())
+
+    def getEntryAt(self, dt):
+        current = [p for p in self.getEntries() if p.isCurrent(dt)]
         if current:
             return current[0]
         return None
@@ -206,9 +213,13 @@ class DaylightSchedule(TimerangeSchedule):
 
 
 class ServiceScheduler(SdrSourceEventClient):
+    # sources that support it are told about the next profile this many seconds ahead
+    standbyLeadTime = 30
+
     def __init__(self, source):
         self.source = source
         self.selectionTimer = None
+        self.standbyTimer = None
         self.currentEntry = None
         self.source.addClient(self)
         self.schedule = None
@@ -244,6 +255,29 @@ class ServiceScheduler(SdrSourceEventClient):
     def cancelTimer(self):
         if self.selectionTimer:
             self.selectionTimer.cancel()
+        self.cancelStandbyTimer()
+
+    def cancelStandbyTimer(self):
+        if self.standbyTimer:
+            self.standbyTimer.cancel()
+            self.standbyTimer = None
+
+    def scheduleStandby(self, entry):
+        self.cancelStandbyTimer()
+        end = entry.getScheduledEnd()
+        nextEntry = self.schedule.getEntryAt(end + timedelta(seconds=1))
+        if nextEntry is None or nextEntry.getProfile() == entry.getProfile():
+            return
+        seconds = max((end - datetime.utcnow()).total_seconds() - ServiceScheduler.standbyLeadTime, 0)
+        self.standbyTimer = threading.Timer(seconds, self.prepareProfile, args=(nextEntry.getProfile(),))
+        self.standbyTimer.start()
+
+    def prepareProfile(self, profile):
+        # users keep the source from switching profiles
+        if self.source.hasClients(SdrClientClass.USER):
+            return
+        logger.debug("preparing source for profile %s", profile)
+        self.source.prepareProfile(profile)
 
     def getClientClass(self) -> SdrClientClass:
         if self.currentEntry is None:
@@ -280,6 +314,7 @@ class ServiceScheduler(SdrSourceEventClient):
         if entry is not None:
             logger.debug("selected profile %s until %s", entry.getProfile(), entry.getScheduledEnd())
             self.scheduleSelection(entry.getScheduledEnd())
+            self.scheduleStandby(entry)
 
             try:
                 self.source.activateProfile(entry.getProfile())
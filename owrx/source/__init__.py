@@ -10,7 +10,7 @@ import pkgutil
 from abc import ABC, abstractmethod
 from owrx.command import CommandMapper
 from owrx.socket import getAvailablePort
-from owrx.property import PropertyStack, PropertyLayer, PropertyFilter, PropertyCarousel, PropertyDeleted
+from owrx.property import PropertyStack, PropertyLayer, PropertyFilter, PropertyCarousel, PropertyDeleted, PropertyTransaction
 from owrx.property.filter import ByLambda
 from owrx.form.input import Input, TextInput, NumberInput, CheckboxInput, ModesInput, ExponentialInput, DropdownInput, Option
 from owrx.form.input.converter import Converter, OptionalConverter, IntConverter
@@ -20,6 +20,9 @@ from owrx.form.section import OptionalSection
 from owrx.reporting import ReportingEngine
 from owrx.feature import FeatureDetector
 from owrx.log import LogPipe, HistoryHandler
+from owrx.websocket import WebSocketFrame
+from owrx.affinity import CpuAffinity, CpuClass
+from owrx.metrics import Metrics, HistogramMetric
 from datetime import datetime
 from typing import List
 from enum import Enum
@@ -145,6 +148,7 @@ class SdrSource(ABC):
         self.props.addLayer(1, PropertyFilter(self.profileCarousel, ByLambda(lambda x: x != "name")))
 
         # props from our device config
+        self.deviceProps = props
         self.props.addLayer(2, props)
 
         # the sdr_id is constant, so we put it in a separate layer
@@ -156,7 +160,7 @@ class SdrSource(ABC):
 
         # make sure that when center_freq is changed in the profile,
         # that change gets propagated to the top layer
-        self.profileCarousel.filter("center_freq").wire(self._handleCenterFreqChanged)
+        self.profileCarousel.filter("center_freq").wireDownstream(self.props, self._handleCenterFreqChanged)
 
         self.sdrProps = self.props.filter(*self.getEventNames())
 
@@ -170,6 +174,8 @@ class SdrSource(ABC):
         self.spectrumLock = threading.Lock()
         self.process = None
         self.modificationLock = threading.Lock()
+        # incremented on every stop()
+        self.generation = 0
         self.state = SdrSourceState.STOPPED
         self.enabled = "enabled" not in props or props["enabled"]
         props.filter("enabled").wire(self._handleEnableChanged)
@@ -275,11 +281,19 @@ class SdrSource(ABC):
         try:
             profile_name = self.getProfiles()[profile_id]["name"]
             self.logger.debug("activating profile \"%s\" for \"%s\"", profile_name, self.getName())
-            self.profileCarousel.switch(profile_id)
+            # make the profile and the resulting center_freq change a single event
+            with PropertyTransaction():
+                self.profileCarousel.switch(profile_id)
             self.reportProfileChange()
         except KeyError:
             self.logger.warning("invalid profile %s for sdr %s. ignoring", profile_id, self.getId())
 
+    def prepareProfile(self, profile_id):
+        """
+        Called ahead of a scheduled switch to the given profile. Override in subclasses that can prepare for it.
+        """
+        pass
+
     def setCenterFreq(self, frequency):
         self.props["center_freq"] = frequency
 
@@ -330,7 +344,9 @@ class SdrSource(ABC):
         return self.buffer
 
     def getCommandValues(self):
-        dict = self.sdrProps.__dict__()
+        return self._mapCommandValues(self.sdrProps.__dict__())
+
+    def _mapCommandValues(self, dict):
         if "lfo_offset" in dict and dict["lfo_offset"] is not None:
             dict["tuner_freq"] = dict["center_freq"] + dict["lfo_offset"]
         else:
@@ -356,96 +372,153 @@ class SdrSource(ABC):
             cmd = self.getCommand()
             cmd = [c for c in cmd if c is not None]
 
-            self.stdoutPipe = LogPipe(logging.INFO, self.logger, "STDOUT")
-            self.stderrPipe = LogPipe(logging.WARNING, self.logger, "STDERR")
+            (self.process, self.stdoutPipe, self.stderrPipe, cmd) = self._launchProcess(cmd)
+            self.logger.info("Started sdr source: " + cmd)
+
+            startTime = time.monotonic()
+            generation = self.generation
+            failed = False
+            exited = threading.Event()
+            self.monitor = self._monitorProcess(self.process, self.stdoutPipe, self.stderrPipe, exited)
+            self.monitor.start()
+
+        # wait without holding the lock, so that stop() and other callers are not blocked by a slow device
+        probe = self._waitForPort(exited)
+
+        with self.modificationLock:
+            if self.generation != generation:
+                # stopped while starting up, this is not a failed start
+                if probe is not None:
+                    probe.close()
+                return
+
+            if probe is None or exited.is_set():
+                failed = True
+            else:
+                readyTime = time.monotonic() - startTime
+                self.logger.debug("source ready after %.3fs", readyTime)
+                self._getStartupMetric("startup_time").observe(readyTime)
+                threading.Thread(
+                    target=self._measureFirstSample, args=(probe, startTime), name="source_probe", daemon=True
+                ).start()
+
+            if not failed:
+                try:
+                    self.postStart()
+                except Exception:
+                    self.logger.exception("Exception during postStart()")
+                    failed = True
+
+        # count startup retries
+        self.retryCount = self.retryCount + 1
+
+        if not failed:
+            # startup succeeded
+            if self.retryCount > 1:
+                self.logger.debug("Source running after {0} start attempts.".format(self.retryCount))
+            self.setState(SdrSourceState.RUNNING)
+            self.retryCount = 0
+        elif self.retryCount < self.maxRetries:
+            # startup failed, retry in a minute
+            self.logger.debug("Source start attempt {0}/{1} failed.".format(self.retryCount, self.maxRetries))
+            self._scheduleRestart()
+        else:
+            # startup repeatedly failed, consider device failed
+            self.logger.debug("Source repeatedly failed to start, writing it off.")
+            self.fail()
+
+    def _launchProcess(self, cmd: list):
+        """
+        Starts the given commands, piped into each other. Returns the process, its log pipes and the command line.
+        """
+        stdoutPipe = LogPipe(logging.INFO, self.logger, "STDOUT")
+        stderrPipe = LogPipe(logging.WARNING, self.logger, "STDERR")
 
-            # don't use shell mode for commands without piping
+        # don't use shell mode for commands without piping
+        # the sdr processes inherit the realtime cpu affinity from this thread
+        with CpuAffinity.getSharedInstance().scope(CpuClass.REALTIME):
             if len(cmd) > 1:
                 # multiple commands with pipes
                 cmd = "|".join(cmd)
-                self.process = subprocess.Popen(
+                process = subprocess.Popen(
                     cmd,
                     shell=True,
                     start_new_session=True,
-                    stdout=self.stdoutPipe,
-                    stderr=self.stderrPipe
+                    stdout=stdoutPipe,
+                    stderr=stderrPipe
                 )
             else:
                 # single command
                 cmd = cmd[0]
                 # start_new_session can go as soon as there's no piped commands left
                 # the os.killpg call must be replaced with something more reasonable at the same time
-                self.process = subprocess.Popen(
+                process = subprocess.Popen(
                     shlex.split(cmd),
                     start_new_session=True,
-                    stdout=self.stdoutPipe,
-                    stderr=self.stderrPipe
+                    stdout=stdoutPipe,
+                    stderr=stderrPipe
                 )
-            self.logger.info("Started sdr source: " + cmd)
-
-            available = False
-            failed = False
-
-            def wait_for_process_to_end():
-                nonlocal failed
-                rc = self.process.wait()
-                self.logger.debug("shut down with RC={0}".format(rc))
+        return process, stdoutPipe, stderrPipe, cmd
+
+    def _monitorProcess(self, process, stdoutPipe, stderrPipe, exited: threading.Event) -> threading.Thread:
+        def wait_for_process_to_end():
+            rc = process.wait()
+            self.logger.debug("shut down with RC={0}".format(rc))
+            stdoutPipe.close()
+            stderrPipe.close()
+            # processes that have been replaced, or have not been adopted yet, end silently
+            if self.process is process:
                 self.process = None
                 self.monitor = None
-                self.stdoutPipe.close()
                 self.stdoutPipe = None
-                self.stderrPipe.close()
                 self.stderrPipe = None
                 if self.getState() is SdrSourceState.RUNNING:
                     self.fail()
-                else:
-                    failed = True
                 self.setState(SdrSourceState.STOPPED)
+            exited.set()
 
-            self.monitor = threading.Thread(target=wait_for_process_to_end, name="source_monitor")
-            self.monitor.start()
-
-            retries = 1000
-            while retries > 0 and not failed:
-                retries -= 1
-                if self.monitor is None:
-                    break
-                testsock = socket.socket()
-                testsock.settimeout(1)
-                try:
-                    testsock.connect(("127.0.0.1", self.getPort()))
-                    testsock.close()
-                    available = True
-                    break
-                except:
-                    time.sleep(0.1)
-
-            if not available:
-                failed = True
+        # not started yet, so that it can be stored before the process has a chance to end
+        return threading.Thread(target=wait_for_process_to_end, name="source_monitor")
 
+    def _waitForPort(self, exited: threading.Event, timeout: float = 100, port: int = None):
+        """
+        Waits for the sdr process to accept connections on its port. Retries with an increasing interval, starting
+        small so that fast devices are available almost immediately. Returns the connected socket, or None if the
+        process has ended or did not become ready in time.
+        """
+        delay = 0.005
+        deadline = time.monotonic() + timeout
+        while not exited.is_set() and time.monotonic() < deadline:
             try:
-                self.postStart()
-            except Exception:
-                self.logger.exception("Exception during postStart()")
-                failed = True
+                return socket.create_connection(("127.0.0.1", self.getPort() if port is None else port), timeout=1)
+            except OSError:
+                pass
+            # wakes up immediately if the process ends
+            exited.wait(delay)
+            delay = min(delay * 2, 0.5)
+        return None
 
-        # count startup retries
-        self.retryCount = self.retryCount + 1
+    def _getDeviceType(self):
+        return self.props["type"] if "type" in self.props else type(self).__name__.lower()
 
-        if not failed:
-            # startup succeeded
-            if self.retryCount > 1:
-                self.logger.debug("Source running after {0} start attempts.".format(self.retryCount))
-            self.setState(SdrSourceState.RUNNING)
-            self.retryCount = 0
-        elif self.retryCount < self.maxRetries:
-            # startup failed, retry in a minute
-            self.logger.debug("Source start attempt {0}/{1} failed.".format(self.retryCount, self.maxRetries))
-            self._scheduleRestart()
-        else:
-            # startup repeatedly failed, consider device failed
-            self.logger.debug("Source repeatedly failed to start, writing it off.")
-            self.fail()
+    def _getStartupMetric(self, name: str):
+        return Metrics.getSharedInstance().getOrAddMetric(
+            "sdr.{0}.{1}".format(self._getDeviceType(), name),
+            lambda: HistogramMetric([0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]),
+        )
+
+    def _measureFirstSample(self, probe: socket.socket, startTime: float):
+        # the sdr process sends samples to every connected client, so the first byte on the probe is the first sample
+        try:
+            probe.settimeout(60)
+            if probe.recv(1):
+                duration = time.monotonic() - startTime
+                self.logger.debug("first sample received after %.3fs", duration)
+                self._getStartupMetric("time_to_first_sample").observe(duration)
+        except OSError:
+            pass
+        finally:
+            probe.close()
 
     def preStart(self):
         """
@@ -475,6 +548,8 @@ class SdrSource(ABC):
         with self.modificationLock:
             # make sure we do not restart after stop
             self._cancelRestart()
+            # tells a start() in progress that it has been cancelled
+            self.generation += 1
 
             if self.process is not None:
                 self.setState(SdrSourceState.STOPPING)
@@ -572,8 +647,13 @@ class SdrSource(ABC):
                 self.spectrumThread = None
 
     def writeSpectrumData(self, data):
-        for c in self.spectrumClients:
-            c.write_spectrum_data(data)
+        clients = self.spectrumClients.copy()
+        if not clients:
+            return
+        # encode the websocket frame once and share it with all spectrum clients
+        frame = WebSocketFrame(data, prefix=b"\x01", key=0x01)
+        for c in clients:
+            c.write_spectrum_frame(frame)
 
     def getState(self) -> SdrSourceState:
         return self.state
@@ -1,31 +1,198 @@
 from abc import ABCMeta
 from owrx.source import SdrSource, SdrDeviceDescription
+from owrx.socket import getAvailablePort
+from owrx.property import PropertyStack, PropertyFilter
+from owrx.property.filter import ByLambda
+from owrx.form.input import Input, CheckboxInput
 from csdr.chain import Chain
-from typing import Optional
-from pycsdr.modules import Buffer
+from typing import Optional, List
+from pycsdr.modules import Buffer, TcpSource
 from pycsdr.types import Format
+import threading
+import signal
+import os
+
+
+class StandbyProcess(object):
+    """
+    A source process started ahead of a profile change, waiting to replace the running process.
+    """
+    def __init__(self, profileId, values: dict, port: int):
+        self.profileId = profileId
+        self.values = values
+        self.port = port
+        self.process = None
+        self.stdoutPipe = None
+        self.stderrPipe = None
+        self.monitor = None
+        self.exited = threading.Event()
+        self.ready = threading.Event()
+
+    def isReady(self):
+        return self.ready.is_set() and not self.exited.is_set()
+
+    def kill(self):
+        try:
+            os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
+        except (ProcessLookupError, AttributeError):
+            pass
 
 
 class DirectSource(SdrSource, metaclass=ABCMeta):
+    # unused standby processes are stopped after this many seconds
+    standbyTimeout = 120
+
     def __init__(self, id, props):
         self._conversion = None
+        self._tcpBuffer = None
+        self.standby = None
+        self.standbyLock = threading.Lock()
         super().__init__(id, props)
 
+    def getRetunableKeys(self) -> set:
+        """
+        Properties that retune() can apply to the running process. Override in subclasses whose tools can be
+        controlled while running.
+        """
+        return set()
+
+    def retune(self, changes):
+        pass
+
     def onPropertyChange(self, changes):
+        if set(changes.keys()) <= self.getRetunableKeys():
+            # a stopped source picks up the new values on the next start
+            if self.isAvailable():
+                self.logger.debug("retuning sdr source: {0}".format(changes))
+                self.retune(changes)
+            return
+        if self.isAvailable() and self._adoptStandby():
+            return
         self.logger.debug("restarting sdr source due to property changes: {0}".format(changes))
         self.stop()
         self.sleepOnRestart()
         self.start()
 
+    def isWarmStandbyEnabled(self):
+        return "warm_standby" in self.props and self.props["warm_standby"]
+
+    def _getProfileCommandValues(self, profile_id):
+        props = PropertyStack()
+        props.addLayer(0, PropertyFilter(self.getProfiles()[profile_id], ByLambda(lambda x: x != "name")))
+        props.addLayer(1, self.deviceProps)
+        return self._mapCommandValues(props.filter(*self.getEventNames()).__dict__())
+
+    def prepareProfile(self, profile_id):
+        if not self.isWarmStandbyEnabled() or not self.isAvailable():
+            return
+        try:
+            values = self._getProfileCommandValues(profile_id)
+        except KeyError:
+            return
+        current = self.getCommandValues()
+        changed = {k for k in set(values.keys()) | set(current.keys()) if values.get(k) != current.get(k)}
+        if changed <= self.getRetunableKeys():
+            # no new process required
+            return
+        standby = StandbyProcess(profile_id, values, getAvailablePort())
+        with self.standbyLock:
+            self._discardStandby()
+            self.standby = standby
+        threading.Thread(target=self._launchStandby, args=(standby,), name="source_standby", daemon=True).start()
+
+    def _launchStandby(self, standby: StandbyProcess):
+        cmd = [c for c in self.getStandbyCommand(standby.values, standby.port) if c is not None]
+        with self.standbyLock:
+            if self.standby is not standby:
+                return
+            (standby.process, standby.stdoutPipe, standby.stderrPipe, cmd) = self._launchProcess(cmd)
+            standby.monitor = self._monitorProcess(
+                standby.process, standby.stdoutPipe, standby.stderrPipe, standby.exited
+            )
+            standby.monitor.start()
+        self.logger.info("Started standby sdr source for profile {0}: {1}".format(standby.profileId, cmd))
+
+        probe = self._waitForPort(standby.exited, port=standby.port)
+        if probe is None:
+            self.logger.warning("standby sdr source for profile %s did not start", standby.profileId)
+            with self.standbyLock:
+                if self.standby is standby:
+                    self._discardStandby()
+            return
+        probe.close()
+        standby.ready.set()
+
+        timer = threading.Timer(self.standbyTimeout, self._expireStandby, args=(standby,))
+        timer.daemon = True
+        timer.start()
+
+    def _expireStandby(self, standby: StandbyProcess):
+        with self.standbyLock:
+            if self.standby is standby:
+                self.logger.debug("standby sdr source for profile %s has not been used", standby.profileId)
+                self._discardStandby()
+
+    def _discardStandby(self):
+        # must be called with the standbyLock held
+        if self.standby is not None:
+            self.standby.kill()
+            self.standby = None
+
+    def _adoptStandby(self) -> bool:
+        """
+        Replaces the running process with the standby process, if it has been started with the current values.
+        The buffer stays in place, so that its readers keep running and only miss the samples in between.
+        """
+        with self.standbyLock:
+            standby = self.standby
+            if standby is None:
+                return False
+            self.standby = None
+            if not standby.isReady() or standby.values != self.getCommandValues():
+                standby.kill()
+                return False
+
+        with self.modificationLock:
+            if self.monitor is None:
+                standby.kill()
+                return False
+            oldProcess = self.process
+            self.process = standby.process
+            self.stdoutPipe = standby.stdoutPipe
+            self.stderrPipe = standby.stderrPipe
+            self.monitor = standby.monitor
+            self.port = standby.port
+            if self.tcpSource is not None:
+                self.tcpSource.stop()
+                self.tcpSource = TcpSource(self.port, self._getTcpSourceFormat())
+                self.tcpSource.setWriter(self._tcpBuffer)
+
+        # the monitor of the replaced process ends silently
+        try:
+            os.killpg(os.getpgid(oldProcess.pid), signal.SIGTERM)
+        except (ProcessLookupError, AttributeError):
+            pass
+        self.logger.info("switched to standby sdr source for profile %s", standby.profileId)
+        return True
+
+    def stop(self):
+        with self.standbyLock:
+            self._discardStandby()
+        super().stop()
+        self._tcpBuffer = None
+
     def nmux_memory(self):
         # in megabytes. This sets the approximate size of the circular buffer used by nmux.
         return 50
 
-    def getNmuxCommand(self):
-        props = self.sdrProps
+    def getNmuxCommand(self, port: int = None, sampleRate: int = None):
+        if port is None:
+            port = self.port
+        if sampleRate is None:
+            sampleRate = self.sdrProps["samp_rate"]
 
         nmux_bufcnt = nmux_bufsize = 0
-        while nmux_bufsize < props["samp_rate"] / 4:
+        while nmux_bufsize < sampleRate / 4:
             nmux_bufsize += 4096
         while nmux_bufsize * nmux_bufcnt < self.nmux_memory() * 1e6:
             nmux_bufcnt += 1
@@ -37,13 +204,16 @@ class DirectSource(SdrSource, metaclass=ABCMeta):
             % (
                 nmux_bufsize,
                 nmux_bufcnt,
-                self.port,
+                port,
             )
         ]
 
     def getCommand(self):
         return super().getCommand() + self.getNmuxCommand()
 
+    def getStandbyCommand(self, values: dict, port: int):
+        return [self.getCommandMapper().map(values)] + self.getNmuxCommand(port, values["samp_rate"])
+
     # override this in subclasses, if necessary
     def getFormatConversion(self) -> Optional[Chain]:
         return None
@@ -61,6 +231,7 @@ class DirectSource(SdrSource, metaclass=ABCMeta):
             source = self._getTcpSource()
             buffer = Buffer(source.getOutputFormat())
             source.setWriter(buffer)
+            self._tcpBuffer = buffer
             self._conversion = self.getFormatConversion()
             if self._conversion is not None:
                 self._conversion.setReader(buffer.getReader())
@@ -72,4 +243,16 @@ class DirectSource(SdrSource, metaclass=ABCMeta):
 
 
 class DirectSourceDeviceDescription(SdrDeviceDescription):
-    pass
+    def getInputs(self) -> List[Input]:
+        return super().getInputs() + [
+            CheckboxInput(
+                "warm_standby",
+                "Prepare scheduled profile changes in advance",
+                infotext="Starts a second instance of the device software shortly before the scheduler changes the"
+                + " profile, so that background services continue with a minimal gap. Only enable this if the"
+                + " device can be opened by more than one process at a time.",
+            ),
+        ]
+
+    def getDeviceOptionalKeys(self):
+        return super().getDeviceOptionalKeys() + ["warm_standby"]
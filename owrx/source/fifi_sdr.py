@@ -46,9 +46,11 @@ class FifiSdrSource(DirectSource):
         values = self.getCommandValues()
         self.sendRockProgFrequency(values["tuner_freq"])
 
-    def onPropertyChange(self, changes):
-        if "center_freq" in changes:
-            self.sendRockProgFrequency(changes["center_freq"])
+    def getRetunableKeys(self) -> set:
+        return {"center_freq", "lfo_offset"}
+
+    def retune(self, changes):
+        self.sendRockProgFrequency(self.getCommandValues()["tuner_freq"])
 
 
 class FifiSdrDeviceDescription(DirectSourceDeviceDescription):
@@ -3,7 +3,6 @@ from csdr.module import ThreadModule
 from pycsdr.types import Format
 from datetime import datetime
 import base64
-import pickle
 import os
 
 import logging
@@ -85,6 +84,9 @@ class SstvParser(DataRecorder, ThreadModule):
             " at %dkHz" % (self.frequency // 1000) if self.frequency>0 else ""
         )
 
+    def producesMessages(self) -> bool:
+        return True
+
     def run(self):
         logger.debug("%s starting..." % self.myName())
         # Run while there is input data
@@ -102,7 +104,7 @@ class SstvParser(DataRecorder, ThreadModule):
             # Keep processing while there is input to parse
             while out is not None:
                 if len(out)>0:
-                    self.writer.write(pickle.dumps(out))
+                    self.writeMessages([out])
                 out = self.process()
         # We are done
         logger.debug("%s exiting..." % self.myName())
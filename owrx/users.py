@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from owrx.config.core import CoreConfig
+from owrx.watcher import FileWatcher
 from datetime import datetime, timezone
 import json
 import hashlib
@@ -139,8 +140,17 @@ class UserList(object):
     def __init__(self):
         self.file_modified = None
         self.users = {}
+        # the file is only checked after the watcher has seen a change
+        self.changed = True
+        self.watch = FileWatcher.getSharedInstance().watch([self._getUsersFile()], self._onFileChange)
+
+    def _onFileChange(self):
+        self.changed = True
 
     def refresh(self):
+        if not self.changed:
+            return
+        self.changed = False
         if self.file_modified is None or self._getUsersFileModifiedTimestamp() > self.file_modified:
             logger.debug("reloading users from disk due to file modification")
             self.users = self._loadUsers()
@@ -194,6 +204,7 @@ class UserList(object):
             os.chmod(usersFile, stat.S_IWUSR + stat.S_IRUSR)
         except Exception:
             logger.exception("error while writing users file %s", usersFile)
+        self.changed = True
         self.refresh()
 
     def _getUsername(self, user):
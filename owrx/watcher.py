@@ -0,0 +1,216 @@
+from select import select
+import ctypes
+import ctypes.util
+import threading
+import struct
+import time
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FileWatch(object):
+    """
+    Subscription for changes to a set of files or directories. Directories also report changes to their entries.
+    """
+    def __init__(self, watcher: "FileWatcher", paths: list, callback: callable):
+        self.watcher = watcher
+        self.paths = [os.path.abspath(p) for p in paths]
+        self.callback = callback
+        self.signature = None
+
+    def getDirectories(self) -> set:
+        # files are watched through their directory, so that they can be created, replaced or deleted
+        result = set()
+        for p in self.paths:
+            result.add(os.path.dirname(p))
+            if os.path.isdir(p):
+                result.add(p)
+        return result
+
+    def matches(self, directory: str, name: str) -> bool:
+        if not name:
+            return directory in self.getDirectories()
+        return directory in self.paths or os.path.join(directory, name) in self.paths
+
+    def getSignature(self) -> tuple:
+        result = []
+        for p in self.paths:
+            try:
+                st = os.stat(p)
+                result.append((st.st_mtime_ns, st.st_size))
+                if os.path.isdir(p):
+                    with os.scandir(p) as entries:
+                        result.append(tuple(sorted((e.name, e.stat().st_mtime_ns) for e in entries)))
+            except OSError:
+                result.append(None)
+        return tuple(result)
+
+    def call(self):
+        try:
+            self.callback()
+        except Exception:
+            logger.exception("Error while calling file watch callback")
+
+    def cancel(self):
+        self.watcher.removeWatch(self)
+
+
+class FileWatcher(object):
+    """
+    Notifies about file changes. Uses inotify where available, and polls files for changes otherwise, as well as
+    for directories that do not exist (yet). Callbacks run on the watcher thread.
+    """
+    sharedInstance = None
+    creationLock = threading.Lock()
+
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x1000000
+
+    eventMask = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | \
+        IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+    # wd, mask, cookie, name length
+    eventHeader = struct.Struct("iIII")
+
+    @staticmethod
+    def getSharedInstance():
+        with FileWatcher.creationLock:
+            if FileWatcher.sharedInstance is None:
+                FileWatcher.sharedInstance = FileWatcher()
+        return FileWatcher.sharedInstance
+
+    def __init__(self, pollInterval: float = 5.0):
+        self.pollInterval = pollInterval
+        # time to wait for more events after the first one, so that bursts of changes cause a single callback
+        self.settleTime = 0.1
+        self.watches = []
+        # directory -> watch descriptor, and back
+        self.descriptors = {}
+        self.directories = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.libc = None
+        self.fd = self._initInotify()
+
+    def _initInotify(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+            self.libc = libc
+            return fd
+        except (OSError, AttributeError):
+            logger.info("inotify is not available, polling files for changes every %is", self.pollInterval)
+            return None
+
+    def watch(self, paths: list, callback: callable) -> FileWatch:
+        watch = FileWatch(self, paths, callback)
+        watch.signature = watch.getSignature()
+        with self.lock:
+            self.watches.append(watch)
+            self._updateDescriptors()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="FileWatcher", daemon=True)
+                self.thread.start()
+        return watch
+
+    def removeWatch(self, watch: FileWatch):
+        with self.lock:
+            if watch in self.watches:
+                self.watches.remove(watch)
+                self._updateDescriptors()
+
+    def _updateDescriptors(self) -> set:
+        """
+        Add inotify watches for all directories that exist now, remove the ones no longer needed.
+        Returns the newly watched directories, which may have changed while they were not being watched.
+        """
+        if self.fd is None:
+            return set()
+        wanted = set()
+        for w in self.watches:
+            wanted |= w.getDirectories()
+        for directory in set(self.descriptors.keys()) - wanted:
+            self.libc.inotify_rm_watch(self.fd, self.descriptors[directory])
+            del self.directories[self.descriptors.pop(directory)]
+        added = set()
+        for directory in wanted - set(self.descriptors.keys()):
+            if not os.path.isdir(directory):
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), FileWatcher.eventMask)
+            if wd < 0:
+                logger.debug("could not watch %s, polling instead", directory)
+                continue
+            self.descriptors[directory] = wd
+            self.directories[wd] = directory
+            added.add(directory)
+        return added
+
+    def _isPolled(self, watch: FileWatch) -> bool:
+        return any(d not in self.descriptors for d in watch.getDirectories())
+
+    def _readEvents(self) -> set:
+        changed = set()
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            (wd, mask, cookie, length) = FileWatcher.eventHeader.unpack_from(data, offset)
+            offset += FileWatcher.eventHeader.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & FileWatcher.IN_Q_OVERFLOW:
+                # events were lost, so everything may have changed
+                changed |= set(self.watches)
+                continue
+            directory = self.directories.get(wd)
+            if directory is None:
+                continue
+            if mask & FileWatcher.IN_IGNORED:
+                # directory is gone, it will be polled until it exists again
+                del self.directories[wd]
+                del self.descriptors[directory]
+            changed |= {w for w in self.watches if w.matches(directory, name)}
+        return changed
+
+    def run(self):
+        lastPoll = time.monotonic()
+        while True:
+            changed = set()
+            if self.fd is not None and select([self.fd], [], [], self.pollInterval)[0]:
+                time.sleep(self.settleTime)
+                with self.lock:
+                    # read until all events of the burst are consumed
+                    while select([self.fd], [], [], 0)[0]:
+                        changed |= self._readEvents()
+            elif self.fd is None:
+                time.sleep(self.pollInterval)
+
+            with self.lock:
+                added = self._updateDescriptors()
+                changed |= {w for w in self.watches if w.getDirectories() & added}
+                if time.monotonic() - lastPoll >= self.pollInterval:
+                    lastPoll = time.monotonic()
+                    for w in self.watches:
+                        if self._isPolled(w) or w in changed:
+                            signature = w.getSignature()
+                            if signature != w.signature:
+                                changed.add(w)
+                            w.signature = signature
+
+            for w in changed:
+                w.call()
@@ -1,15 +1,18 @@
 from owrx.config.core import CoreConfig
 from owrx.config import Config
 from owrx.reporting import ReportingEngine
+from owrx.web.columnar import ColumnarTable, ColumnarFormatError
 from datetime import datetime
 from random import randint
 
 import random
+import bisect
 import urllib
 import threading
 import logging
 import json
 import os
+import re
 import time
 
 logger = logging.getLogger(__name__)
@@ -23,13 +26,40 @@ class WebAgent(object):
         self.dataName = dataName
         self.errorCount = 0
         self.maxErrors = 5
-        self.data = self.loadData(self._getCachedDatabaseFile())
+        # data is loaded on first use
+        self._data = None
+        self.loadLock = threading.Lock()
         self.freshData = False
+        # bumped whenever the data is replaced
+        self.version = 0
+
+    # Current data, loaded and indexed on first access
+    @property
+    def data(self):
+        if self._data is None:
+            with self.loadLock:
+                if self._data is None:
+                    data = self.loadData(self._getCachedDatabaseFile())
+                    self._indexData(data)
+                    self._data = data
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self.version += 1
+
+    def getVersion(self):
+        return self.version
 
     # Get name of the cached database file
     def _getCachedDatabaseFile(self):
         return "{0}/{1}".format(CoreConfig().get_data_directory(), self.dataName)
 
+    # Get name of the binary database cache, kept next to the JSON file
+    def _getBinaryCacheFile(self, file: str):
+        return re.sub(r"\.json$", "", file) + ".bin"
+
     # Fake generic User-Agent, since at least KiwiSDR website likes that
     def _openUrl(self, url: str):
         hdrs = { "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:135.0) Gecko/20100101 Firefox/" + str(randint(100, 135)) + ".0" }
@@ -107,27 +137,52 @@ class WebAgent(object):
                 # Optionally sort loaded data
                 data = self._sortData(data)
                 # Save parsed data into a file
-                self.saveData(self._getCachedDatabaseFile(), data)
+                data = self.saveData(self._getCachedDatabaseFile(), data)
                 # Update current database
                 with self.lock:
                     self.data = data
+                    self._indexData(data)
                     self.freshData = True
                 return True
         # No refresh done
         return False
 
-    # Save database to a given JSON file.
+    # Save database to a given JSON file, plus its binary cache.
+    # Returns the data as a table, mapped from the cache if possible.
     def saveData(self, file: str, data):
         logger.info("Saving {0} items to '{1}'...".format(len(data), file))
         try:
             with open(file, "w") as f:
-                json.dump(data, f, indent=2)
+                json.dump(list(data), f, indent=2)
                 f.close()
         except Exception as e:
             logger.error("saveData() exception: {0}".format(e))
+        return self._saveCache(file, data)
 
-    # Load database from a given JSON file.
+    # Write the binary cache for a JSON file and load it back.
+    def _saveCache(self, file: str, data):
+        table = data if isinstance(data, ColumnarTable) else ColumnarTable.fromRows(data)
+        cache = self._getBinaryCacheFile(file)
+        try:
+            table.save(cache)
+            return ColumnarTable.load(cache)
+        except Exception as e:
+            logger.error("_saveCache() exception: {0}".format(e))
+            return table
+
+    # Load database from the binary cache if it is up to date, or from
+    # a given JSON file otherwise.
     def loadData(self, file: str):
+        cache = self._getBinaryCacheFile(file)
+        # JSON file remains the master copy, so that it can be replaced or deleted to import or reset data
+        if os.path.isfile(file) and os.path.isfile(cache) and os.path.getmtime(cache) >= os.path.getmtime(file):
+            try:
+                result = ColumnarTable.load(cache)
+                logger.info("Loaded {0} items from '{1}'...".format(len(result), cache))
+                return result
+            except (OSError, ValueError, KeyError, ColumnarFormatError) as e:
+                logger.warning("Ignoring binary cache '{0}': {1}".format(cache, e))
+
         logger.info("Loading items from '{0}'...".format(file))
         if not os.path.isfile(file):
             result = []
@@ -141,9 +196,11 @@ class WebAgent(object):
                 result = []
         # Optionally sort loaded data
         result = self._sortData(result)
-        # Done
         logger.info("Loaded {0} items from '{1}'...".format(len(result), file))
-        return result
+        # Convert to the binary format for the next time
+        if not result:
+            return ColumnarTable.fromRows(result)
+        return self._saveCache(file, result)
 
     # Report data download
     def report(self, source: str, numEntries: int):
@@ -163,6 +220,11 @@ class WebAgent(object):
         # Fill in with your own method
         return data
 
+    # Optionally build search structures whenever the data changes
+    def _indexData(self, data):
+        # Fill in with your own method
+        pass
+
     # Scrape web site(s) for data
     def _loadFromWeb(self):
         # Fill in your own method
@@ -170,24 +232,8 @@ class WebAgent(object):
 
     # Search sorted frequency list via bisection
     def _bisect_left(self, freq):
-        lo = 0
-        hi = len(self.data)
-        while lo < hi:
-            x = (lo + hi) // 2
-            if self.data[x]["freq"] < freq:
-                lo = x + 1
-            else:
-                hi = x
-        return lo
+        return bisect.bisect_left(self.data.column("freq"), freq) if len(self.data) else 0
 
     # Search sorted frequency list via bisection
     def _bisect_right(self, freq):
-        lo = 0
-        hi = len(self.data)
-        while lo < hi:
-            x = (lo + hi) // 2
-            if freq < self.data[x]["freq"]:
-                hi = x
-            else:
-                lo = x + 1
-        return lo
+        return bisect.bisect_right(self.data.column("freq"), freq) if len(self.data) else 0
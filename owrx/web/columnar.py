@@ -0,0 +1,270 @@
+from array import array
+from collections.abc import Sequence
+
+import mmap
+import json
+import struct
+import sys
+import os
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ColumnarFormatError(Exception):
+    pass
+
+
+class ColumnarTable(Sequence):
+    """
+    Read-only table of records, stored column by column. Integer and float columns are typed arrays, everything
+    else is stored as an index into a table of interned strings. Tables can be saved to a binary file and loaded
+    from it through mmap, so that only the pages actually used are read into memory.
+
+    Rows are returned as new dicts, containing the same keys as the records the table was built from.
+    """
+    magic = b"OWRXCOL\0"
+    version = 1
+    # magic, version, header length
+    prefix = struct.Struct("=8sII")
+
+    # column types: 64 bit integers, doubles, interned strings and interned json for any other value
+    INT = "q"
+    FLOAT = "d"
+    STRING = "s"
+    JSON = "j"
+
+    @staticmethod
+    def fromRows(rows: list):
+        strings = StringTableBuilder()
+        names = []
+        for row in rows:
+            for name in row.keys():
+                if name not in names:
+                    names.append(name)
+
+        columns = {}
+        masks = {}
+        for name in names:
+            values = [row.get(name, None) for row in rows]
+            present = [name in row for row in rows]
+            kind = ColumnarTable._getType([v for v, p in zip(values, present) if p])
+            if kind in (ColumnarTable.INT, ColumnarTable.FLOAT):
+                columns[name] = (kind, array(kind, (v if p else 0 for v, p in zip(values, present))))
+                if not all(present):
+                    masks[name] = array("b", present)
+            elif kind == ColumnarTable.STRING:
+                columns[name] = (kind, array("i", (strings.add(v) if p else -1 for v, p in zip(values, present))))
+            else:
+                columns[name] = (
+                    kind,
+                    array("i", (strings.add(json.dumps(v)) if p else -1 for v, p in zip(values, present)))
+                )
+
+        return ColumnarTable(len(rows), names, columns, masks, strings.build())
+
+    @staticmethod
+    def _getType(values: list) -> str:
+        # bool is a subclass of int, but should survive the round trip as a bool
+        if all(type(v) is int for v in values):
+            return ColumnarTable.INT
+        # coordinates often mix both. they are stored as floats, which is equivalent in json.
+        if all(type(v) in (int, float) for v in values):
+            return ColumnarTable.FLOAT
+        if all(type(v) is str for v in values):
+            return ColumnarTable.STRING
+        return ColumnarTable.JSON
+
+    @staticmethod
+    def load(file: str):
+        with open(file, "rb") as f:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ColumnarFormatError("empty file")
+        view = memoryview(buffer)
+        if len(view) < ColumnarTable.prefix.size:
+            raise ColumnarFormatError("file too short")
+        (magic, version, headerLength) = ColumnarTable.prefix.unpack_from(view)
+        if magic != ColumnarTable.magic:
+            raise ColumnarFormatError("not a columnar table")
+        if version != ColumnarTable.version:
+            raise ColumnarFormatError("unsupported version {0}".format(version))
+        start = ColumnarTable.prefix.size
+        header = json.loads(bytes(view[start:start + headerLength]).decode("utf-8"))
+        if header["byteorder"] != sys.byteorder:
+            raise ColumnarFormatError("byte order mismatch")
+
+        def section(descriptor, kind):
+            (offset, length) = descriptor
+            return view[offset:offset + length].cast(kind)
+
+        columns = {}
+        masks = {}
+        for c in header["columns"]:
+            storage = "i" if c["type"] in (ColumnarTable.STRING, ColumnarTable.JSON) else c["type"]
+            columns[c["name"]] = (c["type"], section(c["data"], storage))
+            if c["mask"] is not None:
+                masks[c["name"]] = section(c["mask"], "b")
+        strings = StringTable(section(header["strings"]["offsets"], "q"), section(header["strings"]["blob"], "B"))
+        return ColumnarTable(header["rows"], [c["name"] for c in header["columns"]], columns, masks, strings, buffer)
+
+    def __init__(self, rows: int, names: list, columns: dict, masks: dict, strings: "StringTable", buffer=None):
+        self.rows = rows
+        self.names = names
+        self.columns = columns
+        self.masks = masks
+        self.strings = strings
+        # keeps the mapped file alive as long as the table is in use
+        self.buffer = buffer
+
+    def save(self, file: str):
+        sections = []
+        position = 0
+
+        def addSection(data):
+            nonlocal position
+            # keep all typed sections aligned
+            position += -position % 8
+            descriptor = [position, len(data)]
+            sections.append((position, data))
+            position += len(data)
+            return descriptor
+
+        columns = []
+        for name in self.names:
+            (kind, values) = self.columns[name]
+            columns.append({
+                "name": name,
+                "type": kind,
+                "data": addSection(memoryview(values).cast("B")),
+                "mask": addSection(memoryview(self.masks[name]).cast("B")) if name in self.masks else None,
+            })
+        strings = {
+            "offsets": addSection(memoryview(self.strings.offsets).cast("B")),
+            "blob": addSection(self.strings.blob),
+        }
+        # sections are placed after the header, whose size depends on the offsets it contains
+        base = 0
+        while True:
+            header = {
+                "rows": self.rows,
+                "byteorder": sys.byteorder,
+                "columns": [
+                    dict(c, data=self._shift(c["data"], base), mask=self._shift(c["mask"], base)) for c in columns
+                ],
+                "strings": {k: self._shift(v, base) for k, v in strings.items()},
+            }
+            encoded = json.dumps(header).encode("utf-8")
+            required = ColumnarTable.prefix.size + len(encoded)
+            required += -required % 8
+            if required <= base:
+                break
+            base = required
+
+        temporary = file + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(ColumnarTable.prefix.pack(ColumnarTable.magic, ColumnarTable.version, len(encoded)))
+            f.write(encoded)
+            for offset, data in sections:
+                f.seek(base + offset)
+                f.write(data)
+        # replace atomically, so that a table that is currently mapped keeps its contents
+        os.replace(temporary, file)
+
+    @staticmethod
+    def _shift(descriptor, base):
+        if descriptor is None:
+            return None
+        return [descriptor[0] + base, descriptor[1]]
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._getRow(i) for i in range(*index.indices(self.rows))]
+        if index < 0:
+            index += self.rows
+        if not 0 <= index < self.rows:
+            raise IndexError("row index out of range")
+        return self._getRow(index)
+
+    def _getRow(self, index: int) -> dict:
+        row = {}
+        for name in self.names:
+            (present, value) = self._getValue(name, index)
+            if present:
+                row[name] = value
+        return row
+
+    def _getValue(self, name: str, index: int):
+        (kind, values) = self.columns[name]
+        if kind in (ColumnarTable.INT, ColumnarTable.FLOAT):
+            if name in self.masks and not self.masks[name][index]:
+                return False, None
+            return True, values[index]
+        i = values[index]
+        if i < 0:
+            return False, None
+        if kind == ColumnarTable.STRING:
+            return True, self.strings[i]
+        return True, self.strings.getJson(i)
+
+    def get(self, index: int, name: str, default=None):
+        if name not in self.columns:
+            return default
+        (present, value) = self._getValue(name, index)
+        return value if present else default
+
+    def column(self, name: str) -> Sequence:
+        """
+        All values of a column, without building rows. Numeric columns without missing values are returned as
+        typed, zero-copy sequences. Missing values are None.
+        """
+        (kind, values) = self.columns[name]
+        if kind in (ColumnarTable.INT, ColumnarTable.FLOAT) and name not in self.masks:
+            return values
+        return [self._getValue(name, i)[1] for i in range(self.rows)]
+
+    def copy(self) -> list:
+        return list(self)
+
+
+class StringTable(object):
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+        # decoded strings, so that every string is only decoded once and shared between rows
+        self.cache = [None] * (len(offsets) - 1)
+
+    def __getitem__(self, index: int) -> str:
+        value = self.cache[index]
+        if value is None:
+            value = self.cache[index] = bytes(self.blob[self.offsets[index]:self.offsets[index + 1]]).decode("utf-8")
+        return value
+
+    def getJson(self, index: int):
+        # mutable values must not be shared between rows, so decode every time
+        return json.loads(self[index])
+
+
+class StringTableBuilder(object):
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def add(self, value: str) -> int:
+        if value not in self.index:
+            self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return self.index[value]
+
+    def build(self) -> StringTable:
+        offsets = array("q", [0])
+        blob = bytearray()
+        for s in self.strings:
+            blob += s.encode("utf-8")
+            offsets.append(len(blob))
+        return StringTable(offsets, bytes(blob))
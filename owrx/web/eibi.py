@@ -2,6 +2,8 @@ from owrx.config import Config
 from owrx.bookmarks import Bookmark
 from owrx.web import WebAgent
 from datetime import datetime
+from bisect import bisect_left, bisect_right
+from array import array
 
 import threading
 import logging
@@ -16,6 +18,104 @@ logger = logging.getLogger(__name__)
 MAX_DISTANCE = 25000
 
 
+class EibiIndex(object):
+    """
+    Schedule entries indexed by UTC minute of the week and by source. Every slot of the week lists the entries
+    that may be on air during it, in frequency order, so that queries only check a handful of candidates.
+    """
+    minutesPerDay = 24 * 60
+    minutesPerWeek = 7 * minutesPerDay
+    slotMinutes = 30
+    slotCount = minutesPerWeek // slotMinutes
+
+    @staticmethod
+    def toMinutes(hhmm: int) -> int:
+        return (hhmm // 100) * 60 + hhmm % 100
+
+    @staticmethod
+    def getWeekMinute(dt: datetime) -> int:
+        return dt.weekday() * EibiIndex.minutesPerDay + dt.hour * 60 + dt.minute
+
+    @staticmethod
+    def getIntervals(entry) -> tuple:
+        # weekly on-air intervals in minutes since monday 00:00 UTC, rolling over into the next day
+        start = EibiIndex.toMinutes(entry["time1"])
+        end = EibiIndex.toMinutes(entry["time2"])
+        if end <= start:
+            end += EibiIndex.minutesPerDay
+        return tuple(
+            (day * EibiIndex.minutesPerDay + start, day * EibiIndex.minutesPerDay + end)
+            for day in range(7) if entry["days"][day] != "."
+        )
+
+    def __init__(self, data):
+        self.data = data
+        self.intervals = []
+        self.sources = {}
+        frequencies = array("q")
+        self.dates = array("q")
+        slots = [array("i") for _ in range(EibiIndex.slotCount)]
+        # data is sorted by frequency, so slots fill up in frequency order
+        for i, entry in enumerate(data):
+            try:
+                intervals = EibiIndex.getIntervals(entry)
+            except (KeyError, TypeError, IndexError):
+                logger.warning("invalid schedule entry: {0}".format(entry))
+                intervals = ()
+            self.intervals.append(intervals)
+            frequencies.append(entry.get("freq", 0))
+            self.dates.extend((entry.get("date1", 0), entry.get("date2", 0)))
+            self.sources.setdefault(entry.get("src"), array("i")).append(i)
+            for (start, end) in intervals:
+                for slot in range(start // EibiIndex.slotMinutes, (end - 1) // EibiIndex.slotMinutes + 1):
+                    slots[slot % EibiIndex.slotCount].append(i)
+        self.slots = slots
+        self.slotFrequencies = [array("q", (frequencies[i] for i in slot)) for slot in slots]
+
+    def _match(self, i: int, start: int, end: int, date: int = None):
+        # returns the end of the matching interval, relative to the query, or None
+        if date is not None:
+            (date1, date2) = self.dates[2 * i:2 * i + 2]
+            if (date1 != 0 and date1 > date) or (date2 != 0 and date2 < date):
+                return None
+        for (s, e) in self.intervals[i]:
+            # intervals may wrap around the end of the week
+            for shift in (0, -EibiIndex.minutesPerWeek, EibiIndex.minutesPerWeek):
+                if s + shift <= end and e + shift > start:
+                    return e + shift
+        return None
+
+    def find(self, start: int, end: int, freq1: int = None, freq2: int = None, date: int = None):
+        """
+        Returns (entry index, end of airing) for all entries on air between the given minutes of the week.
+        """
+        first = start // EibiIndex.slotMinutes
+        last = min(end // EibiIndex.slotMinutes, first + EibiIndex.slotCount - 1)
+        candidates = set()
+        for slot in range(first, last + 1):
+            slot = slot % EibiIndex.slotCount
+            if freq1 is None:
+                candidates.update(self.slots[slot])
+            else:
+                lo = bisect_left(self.slotFrequencies[slot], freq1)
+                hi = bisect_right(self.slotFrequencies[slot], freq2)
+                candidates.update(self.slots[slot][lo:hi])
+        result = []
+        for i in sorted(candidates):
+            match = self._match(i, start, end, date)
+            if match is not None:
+                result.append((i, match))
+        return result
+
+    def findBySource(self, src: str, start: int, end: int, date: int = None):
+        result = []
+        for i in self.sources.get(src, ()):
+            match = self._match(i, start, end, date)
+            if match is not None:
+                result.append((i, match))
+        return result
+
+
 class EIBI(WebAgent):
     sharedInstance = None
     creationLock = threading.Lock()
@@ -97,24 +197,28 @@ class EIBI(WebAgent):
         return " ".join(description)
 
     def __init__(self, dataName: str):
+        self.index = None
+        self.distanceCache = None
         super().__init__(dataName)
         self.patternCSV = re.compile(r"^([\d\.]+);(\d\d\d\d)-(\d\d\d\d);(\S*);(\S+);(.*);(.*);(.*);(.*);(\d+);(.*);(.*)$")
         self.patternDays = re.compile(r"^(.*)(Mo|Tu|We|Th|Fr|Sa|Su)-(Mo|Tu|We|Th|Fr|Sa|Su)(.*)$")
 
+    # Rebuild the schedule index whenever the data changes
+    def _indexData(self, data):
+        self.index = EibiIndex(data)
+
+    # Get the current index, which is never modified once built
+    def _getIndex(self):
+        # make sure the data has been loaded
+        self.data
+        with self.lock:
+            return self.index
+
     # Find all current broadcasts for a given source
     def findBySource(self, src: str):
-        # Get entries active at the current time
-        now = datetime.utcnow()
-        now = now.hour * 100 + now.minute
-        result = []
-        # Search for entries originating from given source at current time
-        with self.lock:
-            for entry in self.data:
-                if entry["time1"] <= now and entry["time2"] > now:
-                    if entry["src"] == src:
-                        result.append(entry)
-        # Done
-        return result
+        index = self._getIndex()
+        now = EibiIndex.getWeekMinute(datetime.utcnow())
+        return [index.data[i] for i, _ in index.findBySource(src, now, now)]
 
     # Find all current broadcasts for a given frequency range
     def findCurrent(self, freq1: int, freq2: int):
@@ -123,78 +227,65 @@ class EIBI(WebAgent):
         now = now.hour * 100 + now.minute
         return self.find(freq1, freq2, now, now)
 
-    # Find all broadcasts for given frequency and time ranges
+    # Find all broadcasts for given frequency and time ranges today
     def find(self, freq1: int, freq2: int, time1: int, time2: int):
-        result = []
-        # Search for entries within given frequency and time ranges
-        with self.lock:
-            start = self._bisect_left(freq1)
-            end   = self._bisect_right(freq2)
-            for entry in self.data[start : end]:
-                if entry["time1"] <= time2 and entry["time2"] > time1:
-                    result.append(entry)
-        # Done
-        return result
+        index = self._getIndex()
+        day = datetime.utcnow().weekday() * EibiIndex.minutesPerDay
+        start = day + EibiIndex.toMinutes(time1)
+        end = day + EibiIndex.toMinutes(time2)
+        if end < start:
+            end += EibiIndex.minutesPerDay
+        return [index.data[i] for i, _ in index.find(start, end, freq1, freq2)]
 
     # Create list of currently broadcasting locations
     def currentTransmitters(self, hours: int = 1):
         # Get entries active at the current time + 1 hour
-        ts   = datetime.now().timestamp()
-        now  = datetime.utcnow()
-        day  = now.weekday()
-        date = now.year * 10000 + now.month * 100 + now.day
-        t1   = now.hour * 100 + now.minute
-        t2   = t1 + hours * 100
+        ts    = datetime.now().timestamp()
+        now   = datetime.utcnow()
+        date  = now.year * 10000 + now.month * 100 + now.day
+        t1    = EibiIndex.getWeekMinute(now)
+        t2    = t1 + hours * 60
+        index = self._getIndex()
         result = {}
         # Search for current entries
-        with self.lock:
-            for entry in self.data:
-                try:
-                    # Check if entry is currently active
-                    entryActive = (
-                        entry["days"][day] != "."
-                    and (entry["date1"] == 0 or entry["date1"] <= date)
-                    and (entry["date2"] == 0 or entry["date2"] >= date)
-                    )
-                    # Check the hours, rolling over to the next day
-                    if entryActive:
-                        e1 = entry["time1"]
-                        e2 = entry["time2"]
-                        e2 = e2 if e2 > e1 else e2 + 2400
-                        entryActive = e1 < t2 and e2 > t1
-                    # For every currently active schedule entry...
-                    if entryActive:
-                        src = entry["src"]
-                        if src not in EIBI_Locations:
-                            # Warn if location not found
-                            # @@@ Too much output here
-                            #logger.debug("Location '{0}' for '{1}' not found!".format(src, entry["name"]))
-                            pass
-                        else:
-                            # Compute TTL for the entry
-                            ttl = ts + (
-                                ((e2 // 100) - (t1 // 100)) * 3600 +
-                                ((e2 % 100)  - (t1 % 100)) * 60
-                            )
-                            # Find all matching transmitter locations
-                            for loc in EIBI_Locations[src]:
-                                name = loc["name"]
-                                if name not in result:
-                                    # Add location to the result
-                                    result[name] = loc.copy()
-                                    result[name]["schedule"] = [ entry ]
-                                    result[name]["ttl"] = ttl
-                                else:
-                                    # Add schedule entry, update TTL
-                                    result[name]["schedule"].append(entry)
-                                    result[name]["ttl"] = max(ttl, result[name]["ttl"]);
-
-                except Exception as e:
-                    logger.error("currentTransmitters() exception: {0}".format(e))
+        for i, end in index.find(t1, t2, date=date):
+            entry = index.data[i]
+            src = entry["src"]
+            if src not in EIBI_Locations:
+                # Warn if location not found
+                # @@@ Too much output here
+                #logger.debug("Location '{0}' for '{1}' not found!".format(src, entry["name"]))
+                continue
+            # Compute TTL for the entry
+            ttl = ts + (end - t1) * 60
+            # Find all matching transmitter locations
+            for loc in EIBI_Locations[src]:
+                name = loc["name"]
+                if name not in result:
+                    # Add location to the result
+                    result[name] = loc.copy()
+                    result[name]["schedule"] = [ entry ]
+                    result[name]["ttl"] = ttl
+                else:
+                    # Add schedule entry, update TTL
+                    result[name]["schedule"].append(entry)
+                    result[name]["ttl"] = max(ttl, result[name]["ttl"]);
 
         # Done
         return result
 
+    # Get distance to the closest transmitter of a source, cached per receiver location
+    def _getSourceDistance(self, src: str, rxPos):
+        if self.distanceCache is None or self.distanceCache[0] != rxPos:
+            self.distanceCache = (rxPos, {})
+        cache = self.distanceCache[1]
+        if src not in cache:
+            dist = MAX_DISTANCE
+            for loc in EIBI_Locations[src]:
+                dist = min(dist, EIBI.distKm(rxPos, (loc["lat"], loc["lon"])))
+            cache[src] = dist
+        return cache[src]
+
     # Create list of current bookmarks for a frequency range
     def currentBookmarks(self, frequencyRange, hours: int = 0, rangeKm: int = MAX_DISTANCE):
         # Make sure freq2>freq1
@@ -205,11 +296,11 @@ class EIBI(WebAgent):
             f2 = f
 
         # Get entries active at the current time + 1 hour
-        now  = datetime.utcnow()
-        day  = now.weekday()
-        date = now.year * 10000 + now.month * 100 + now.day
-        t1   = now.hour * 100 + now.minute
-        t2   = t1 + hours * 100
+        now   = datetime.utcnow()
+        date  = now.year * 10000 + now.month * 100 + now.day
+        t1    = EibiIndex.getWeekMinute(now)
+        t2    = t1 + hours * 60
+        index = self._getIndex()
 
         # Get receiver location for computing distance
         pm = Config.get()
@@ -221,59 +312,27 @@ class EIBI(WebAgent):
         logger.info("Creating bookmarks for {0}-{1}kHz within {2}km...".format(f1//1000, f2//1000, rangeKm))
 
         # Search for current entries
-        with self.lock:
-            start = self._bisect_left(f1)
-            end   = self._bisect_right(f2)
-            for entry in self.data[start : end]:
-                try:
-                    # No distance or duration yet
-                    dist = MAX_DISTANCE
-                    duration = 10000
-
-                    # Check if entry active and within frequency range
-                    f = entry["freq"]
-                    entryActive = (
-                        entry["days"][day] != "."
-                    and (entry["date1"] == 0 or entry["date1"] <= date)
-                    and (entry["date2"] == 0 or entry["date2"] >= date)
-                    )
-
-                    # Check the hours, rolling over to the next day
-                    if entryActive:
-                        e1 = entry["time1"]
-                        e2 = entry["time2"]
-                        e2 = e2 if e2 > e1 else e2 + 2400
-                        entryActive = e1 < t2 and e2 > t1
-                        duration = e2 - e1
-
-                    # Find closest transmitter for this entry
-                    if entryActive:
-                        src = entry["src"]
-                        if src not in EIBI_Locations:
-                            # Warn if location not found
-                            # @@@ Too much output here
-                            #logger.debug("Location '{0}' for '{1}' not found!".format(src, entry["name"]))
-                            pass
-                        else:
-                            # Find closest source
-                            for loc in EIBI_Locations[src]:
-                                txPos = (loc["lat"], loc["lon"])
-                                dist  = min(dist, EIBI.distKm(rxPos, txPos))
-                            # Prefer closer transmitters, apply range
-                            entryActive = ((dist <= rangeKm) and (
-                                (f not in result) or (dist < result[f][1])
-                            ))
-
-                    # Add entry to the result
-                    if entryActive:
-                        #if f in result:
-                        #    logger.debug("Replacing '{0}' ({1}km) with '{2}' ({3}km)".format(
-                        #        result[f][0]["name"], result[f][1], entry["name"], dist
-                        #    ))
-                        result[f] = ( entry, dist, duration )
+        for i, _ in index.find(t1, t2, f1, f2, date):
+            entry = index.data[i]
+            f = entry["freq"]
+            src = entry["src"]
+            if src not in EIBI_Locations:
+                # Warn if location not found
+                # @@@ Too much output here
+                #logger.debug("Location '{0}' for '{1}' not found!".format(src, entry["name"]))
+                dist = MAX_DISTANCE
+            else:
+                # Find closest source, prefer closer transmitters, apply range
+                dist = self._getSourceDistance(src, rxPos)
+                if dist > rangeKm or (f in result and dist >= result[f][1]):
+                    continue
 
-                except Exception as e:
-                    logger.error("currentBookmarks() exception: {0}".format(e))
+            # Add entry to the result
+            #if f in result:
+            #    logger.debug("Replacing '{0}' ({1}km) with '{2}' ({3}km)".format(
+            #        result[f][0]["name"], result[f][1], entry["name"], dist
+            #    ))
+            result[f] = ( entry, dist )
 
         logger.info("Created {0} bookmarks for {1}-{2}kHz within {3}km.".format(len(result), f1//1000, f2//1000, rangeKm))
 
@@ -2,6 +2,8 @@ from owrx.config import Config
 from owrx.bookmarks import Bookmark
 from owrx.web import WebAgent
 from owrx.version import openwebrx_version
+from array import array
+from bisect import bisect_left, bisect_right
 
 import urllib
 import threading
@@ -13,11 +15,121 @@ import re
 
 logger = logging.getLogger(__name__)
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 #
 # Maximal distance a repeater can reach (kilometers)
 #
 MAX_DISTANCE = 200
 
+# Earth radius in km
+EARTH_RADIUS = 6371
+
+
+class RepeaterIndex(object):
+    """
+    Repeater positions bucketed into cells of one degree latitude and longitude. Range queries only compute
+    distances for entries in the cells around the given position, using their positions as unit vectors.
+    """
+    cellDegrees = 1
+
+    @staticmethod
+    def toVector(lat: float, lon: float) -> tuple:
+        rlat = math.radians(lat)
+        rlon = math.radians(lon)
+        return (math.cos(rlat) * math.cos(rlon), math.cos(rlat) * math.sin(rlon), math.sin(rlat))
+
+    @staticmethod
+    def getCell(lat: float, lon: float) -> tuple:
+        return (
+            math.floor(lat / RepeaterIndex.cellDegrees),
+            math.floor((lon % 360) / RepeaterIndex.cellDegrees),
+        )
+
+    def __init__(self, data):
+        self.data = data
+        self.cells = {}
+        self.vectors = array("d")
+        lats = data.column("lat") if len(data) else []
+        lons = data.column("lon") if len(data) else []
+        for i, (lat, lon) in enumerate(zip(lats, lons)):
+            if lat is None or lon is None:
+                # keep vectors aligned with rows, entries without a position are never found
+                self.vectors.extend((0.0, 0.0, 0.0))
+                continue
+            self.vectors.extend(RepeaterIndex.toVector(lat, lon))
+            self.cells.setdefault(RepeaterIndex.getCell(lat, lon), array("i")).append(i)
+        # results for the receiver position, keyed by range
+        self.rangeCache = None
+        self.cacheLock = threading.Lock()
+
+    def _getCandidates(self, pos, rangeKm: float):
+        (lat, lon) = pos
+        cellCount = 360 // RepeaterIndex.cellDegrees
+        span = math.degrees(rangeKm / EARTH_RADIUS)
+        south = max(lat - span, -90)
+        north = min(lat + span, 90)
+        maxLat = max(abs(south), abs(north))
+        # longitude span grows towards the poles, covering everything once a pole is in range
+        if maxLat >= 90 or span >= 90 or math.sin(math.radians(span)) >= math.cos(math.radians(maxLat)):
+            lonCells = range(cellCount)
+        else:
+            lonSpan = math.degrees(math.asin(math.sin(math.radians(span)) / math.cos(math.radians(maxLat))))
+            first = math.floor((lon - lonSpan) / RepeaterIndex.cellDegrees)
+            last = math.floor((lon + lonSpan) / RepeaterIndex.cellDegrees)
+            lonCells = range(first, min(last, first + cellCount - 1) + 1)
+        candidates = []
+        for latCell in range(math.floor(south / RepeaterIndex.cellDegrees), math.floor(north / RepeaterIndex.cellDegrees) + 1):
+            for lonCell in lonCells:
+                cell = self.cells.get((latCell, lonCell % cellCount))
+                if cell is not None:
+                    candidates.extend(cell)
+        candidates.sort()
+        return candidates
+
+    def findInRange(self, pos, rangeKm: float) -> list:
+        """
+        Returns (entry index, distance in km) for all entries within the range around the given position, in
+        the order of the data, that is by frequency. Distances are rounded like Repeaters.distKm().
+        """
+        candidates = self._getCandidates(pos, rangeKm)
+        if not candidates:
+            return []
+        (x, y, z) = RepeaterIndex.toVector(*pos)
+        if np is not None:
+            indices = np.array(candidates, dtype=np.int64)
+            vectors = np.frombuffer(self.vectors, dtype=np.float64).reshape(-1, 3)[indices]
+            chord = np.sqrt(np.sum((vectors - (x, y, z)) ** 2, axis=1))
+            distances = np.rint(2 * EARTH_RADIUS * np.arcsin(np.minimum(chord / 2, 1.0)))
+            matches = distances <= rangeKm
+            return list(zip(indices[matches].tolist(), distances[matches].astype(np.int64).tolist()))
+        result = []
+        vectors = self.vectors
+        for i in candidates:
+            dx = vectors[3 * i] - x
+            dy = vectors[3 * i + 1] - y
+            dz = vectors[3 * i + 2] - z
+            d = round(2 * EARTH_RADIUS * math.asin(min(math.sqrt(dx * dx + dy * dy + dz * dz) / 2, 1.0)))
+            if d <= rangeKm:
+                result.append((i, d))
+        return result
+
+    def findAroundReceiver(self, rxPos, rangeKm: float) -> list:
+        """
+        Same as findInRange(), but cached until the receiver position changes.
+        """
+        with self.cacheLock:
+            if self.rangeCache is None or self.rangeCache[0] != rxPos:
+                self.rangeCache = (rxPos, {})
+            cache = self.rangeCache[1]
+            if rangeKm not in cache:
+                cache[rangeKm] = self.findInRange(rxPos, rangeKm)
+            return cache[rangeKm]
+
+
 class Repeaters(WebAgent):
     sharedInstance = None
     creationLock = threading.Lock()
@@ -41,7 +153,7 @@ class Repeaters(WebAgent):
     @staticmethod
     def distKm(p1, p2):
         # Earth radius in km
-        earthR = 6371
+        earthR = EARTH_RADIUS
         # Convert degrees to radians
         rlat1 = p1[0] * (math.pi/180)
         rlat2 = p2[0] * (math.pi/180)
@@ -74,16 +186,15 @@ class Repeaters(WebAgent):
 
     # Compose textual description of an entry
     @staticmethod
-    def getDescription(entry):
+    def getDescription(entry, distance: int = None):
         description = []
         # Add information from the entry to the description
         if "status" in entry:
-            pm = Config.get()
-            rxPos = (pm["receiver_gps"]["lat"], pm["receiver_gps"]["lon"])
-            description += ["{0}, {1}km away.".format(
-                entry["status"],
-                Repeaters.distKm(rxPos, (entry["lat"], entry["lon"]))
-            )]
+            if distance is None:
+                pm = Config.get()
+                rxPos = (pm["receiver_gps"]["lat"], pm["receiver_gps"]["lon"])
+                distance = Repeaters.distKm(rxPos, (entry["lat"], entry["lon"]))
+            description += ["{0}, {1}km away.".format(entry["status"], distance)]
         if "updated" in entry:
             description += ["Last updated " + entry["updated"] + "."]
         if "comment" in entry:
@@ -92,6 +203,7 @@ class Repeaters(WebAgent):
         return " ".join(description)
 
     def __init__(self, dataName: str):
+        self.index = None
         super().__init__(dataName)
         # Update repeater list weekly
         self.refreshPeriod = 7*60*60*24
@@ -114,6 +226,17 @@ class Repeaters(WebAgent):
             self.location = location
             os.remove(file)
 
+    # Rebuild the position index whenever the data changes
+    def _indexData(self, data):
+        self.index = RepeaterIndex(data)
+
+    # Get the current index, which is never modified once built
+    def _getIndex(self):
+        # make sure the data has been loaded
+        self.data
+        with self.lock:
+            return self.index
+
     # Sort database by frequency
     def _sortData(self, data):
         data.sort(key=lambda entry: entry["freq"])
@@ -274,18 +397,23 @@ class Repeaters(WebAgent):
         result = {}
 
         # Search for repeaters within frequency and distance ranges
-        with self.lock:
-            start = self._bisect_left(f1)
-            end   = self._bisect_right(f2)
-            for entry in self.data[start : end]:
-                try:
-                    f = entry["freq"]
-                    d = self.distKm(rxPos, (entry["lat"], entry["lon"]))
-                    if d <= rangeKm and (f not in result or d < result[f][1]):
-                        result[f] = (entry, d)
-
-                except Exception as e:
-                    logger.error("getBookmarks() exception: {0}".format(e))
+        index = self._getIndex()
+        freqs = index.data.column("freq") if len(index.data) else []
+        start = bisect_left(freqs, f1)
+        end   = bisect_right(freqs, f2)
+        # Entries around the receiver are in frequency order as well
+        inRange = index.findAroundReceiver(rxPos, rangeKm)
+        first = bisect_left(inRange, (start, ))
+        last  = bisect_left(inRange, (end, ))
+        for i, d in inRange[first : last]:
+            try:
+                entry = index.data[i]
+                f = entry["freq"]
+                if f not in result or d < result[f][1]:
+                    result[f] = (entry, d)
+
+            except Exception as e:
+                logger.error("getBookmarks() exception: {0}".format(e))
 
         # Return bookmarks for all found entries
         logger.info("Created {0} bookmarks for {1}-{2}kHz within {3}km.".format(len(result), f1//1000, f2//1000, rangeKm))
@@ -293,7 +421,7 @@ class Repeaters(WebAgent):
             "name"        : result[f][0]["name"],
             "modulation"  : result[f][0]["mode"],
             "frequency"   : result[f][0]["freq"],
-            "description" : Repeaters.getDescription(result[f][0])
+            "description" : Repeaters.getDescription(result[f][0], result[f][1])
         }, srcFile = "RepeaterBook") for f in result.keys() ]
 
     #
@@ -307,17 +435,10 @@ class Repeaters(WebAgent):
 
         # No result yet
         logger.info("Looking for repeaters within {0}km...".format(rangeKm))
-        result = []
 
         # Search for repeaters within given distance range
-        with self.lock:
-            for entry in self.data:
-                try:
-                    if self.distKm(rxPos, (entry["lat"], entry["lon"])) <= rangeKm:
-                        result += [entry]
-
-                except Exception as e:
-                    logger.error("getAllInRange() exception: {0}".format(e))
+        index = self._getIndex()
+        result = [index.data[i] for i, _ in index.findAroundReceiver(rxPos, rangeKm)]
 
         # Done
         logger.info("Found {0} repeaters within {1}km.".format(len(result), rangeKm))
@@ -1,13 +1,22 @@
 from owrx.jsons import Encoder
+from owrx.metrics import Metrics
+import asyncio
 import base64
 import hashlib
 import json
 from multiprocessing import Pipe
+from collections import deque
+from itertools import islice
+from queue import SimpleQueue
 import select
+import selectors
+import socket
 import threading
+import time
+import zlib
 from abc import ABC, abstractmethod
 from datetime import datetime
-from ssl import SSLWantReadError
+from ssl import SSLWantReadError, SSLWantWriteError
 
 import logging
 
@@ -32,6 +41,146 @@ class Drained(WebSocketException):
     pass
 
 
+def get_header(size, opcode, compressed: bool = False):
+    ws_first_byte = 0b10000000 | (opcode & 0x0F)
+    if compressed:
+        # RSV1 marks a message compressed with permessage-deflate
+        ws_first_byte |= 0b01000000
+    if size > 2 ** 16 - 1:
+        # frame size can be increased up to 2^64 by setting the size to 127
+        # anything beyond that would need to be segmented into frames. i don't really think we'll need more.
+        return bytes(
+            [
+                ws_first_byte,
+                127,
+                (size >> 56) & 0xFF,
+                (size >> 48) & 0xFF,
+                (size >> 40) & 0xFF,
+                (size >> 32) & 0xFF,
+                (size >> 24) & 0xFF,
+                (size >> 16) & 0xFF,
+                (size >> 8) & 0xFF,
+                size & 0xFF,
+            ]
+        )
+    elif size > 125:
+        # up to 2^16 can be sent using the extended payload size field by putting the size to 126
+        return bytes([ws_first_byte, 126, (size >> 8) & 0xFF, size & 0xFF])
+    else:
+        # 125 bytes binary message in a single unmasked frame
+        return bytes([ws_first_byte, size])
+
+
+class WebSocketFrame(object):
+    """
+    A fully encoded, immutable websocket frame. It is built once and can be sent to any number of connections.
+    The optional key is used by client outboxes to coalesce frames of the same kind.
+    """
+    def __init__(self, payload, prefix: bytes = b"", opcode: int = OPCODE_BINARY_MESSAGE, key=None):
+        self.key = key
+        size = len(prefix) + memoryview(payload).nbytes
+        self.data = b"".join([get_header(size, opcode), prefix, payload])
+
+    def __len__(self):
+        return len(self.data)
+
+
+class SharedMessage(object):
+    """
+    A JSON message that is encoded once and sent to any number of connections. Connections using permessage-deflate
+    compress the encoded payload with their own compression context, everybody else gets the prebuilt frame.
+    """
+    def __init__(self, message):
+        # allow_nan = False disallows NaN and Infinty to be encoded. Browser JSON will not parse them anyway.
+        self.payload = json.dumps(message, allow_nan=False, cls=Encoder).encode("utf-8")
+        self.frame = WebSocketFrame(self.payload, opcode=OPCODE_TEXT_MESSAGE)
+
+    def __len__(self):
+        return len(self.payload)
+
+
+class PerMessageDeflate(object):
+    """
+    RFC 7692 permessage-deflate state for a single connection.
+    """
+    # deflate tail that is stripped from every compressed message (RFC 7692, section 7.2.1)
+    TAIL = b"\x00\x00\xff\xff"
+    # text messages shorter than this are not worth the compression overhead
+    MIN_SIZE = 128
+
+    @staticmethod
+    def negotiate(header: str):
+        """
+        Pick the first acceptable permessage-deflate offer from a Sec-WebSocket-Extensions header.
+        Returns a PerMessageDeflate instance, or None if no offer can be accepted.
+        """
+        for offer in header.split(","):
+            params = [p.strip() for p in offer.split(";")]
+            if params[0].lower() != "permessage-deflate":
+                continue
+            options = {}
+            for p in params[1:]:
+                if not p:
+                    continue
+                (key, _, value) = p.partition("=")
+                options[key.strip().lower()] = value.strip().strip('"')
+            try:
+                return PerMessageDeflate(options)
+            except ValueError:
+                # this offer contains parameters we can not comply with, try the next one
+                continue
+        return None
+
+    def __init__(self, options: dict):
+        known = ["server_no_context_takeover", "client_no_context_takeover", "server_max_window_bits", "client_max_window_bits"]
+        if any(k not in known for k in options):
+            raise ValueError("unknown permessage-deflate parameter")
+        self.serverNoContextTakeover = "server_no_context_takeover" in options
+        self.clientNoContextTakeover = "client_no_context_takeover" in options
+        self.serverWindowBits = 15
+        if "server_max_window_bits" in options:
+            self.serverWindowBits = int(options["server_max_window_bits"])
+            # zlib can not produce raw deflate streams with an 8 bit window
+            if not 9 <= self.serverWindowBits <= 15:
+                raise ValueError("unsupported server_max_window_bits")
+        # we do not restrict the client window, so the client will use the full 15 bits
+        self.compressor = self._createCompressor()
+        self.decompressor = zlib.decompressobj(-15)
+
+    def _createCompressor(self):
+        return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -self.serverWindowBits)
+
+    def getResponseHeader(self):
+        params = ["permessage-deflate"]
+        if self.serverNoContextTakeover:
+            params.append("server_no_context_takeover")
+        if self.clientNoContextTakeover:
+            params.append("client_no_context_takeover")
+        if self.serverWindowBits != 15:
+            params.append("server_max_window_bits={}".format(self.serverWindowBits))
+        return "; ".join(params)
+
+    def shouldCompress(self, opcode, data):
+        # binary frames (audio, FFT) are already compressed or not compressible
+        return opcode == OPCODE_TEXT_MESSAGE and len(data) >= PerMessageDeflate.MIN_SIZE
+
+    def compress(self, data):
+        if self.serverNoContextTakeover:
+            self.compressor = self._createCompressor()
+        compressed = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        if compressed.endswith(PerMessageDeflate.TAIL):
+            compressed = compressed[:-4]
+        return compressed
+
+    def decompress(self, data):
+        if self.clientNoContextTakeover:
+            self.decompressor = zlib.decompressobj(-15)
+        try:
+            return self.decompressor.decompress(data + PerMessageDeflate.TAIL)
+        except zlib.error as e:
+            raise WebSocketException("unable to decompress message") from e
+
+
 class Handler(ABC):
     @abstractmethod
     def handleTextMessage(self, connection, message: str):
@@ -46,6 +195,86 @@ class Handler(ABC):
         pass
 
 
+class WriteWatcher(object):
+    """
+    Single thread waiting for connections with pending output to become writable, so that non-blocking senders
+    never have to wait for a client that is not reading.
+    """
+    sharedInstance = None
+    creationLock = threading.Lock()
+
+    @staticmethod
+    def getSharedInstance():
+        with WriteWatcher.creationLock:
+            if WriteWatcher.sharedInstance is None:
+                WriteWatcher.sharedInstance = WriteWatcher()
+        return WriteWatcher.sharedInstance
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        # registrations are handed to the watcher thread, selectors are not thread-safe
+        self.requests = SimpleQueue()
+        (self.wakeupRecv, self.wakeupSend) = socket.socketpair()
+        self.wakeupRecv.setblocking(False)
+        self.wakeupSend.setblocking(False)
+        self.selector.register(self.wakeupRecv, selectors.EVENT_READ)
+        self.thread = threading.Thread(target=self.run, name="websocket_write_watcher", daemon=True)
+        self.thread.start()
+
+    def watch(self, connection):
+        """
+        Call connection.onWritable() once the socket of the connection is writable.
+        """
+        self._request(connection, True)
+
+    def unwatch(self, connection):
+        self._request(connection, False)
+
+    def _request(self, connection, watch: bool):
+        self.requests.put((connection, watch))
+        try:
+            self.wakeupSend.send(b"\x00")
+        except BlockingIOError:
+            # a wakeup is pending already
+            pass
+
+    def _register(self, connection, watch: bool):
+        try:
+            fd = connection.handler.connection.fileno()
+        except (OSError, ValueError):
+            return
+        if fd < 0:
+            return
+        if not watch:
+            key = self.selector.get_map().get(fd)
+            if key is not None and key.data is connection:
+                self.selector.unregister(fd)
+            return
+        try:
+            self.selector.register(fd, selectors.EVENT_WRITE, connection)
+        except KeyError:
+            # already watched, or the number belonged to a socket that has been closed in the meantime
+            self.selector.modify(fd, selectors.EVENT_WRITE, connection)
+
+    def run(self):
+        while True:
+            for key, _ in self.selector.select():
+                if key.fileobj is self.wakeupRecv:
+                    try:
+                        while self.wakeupRecv.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                self.selector.unregister(key.fd)
+                try:
+                    key.data.onWritable()
+                except Exception:
+                    logger.exception("Exception while writing pending data")
+            while not self.requests.empty():
+                self._register(*self.requests.get())
+
+
 class WebSocketConnection(object):
     connections = []
 
@@ -58,16 +287,41 @@ class WebSocketConnection(object):
                 logger.exception("exception while shutting down websocket connections")
 
     def __init__(self, handler, messageHandler: Handler):
+        self._initConnection(handler, messageHandler)
+        self.handler.connection.setblocking(0)
+        (self.interruptPipeRecv, self.interruptPipeSend) = Pipe(duplex=False)
+        # sendmsg() is unavailable on SSL sockets, this will be reset on first failure
+        self.useSendmsg = True
+        self.handler.wfile.write(self._negotiate())
+        self.pingTimer = None
+        self.resetPing()
+
+    def _initConnection(self, handler, messageHandler: Handler):
         self.startTime = datetime.now()
         self.handler = handler
-        self.handler.connection.setblocking(0)
         self.messageHandler = None
         self.setMessageHandler(messageHandler)
-        (self.interruptPipeRecv, self.interruptPipeSend) = Pipe(duplex=False)
         self.open = True
         self.socketError = False
-        self.sendLock = threading.Lock()
-
+        # reentrant, since compression and sending need to happen in the same order
+        self.sendLock = threading.RLock()
+        # send statistics, bytes currently being sent and time spent in _sendBytes()
+        self.queuedBytes = 0
+        self.writtenBytes = 0
+        self.sentFrames = 0
+        self.sentBytes = 0
+        self.lastSendLatency = 0.0
+        self.maxSendLatency = 0.0
+        self.sendTime = Metrics.getSharedInstance().getMetric("openwebrx.websocket.send_time")
+        self.deflate = None
+        # data accepted by non-blocking sends that the socket could not take yet
+        self.pending = deque()
+        self.writableCallbacks = []
+
+    def _negotiate(self):
+        """
+        Validate the upgrade request and return the handshake response.
+        """
         headers = {key.lower(): value for key, value in self.handler.headers.items()}
         if "upgrade" not in headers:
             raise WebSocketException("Upgrade header not found")
@@ -76,94 +330,220 @@ class WebSocketConnection(object):
         if "sec-websocket-key" not in headers:
             raise WebSocketException("Websocket key not provided")
 
+        if "sec-websocket-extensions" in headers:
+            self.deflate = PerMessageDeflate.negotiate(headers["sec-websocket-extensions"])
+
         ws_key = headers["sec-websocket-key"]
         shakey = hashlib.sha1()
         shakey.update("{ws_key}258EAFA5-E914-47DA-95CA-C5AB0DC85B11".format(ws_key=ws_key).encode())
         ws_key_toreturn = base64.b64encode(shakey.digest())
-        self.handler.wfile.write(
-            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Accept: {0}\r\nCQ-CQ-de: HA5KFU\r\n\r\n".format(
-                ws_key_toreturn.decode()
-            ).encode()
-        )
-        self.pingTimer = None
-        self.resetPing()
+        extensions = ""
+        if self.deflate is not None:
+            extensions = "Sec-WebSocket-Extensions: {0}\r\n".format(self.deflate.getResponseHeader())
+        return "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Accept: {0}\r\n{1}CQ-CQ-de: HA5KFU\r\n\r\n".format(
+            ws_key_toreturn.decode(), extensions
+        ).encode()
 
     def setMessageHandler(self, messageHandler: Handler):
         self.messageHandler = messageHandler
 
-    def get_header(self, size, opcode):
-        ws_first_byte = 0b10000000 | (opcode & 0x0F)
-        if size > 2 ** 16 - 1:
-            # frame size can be increased up to 2^64 by setting the size to 127
-            # anything beyond that would need to be segmented into frames. i don't really think we'll need more.
-            return bytes(
-                [
-                    ws_first_byte,
-                    127,
-                    (size >> 56) & 0xFF,
-                    (size >> 48) & 0xFF,
-                    (size >> 40) & 0xFF,
-                    (size >> 32) & 0xFF,
-                    (size >> 24) & 0xFF,
-                    (size >> 16) & 0xFF,
-                    (size >> 8) & 0xFF,
-                    size & 0xFF,
-                ]
-            )
-        elif size > 125:
-            # up to 2^16 can be sent using the extended payload size field by putting the size to 126
-            return bytes([ws_first_byte, 126, (size >> 8) & 0xFF, size & 0xFF])
+    def get_header(self, size, opcode, compressed: bool = False):
+        return get_header(size, opcode, compressed)
+
+    def send(self, data, block: bool = True):
+        """
+        Send a message. With block=False, whatever the socket does not accept right away is written in the
+        background; use whenWritable() to find out when the connection can take more.
+        """
+        # shared frames are already encoded and go out as-is
+        if isinstance(data, WebSocketFrame):
+            self._sendBytes(data.data, block=block)
+            return
+
+        if isinstance(data, SharedMessage):
+            if self.deflate is None or not self.deflate.shouldCompress(OPCODE_TEXT_MESSAGE, data.payload):
+                self._sendBytes(data.frame.data, block=block)
+                return
+            # the compression context is per connection, so only the encoding can be shared
+            data = data.payload
+            opcode = OPCODE_TEXT_MESSAGE
         else:
-            # 125 bytes binary message in a single unmasked frame
-            return bytes([ws_first_byte, size])
-
-    def send(self, data):
-        # convenience
-        if type(data) == dict:
-            # allow_nan = False disallows NaN and Infinty to be encoded. Browser JSON will not parse them anyway.
-            data = json.dumps(data, allow_nan=False, cls=Encoder)
-
-        # string-type messages are sent as text frames
-        if type(data) == str:
-            header = self.get_header(len(data), OPCODE_TEXT_MESSAGE)
-            data_to_send = header + data.encode("utf-8")
-        # anything else as binary
+            # convenience
+            if type(data) == dict:
+                # allow_nan = False disallows NaN and Infinty to be encoded. Browser JSON will not parse them anyway.
+                data = json.dumps(data, allow_nan=False, cls=Encoder)
+
+            # string-type messages are sent as text frames
+            if type(data) == str:
+                data = data.encode("utf-8")
+                opcode = OPCODE_TEXT_MESSAGE
+            # anything else as binary
+            else:
+                opcode = OPCODE_BINARY_MESSAGE
+
+        if self.deflate is not None and self.deflate.shouldCompress(opcode, data):
+            # the compression context is shared, so messages must be compressed in the order they are sent
+            # the lock is only held for compressing and queueing, never while waiting for the socket
+            with self.sendLock:
+                data = self.deflate.compress(data)
+                queued = self._queueBytes(self.get_header(len(data), opcode, True), data)
+            self._writeQueued(queued, block)
         else:
-            header = self.get_header(len(data), OPCODE_BINARY_MESSAGE)
-            data_to_send = header + data
-
-        self._sendBytes(data_to_send)
+            # header size must match the encoded size, not the number of characters
+            self._sendBytes(self.get_header(len(data), opcode), data, block=block)
+
+    def getQueuedBytes(self):
+        return self.queuedBytes
+
+    def getSendStats(self):
+        return {
+            "queued": self.queuedBytes,
+            "frames": self.sentFrames,
+            "bytes": self.sentBytes,
+            "last_latency": self.lastSendLatency,
+            "max_latency": self.maxSendLatency,
+        }
+
+    def whenWritable(self, callback) -> bool:
+        """
+        Returns True if the connection can take more data right away. Otherwise, callback is called once the data
+        pending from earlier non-blocking sends has been written, and False is returned.
+        """
+        with self.sendLock:
+            if not self.pending or self.socketError:
+                return True
+            self.writableCallbacks.append(callback)
+            return False
 
-    def _sendBytes(self, data_to_send):
-        def chunks(input, n):
-            """Yield successive n-sized chunks from input."""
-            for i in range(0, len(input), n):
-                yield input[i: i + n]
+    def _notifyWritable(self):
+        with self.sendLock:
+            callbacks = self.writableCallbacks
+            self.writableCallbacks = []
+        for callback in callbacks:
+            callback()
+
+    def _waitWritable(self, timeout):
+        (_, write, _) = select.select([], [self.handler.connection], [], timeout)
+        return self.handler.connection in write
+
+    def _sendBuffers(self, buffers):
+        sock = self.handler.connection
+        if self.useSendmsg:
+            try:
+                return sock.sendmsg(buffers)
+            except NotImplementedError:
+                # SSL sockets do not support scatter/gather I/O
+                self.useSendmsg = False
+        # fallback: send the first pending buffer only, the caller will loop for the rest
+        return sock.send(buffers[0])
+
+    def _flush(self):
+        """
+        Write pending buffers until they are done or the kernel buffer is full. Must be called with the send lock.
+        """
+        while self.pending:
+            try:
+                written = self._sendBuffers(list(islice(self.pending, 64)))
+            except (BlockingIOError, InterruptedError, SSLWantWriteError):
+                return
+            if written == 0:
+                raise WebSocketException("zero-length write")
+            self.queuedBytes -= written
+            self.writtenBytes += written
+            # drop fully written buffers, slice the partially written one
+            while written > 0:
+                if written >= len(self.pending[0]):
+                    written -= len(self.pending[0])
+                    self.pending.popleft()
+                else:
+                    self.pending[0] = self.pending[0][written:]
+                    written = 0
+
+    def _sendBytes(self, *parts, block: bool = True):
+        self._writeQueued(self._queueBytes(*parts), block)
+
+    def _queueBytes(self, *parts):
+        """
+        Fix the position of the data in the output. Returns what _writeQueued() needs to write it, or None.
+        """
+        # keep everything as memoryviews so that partial writes never copy the payload
+        buffers = [memoryview(p).cast("B") for p in parts if len(p)]
+        size = sum(len(b) for b in buffers)
 
         with self.sendLock:
             if self.socketError:
                 logger.warning("_sendBytes() after socket error, ignoring")
-            else:
+                return None
+            self.pending.extend(buffers)
+            self.queuedBytes += size
+            self.sentFrames += 1
+            self.sentBytes += size
+            return self.writtenBytes + self.queuedBytes, time.monotonic()
+
+    def _writeQueued(self, queued, block: bool = True):
+        """
+        Write queued data up to the position returned by _queueBytes(). Must be called without the send lock, since
+        blocking writes wait for the socket.
+        """
+        if queued is None:
+            return
+        target, start = queued
+
+        while True:
+            with self.sendLock:
+                if self.socketError:
+                    return
                 try:
-                    for chunk in chunks(data_to_send, 1024):
-                        (_, write, _) = select.select([], [self.handler.wfile], [], 10)
-                        if self.handler.wfile in write:
-                            written = self.handler.wfile.write(chunk)
-                            if written != len(chunk):
-                                logger.error("incomplete write! closing socket!")
-                                self.close(socketError=True)
-                                break
-                        else:
-                            logger.debug("socket not returned from select; closing")
-                            self.close(socketError=True)
-                            break
+                    self._flush()
                 # these exception happen when the socket is closed
                 except OSError:
                     logger.exception("OSError while writing data")
                     self.close(socketError=True)
+                    return
                 except ValueError:
                     logger.exception("ValueError while writing data")
                     self.close(socketError=True)
+                    return
+                if not self.pending:
+                    break
+                if not block:
+                    # the rest is written by the watcher thread, the sender moves on
+                    WriteWatcher.getSharedInstance().watch(self)
+                    break
+                if self.writtenBytes >= target:
+                    # our data is out, the rest belongs to other senders
+                    break
+            # only wait for the socket if the kernel buffer is actually full
+            if not self._waitWritable(10):
+                logger.debug("socket not writable after timeout; closing")
+                self.close(socketError=True)
+                return
+
+        if not self.pending:
+            self._notifyWritable()
+
+        latency = time.monotonic() - start
+        self.lastSendLatency = latency
+        self.maxSendLatency = max(self.maxSendLatency, latency)
+        self.sendTime.observe(latency)
+
+    def onWritable(self):
+        """
+        Called by the WriteWatcher once the socket can take more of the pending data.
+        """
+        with self.sendLock:
+            if self.socketError:
+                return
+            try:
+                self._flush()
+            except (OSError, ValueError):
+                logger.exception("error while writing pending data")
+                self.close(socketError=True)
+                return
+            if self.pending:
+                WriteWatcher.getSharedInstance().watch(self)
+                return
+        self._notifyWritable()
 
     def interrupt(self):
         if self.interruptPipeSend is None:
@@ -213,6 +593,7 @@ class WebSocketConnection(object):
                     try:
                         header = protected_read(2)
                         opcode = header[0] & 0x0F
+                        compressed = (header[0] & 0x40) >> 6
                         length = header[1] & 0x7F
                         mask = (header[1] & 0x80) >> 7
                         if length == 126:
@@ -224,6 +605,10 @@ class WebSocketConnection(object):
                             data = bytes([b ^ masking_key[index % 4] for (index, b) in enumerate(data)])
                         else:
                             data = protected_read(length)
+                        if compressed:
+                            if self.deflate is None:
+                                raise WebSocketException("compressed frame received without negotiated compression")
+                            data = self.deflate.decompress(data)
                         if opcode == OPCODE_TEXT_MESSAGE:
                             message = data.decode("utf-8")
                             try:
@@ -274,6 +659,13 @@ class WebSocketConnection(object):
         # only set flag if it is True
         if socketError:
             self.socketError = True
+            with self.sendLock:
+                if self.pending:
+                    WriteWatcher.getSharedInstance().unwatch(self)
+                self.pending.clear()
+                self.queuedBytes = 0
+            # parked senders have nothing to wait for anymore
+            self._notifyWritable()
         if not self.open:
             return
         self.open = False
@@ -301,3 +693,203 @@ class WebSocketConnection(object):
     def sendPong(self):
         header = self.get_header(0, OPCODE_PONG)
         self._sendBytes(header)
+
+
+class AsyncWebSocketConnection(WebSocketConnection):
+    """
+    Websocket connection running as a coroutine on an asyncio event loop.
+
+    Sending is allowed from any thread; the frames are handed over to the event loop in order. Message handlers are
+    synchronous and run on the executor so that they can not block the event loop.
+    """
+    # close connections that do not drain their transport buffer
+    maxBufferSize = 16 * 1024 * 1024
+    # non-blocking senders are held back above the high watermark, until the transport is drained to the low one
+    highWatermark = 256 * 1024
+    lowWatermark = 64 * 1024
+
+    def __init__(self, handler, messageHandler: Handler, reader, writer, executor=None):
+        self._initConnection(handler, messageHandler)
+        self.reader = reader
+        self.writer = writer
+        self.executor = executor
+        self.loop = asyncio.get_event_loop()
+        self.readTask = None
+        # handed to the event loop, but not written to the transport yet
+        self.scheduledBytes = 0
+        self.drainTask = None
+        self.writer.transport.set_write_buffer_limits(
+            high=AsyncWebSocketConnection.highWatermark, low=AsyncWebSocketConnection.lowWatermark
+        )
+        self.writer.write(self._negotiate())
+        self.pingTimer = None
+        self.resetPing()
+
+    def whenWritable(self, callback) -> bool:
+        with self.sendLock:
+            if self.socketError or self.queuedBytes + self.scheduledBytes <= AsyncWebSocketConnection.highWatermark:
+                return True
+            self.writableCallbacks.append(callback)
+            return False
+
+    def _write(self, parts, size, start):
+        with self.sendLock:
+            self.scheduledBytes -= size
+        if self.writer.transport.is_closing():
+            return
+        self.writer.writelines(parts)
+        latency = time.monotonic() - start
+        self.lastSendLatency = latency
+        self.maxSendLatency = max(self.maxSendLatency, latency)
+        self.sendTime.observe(latency)
+        self.queuedBytes = self.writer.transport.get_write_buffer_size()
+        if self.queuedBytes > AsyncWebSocketConnection.maxBufferSize:
+            logger.debug("websocket transport buffer overflow; closing")
+            self.close(socketError=True)
+            return
+        if self.queuedBytes <= AsyncWebSocketConnection.highWatermark:
+            self._notifyWritable()
+        elif self.drainTask is None:
+            self.drainTask = self.loop.create_task(self._drain())
+
+    async def _drain(self):
+        # waits for the transport to go below the low watermark, on the event loop instead of a sender thread
+        try:
+            await self.writer.drain()
+        except OSError:
+            pass
+        finally:
+            self.drainTask = None
+            self.queuedBytes = self.writer.transport.get_write_buffer_size()
+            self._notifyWritable()
+
+    def _queueBytes(self, *parts):
+        parts = [p for p in parts if len(p)]
+        size = sum(len(p) for p in parts)
+        with self.sendLock:
+            if self.socketError:
+                logger.warning("_sendBytes() after socket error, ignoring")
+                return None
+            self.sentFrames += 1
+            self.sentBytes += size
+            self.scheduledBytes += size
+            # scheduling under the send lock keeps the order of (compressed) messages intact
+            self.loop.call_soon_threadsafe(self._write, parts, size, time.monotonic())
+            return None
+
+    def _writeQueued(self, queued, block: bool = True):
+        # the event loop writes the data, and never blocks
+        pass
+
+    async def _callHandler(self, method, *args):
+        try:
+            await self.loop.run_in_executor(self.executor, method, self, *args)
+        except Exception:
+            logger.exception("Exception in websocket handler %s()", method.__name__)
+
+    async def handle(self):
+        WebSocketConnection.connections.append(self)
+        self.readTask = asyncio.current_task() if hasattr(asyncio, "current_task") else asyncio.Task.current_task()
+        try:
+            await self.read_loop()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            logger.debug("websocket loop ended; shutting down")
+            self.open = False
+            self.readTask = None
+
+            await self.loop.run_in_executor(self.executor, self.messageHandler.handleClose)
+            self.cancelPing()
+
+            if self.socketError:
+                logger.debug("websocket closed in error, skipping close frame")
+            else:
+                logger.debug("websocket loop ended; sending close frame")
+                # written directly, this is the event loop
+                self._write([self.get_header(0, OPCODE_CLOSE)], 0, time.monotonic())
+            if self.drainTask is not None:
+                self.drainTask.cancel()
+            try:
+                await self.writer.drain()
+            except OSError:
+                pass
+            self.writer.close()
+
+            try:
+                WebSocketConnection.connections.remove(self)
+            except ValueError:
+                pass
+
+    async def read_loop(self):
+        self.open = True
+        while self.open:
+            try:
+                header = await self.reader.readexactly(2)
+                self.resetPing()
+                opcode = header[0] & 0x0F
+                compressed = (header[0] & 0x40) >> 6
+                length = header[1] & 0x7F
+                mask = (header[1] & 0x80) >> 7
+                if length == 126:
+                    header = await self.reader.readexactly(2)
+                    length = (header[0] << 8) + header[1]
+                if mask:
+                    masking_key = await self.reader.readexactly(4)
+                    data = await self.reader.readexactly(length)
+                    data = bytes([b ^ masking_key[index % 4] for (index, b) in enumerate(data)])
+                else:
+                    data = await self.reader.readexactly(length)
+                if compressed:
+                    if self.deflate is None:
+                        raise WebSocketException("compressed frame received without negotiated compression")
+                    data = self.deflate.decompress(data)
+                if opcode == OPCODE_TEXT_MESSAGE:
+                    await self._callHandler(self.messageHandler.handleTextMessage, data.decode("utf-8"))
+                elif opcode == OPCODE_BINARY_MESSAGE:
+                    await self._callHandler(self.messageHandler.handleBinaryMessage, data)
+                elif opcode == OPCODE_PING:
+                    self.sendPong()
+                elif opcode == OPCODE_PONG:
+                    # since every read resets the ping timer, there's nothing to do here.
+                    pass
+                elif opcode == OPCODE_CLOSE:
+                    logger.debug("websocket close frame received; closing connection")
+                    self.open = False
+                else:
+                    logger.warning("unsupported opcode: {0}".format(opcode))
+            except asyncio.IncompleteReadError:
+                logger.warning("incomplete read on websocket; closing connection")
+                self.socketError = True
+                self.open = False
+            except OSError:
+                logger.exception("OSError while reading data; closing connection")
+                self.socketError = True
+                self.open = False
+
+    def _cancelRead(self):
+        if self.readTask is not None:
+            self.readTask.cancel()
+
+    def close(self, socketError: bool = False):
+        # only set flag if it is True
+        if socketError:
+            self.socketError = True
+            self._notifyWritable()
+        if not self.open:
+            return
+        self.open = False
+        self.loop.call_soon_threadsafe(self._cancelRead)
+
+    def cancelPing(self):
+        if self.pingTimer:
+            old = self.pingTimer
+            self.pingTimer = None
+            self.loop.call_soon_threadsafe(old.cancel)
+
+    def resetPing(self):
+        self.cancelPing()
+        if not self.open:
+            logger.debug("resetPing() while closed. passing...")
+            return
+        self.pingTimer = self.loop.call_later(30, self.sendPing)
@@ -117,6 +117,10 @@ class Ft8Profile(WsjtProfile):
     def getMode(self):
         return "FT8"
 
+    def getPriority(self):
+        # realtime modes, results are only useful to PSKReporter while they are current
+        return 2
+
 
 class WsprProfile(WsjtProfile):
     def getInterval(self):
@@ -165,6 +169,10 @@ class Ft4Profile(WsjtProfile):
     def getMode(self):
         return "FT4"
 
+    def getPriority(self):
+        # realtime modes, results are only useful to PSKReporter while they are current
+        return 2
+
 
 class Fst4Profile(WsjtProfile):
     availableIntervals = [15, 30, 60, 120, 300, 900, 1800]
@@ -0,0 +1,170 @@
+"""
+Compares passing decoded messages through the typed message bus (MessageChannel between parser modules, MessageSink
+to the client) against pickling them into buffers and unpickling them in the next module and the output pump.
+
+The map and reporting updates done by AprsParser are the same on both paths, and are left out.
+
+Run with: python3 -m test.benchmark.bus [messages]
+"""
+from csdr.module import MessageChannel, MessageSink, pickleMessages, unpickleMessages
+from owrx.aprs import Ax25Parser, AprsParser
+import time
+import sys
+
+
+class ListReader(object):
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+
+    def read(self):
+        return next(self.chunks, None)
+
+    def stop(self):
+        pass
+
+
+class ListWriter(object):
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+
+class ListChannel(MessageChannel):
+    """
+    Replays the given lists of messages as individual reads, and records everything written to it.
+    """
+    def __init__(self, chunks=()):
+        super().__init__()
+        self.chunks = iter(chunks)
+        self.writes = []
+
+    def write(self, messages):
+        self.writes.append(messages)
+
+    def read(self):
+        return next(self.chunks, None)
+
+
+class BenchmarkAprsParser(AprsParser):
+    def process(self, data):
+        aprsData = self.parseAprsData(data)
+        aprsData["mode"] = "AIS" if data["source"] == "AIS" else "APRS"
+        return aprsData
+
+
+def callsign(call: str, ssid: int = 0, last: bool = False) -> bytes:
+    return bytes(ord(c) << 1 for c in call.ljust(6)[:6]) + bytes([0x60 | (ssid << 1) | (1 if last else 0)])
+
+
+def getAprsFrames(messages):
+    # as written by the KissDeframer
+    header = callsign("APRS") + callsign("N0CALL", 9) + callsign("WIDE1", 1, True) + bytes([0x03, 0xF0])
+    return [
+        bytearray(header + "!4903.{0:02d}N/07201.75W-Test {1:03d}/000/A=001234".format(i % 60, i % 1000).encode())
+        for i in range(messages)
+    ]
+
+
+def getAisFrames(messages):
+    # direwolf reports AIS positions as APRS objects
+    header = callsign("APRS") + callsign("AIS", 0, True) + bytes([0x03, 0xF0])
+    return [
+        bytearray(header + ";{0:09d}*111111z4903.50N/07201.75Ws034/012".format(211000000 + i).encode())
+        for i in range(messages)
+    ]
+
+
+def getAircraft():
+    return {
+        "{0:06X}".format(0x3C0000 + i): {
+            "icao": "{0:06X}".format(0x3C0000 + i),
+            "aircraft": "DLH{0}".format(i),
+            "lat": 50.0 + i / 1000,
+            "lon": 8.5 + i / 1000,
+            "altitude": 35000,
+            "course": 270,
+            "speed": 450,
+            "vspeed": 0,
+            "squawk": "1000",
+            "rssi": -20.5,
+            "mode": "ADSB",
+            "ts": 1700000000000 + i,
+            "ttl": 1700000900000 + i,
+        }
+        for i in range(200)
+    }
+
+
+def getAdsbLists(messages):
+    # AdsbParser sends the full list of tracked aircraft on every update of the dump1090 json file
+    return [{"mode": "ADSB-LIST", "aircraft": getAircraft()} for _ in range(messages)]
+
+
+def group(messages: list, size: int) -> list:
+    return [messages[i:i + size] for i in range(0, len(messages), size)]
+
+
+def runPickled(stages, chunks, deliver):
+    reads = [memoryview(pickleMessages(chunk)) for chunk in chunks]
+    for stage in stages:
+        stage.reader = ListReader(reads)
+        stage.writer = ListWriter()
+        stage.doRun = True
+        stage.run()
+        reads = [memoryview(w) for w in stage.writer.writes]
+    # the output pump in DspManager
+    for data in reads:
+        for message in unpickleMessages(data.tobytes()):
+            deliver(message)
+
+
+def runTyped(stages, chunks, deliver):
+    sink = MessageSink(deliver)
+    if not stages:
+        for chunk in chunks:
+            sink.write(chunk)
+        return
+    reads = chunks
+    for i, stage in enumerate(stages):
+        stage.reader = ListChannel(reads)
+        stage.writer = sink if i == len(stages) - 1 else ListChannel()
+        stage.doRun = True
+        stage.run()
+        if stage.writer is not sink:
+            reads = stage.writer.writes
+
+
+def measure(factory, run, chunks, repeat=5):
+    best = None
+    count = 0
+    for _ in range(repeat):
+        delivered = []
+        stages = factory()
+        start = time.perf_counter()
+        run(stages, chunks, delivered.append)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+        count = len(delivered)
+    return best, count
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    cases = [
+        ("APRS", lambda: [Ax25Parser(), BenchmarkAprsParser()], getAprsFrames(messages)),
+        ("AIS", lambda: [Ax25Parser(), BenchmarkAprsParser()], getAisFrames(messages)),
+        ("ADS-B", lambda: [], getAdsbLists(messages // 100)),
+    ]
+    print("{0:>8} {1:>6} {2:>8} {3:>12}".format("stream", "batch", "version", "msgs/s"))
+    for name, factory, data in cases:
+        for size in [1, 16]:
+            chunks = group(data, size)
+            for version, run in [("pickled", runPickled), ("typed", runTyped)]:
+                duration, count = measure(factory, run, chunks)
+                print("{0:>8} {1:>6} {2:>8} {3:>12.0f}".format(name, size, version, count / duration))
+
+
+if __name__ == "__main__":
+    main()
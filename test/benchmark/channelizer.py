@@ -0,0 +1,119 @@
+"""
+Compares the CPU time per service channel of the shared channelizer against one Selector per channel.
+
+Run with: python3 -m test.benchmark.channelizer [sample rate] [channels] [seconds]
+"""
+from csdr.chain.selector import Selector
+from csdr.module.channelizer import Channelizer
+from pycsdr.modules import Buffer
+from pycsdr.types import Format
+import numpy as np
+import threading
+import time
+import sys
+
+
+def drain(reader, counter, index):
+    while True:
+        data = reader.read()
+        if data is None:
+            break
+        counter[index] += len(data)
+
+
+def feed(buffer, sampleRate, seconds):
+    # feed at realtime speed so that slow readers are not overrun, which would hide their cost
+    chunk = sampleRate // 100
+    block = (np.random.randn(chunk) + 1j * np.random.randn(chunk)).astype(np.complex64).tobytes()
+    start = time.monotonic()
+    for i in range(int(seconds * 100)):
+        buffer.write(block)
+        delay = start + (i + 1) / 100 - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def measure(setup, sampleRate, channels, seconds):
+    source = Buffer(Format.COMPLEX_FLOAT)
+    outputs, stop = setup(source, channels)
+    counter = [0] * len(outputs)
+    threads = [threading.Thread(target=drain, args=(o.getReader(), counter, i)) for i, o in enumerate(outputs)]
+    for t in threads:
+        t.start()
+    start = time.process_time()
+    feed(source, sampleRate, seconds)
+    # give the pipeline a moment to flush
+    time.sleep(0.5)
+    cpu = time.process_time() - start
+    stop()
+    return cpu, sum(counter)
+
+
+def getOffsets(sampleRate, channels):
+    spacing = sampleRate * 0.8 / channels
+    return [-sampleRate * 0.4 + spacing * (i + 0.5) for i in range(channels)]
+
+
+def selectors(sampleRate, outputRate):
+    def setup(source, channels):
+        chains = []
+        outputs = []
+        for offset in getOffsets(sampleRate, channels):
+            chain = Selector(sampleRate, outputRate, withSquelch=False)
+            chain.setFrequencyOffset(offset)
+            output = Buffer(Format.COMPLEX_FLOAT)
+            chain.setReader(source.getReader())
+            chain.setWriter(output)
+            chains.append(chain)
+            outputs.append(output)
+
+        def stop():
+            for c in chains:
+                c.stop()
+        return outputs, stop
+    return setup
+
+
+def channelizer(sampleRate, outputRate):
+    def setup(source, channels):
+        module = Channelizer(sampleRate)
+        chains = []
+        outputs = []
+        for offset in getOffsets(sampleRate, channels):
+            channel = module.addChannel(offset, outputRate)
+            # the remaining fractional decimation and residual shift run at the channel rate
+            chain = Selector(int(channel.getSampleRate()), outputRate, withSquelch=False)
+            chain.setFrequencyOffset(channel.getResidualOffset())
+            output = Buffer(Format.COMPLEX_FLOAT)
+            chain.setReader(module.getBuffer(channel).getReader())
+            chain.setWriter(output)
+            chains.append(chain)
+            outputs.append(output)
+        module.setReader(source.getReader())
+
+        def stop():
+            module.stop()
+            for c in chains:
+                c.stop()
+        return outputs, stop
+    return setup
+
+
+def main():
+    sampleRate = int(sys.argv[1]) if len(sys.argv) > 1 else 2400000
+    channels = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    outputRate = 12000
+
+    print("{0} channels at {1} S/s, {2} seconds of signal".format(channels, sampleRate, seconds))
+    for name, setup in [("selectors", selectors), ("channelizer", channelizer)]:
+        cpu, samples = measure(setup(sampleRate, outputRate), sampleRate, channels, seconds)
+        print(
+            "{0:>12}: {1:.3f} cpu seconds, {2:.2f}% of a core per channel, {3} output samples".format(
+                name, cpu, cpu / seconds / channels * 100, samples
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Compares the throughput of the line framing and pickled message batching in LineBasedModule and PickleModule
+against splitting the retained data and pickling every message separately.
+
+Run with: python3 -m test.benchmark.parsers [messages]
+"""
+from csdr.module import JsonParser, unpickleMessages
+from owrx.pocsag import PocsagParser
+from io import BytesIO
+import pickle
+import json
+import time
+import sys
+
+
+class ListReader(object):
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+
+    def read(self):
+        return next(self.chunks, None)
+
+    def stop(self):
+        pass
+
+
+class ListWriter(object):
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+
+def legacyLineRun(parser):
+    # the previous implementation of LineBasedModule.run()
+    retained = bytes()
+    while True:
+        data = parser.reader.read()
+        if data is None:
+            break
+        retained += data
+        lines = retained.split(b"\n")
+        retained = lines[-1]
+        for line in lines[0:-1]:
+            parsed = parser.timedProcess(line)
+            if parsed is not None:
+                parser.writer.write(pickle.dumps(parsed))
+
+
+def legacyPickleRun(parser):
+    # the previous implementation of PickleModule.run()
+    while True:
+        data = parser.reader.read()
+        if data is None:
+            break
+        io = BytesIO(data.tobytes())
+        try:
+            while True:
+                output = parser.timedProcess(pickle.load(io))
+                if output is not None:
+                    parser.writer.write(pickle.dumps(output))
+        except EOFError:
+            pass
+
+
+def legacyUnpickle(writes):
+    count = 0
+    for data in writes:
+        io = BytesIO(data)
+        try:
+            while True:
+                pickle.load(io)
+                count += 1
+        except EOFError:
+            pass
+    return count
+
+
+def chunk(data, size: int) -> list:
+    if isinstance(data, list):
+        # pickles can not be split, so group whole messages into reads of roughly the given size
+        chunks = []
+        current = b""
+        for message in data:
+            current += message
+            if len(current) >= size:
+                chunks.append(memoryview(current))
+                current = b""
+        if current:
+            chunks.append(memoryview(current))
+        return chunks
+    view = memoryview(data)
+    return [view[i:i + size] for i in range(0, len(data), size)]
+
+
+def getJsonLines(messages):
+    # rtl_433 style output, as used by the ISM decoder
+    return b"".join(
+        json.dumps({
+            "time": 1700000000 + i,
+            "model": "Acurite-Tower",
+            "id": i % 50,
+            "channel": "A",
+            "battery_ok": 1,
+            "temperature_C": 21.5,
+            "humidity": 48,
+            "mic": "CHECKSUM",
+        }).encode() + b"\n" for i in range(messages)
+    )
+
+
+def getLongJsonLines(messages):
+    # long lines arriving in many small reads
+    return b"".join(json.dumps({"id": i, "data": "{0:04x}".format(i) * 2000}).encode() + b"\n" for i in range(messages))
+
+
+def getPickledMessages(messages):
+    # digiham emits one pickled dict per decoded page
+    return [
+        pickle.dumps({"address": str(1000000 + i), "message": "ALARM {0} TEST MESSAGE".format(i)})
+        for i in range(messages)
+    ]
+
+
+def measure(factory, run, chunks, repeat=5):
+    parse = decode = None
+    for i in range(repeat):
+        parser = factory()
+        parser.reader = ListReader(chunks)
+        parser.writer = ListWriter()
+        parser.doRun = True
+        start = time.perf_counter()
+        run(parser)
+        duration = time.perf_counter() - start
+        parse = duration if parse is None else min(parse, duration)
+        writes = [bytes(w) for w in parser.writer.writes]
+        start = time.perf_counter()
+        if run in (legacyLineRun, legacyPickleRun):
+            count = legacyUnpickle(writes)
+        else:
+            count = sum(1 for w in writes for _ in unpickleMessages(w))
+        duration = time.perf_counter() - start
+        decode = duration if decode is None else min(decode, duration)
+    return parse, decode, count, len(writes)
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    cases = [
+        ("JsonParser", lambda: JsonParser("ISM"), getJsonLines(messages), legacyLineRun, JsonParser.run),
+        ("JsonParser/8k", lambda: JsonParser("ISM"), getLongJsonLines(messages // 20), legacyLineRun, JsonParser.run),
+        ("PocsagParser", PocsagParser, getPickledMessages(messages), legacyPickleRun, PocsagParser.run),
+    ]
+    print("{0:>14} {1:>7} {2:>8} {3:>14} {4:>14} {5:>8}".format(
+        "parser", "chunk", "version", "msgs/s parse", "msgs/s decode", "writes"
+    ))
+    for name, factory, data, legacy, current in cases:
+        for size in [256, 4096, 65536]:
+            chunks = chunk(data, size)
+            for version, run in [("legacy", legacy), ("current", current)]:
+                parse, decode, count, writes = measure(factory, run, chunks)
+                print("{0:>14} {1:>7} {2:>8} {3:>14.0f} {4:>14.0f} {5:>8}".format(
+                    name, size, version, count / parse, count / decode, writes
+                ))
+
+
+if __name__ == "__main__":
+    main()
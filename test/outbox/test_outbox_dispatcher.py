@@ -0,0 +1,222 @@
+from unittest import TestCase
+from unittest.mock import patch
+from functools import partial
+from owrx.metrics import Metrics
+from owrx.websocket import WebSocketConnection, AsyncWebSocketConnection, Handler
+from owrx.outbox import Outbox, OutboxDispatcher
+import asyncio
+import base64
+import os
+import socket
+import threading
+import time
+
+
+class SocketHandler(object):
+    def __init__(self, sock, deflate: bool = False):
+        self.connection = sock
+        self.headers = {"Upgrade": "websocket", "Sec-WebSocket-Key": "dGhlIHNhbXBsZSBub25jZQ=="}
+        if deflate:
+            self.headers["Sec-WebSocket-Extensions"] = "permessage-deflate"
+        self.wfile = self
+
+    def write(self, data):
+        self.connection.sendall(data)
+
+
+class NullHandler(Handler):
+    def handleTextMessage(self, connection, message):
+        pass
+
+    def handleBinaryMessage(self, connection, data):
+        pass
+
+    def handleClose(self):
+        pass
+
+
+def setUpMetrics():
+    # metrics pull in the client registry, which needs a configuration
+    with patch("owrx.client.ClientRegistry.getSharedInstance"):
+        Metrics.getSharedInstance()
+
+
+def readAll(peer, counter: list):
+    while True:
+        data = peer.recv(65536)
+        if not data:
+            return
+        counter[0] += len(data)
+
+
+class OutboxDispatcherTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setUpMetrics()
+
+    def setUp(self):
+        self.connections = []
+        self.sockets = []
+
+    def tearDown(self):
+        for connection in self.connections:
+            connection.cancelPing()
+            connection.close(socketError=True)
+            connection.interruptPipeSend.close()
+            connection.interruptPipeRecv.close()
+        for sock in self.sockets:
+            sock.close()
+
+    def createConnection(self, deflate: bool = False):
+        (server, peer) = socket.socketpair()
+        self.sockets += [server, peer]
+        connection = WebSocketConnection(SocketHandler(server, deflate), NullHandler())
+        self.connections.append(connection)
+        outbox = Outbox(100, partial(connection.send, block=False), connection.whenWritable)
+        return outbox, peer
+
+    def testStalledClientsDoNotBlockOthers(self):
+        payload = bytes(256 * 1024)
+        messages = 20
+        # more clients that never read than there are dispatcher threads
+        stalled = [self.createConnection() for _ in OutboxDispatcher.getSharedInstance().threads + [None]]
+        healthy = [self.createConnection() for _ in range(2)]
+
+        for outbox, _ in stalled:
+            for _ in range(messages):
+                outbox.put(payload)
+
+        counters = []
+        for outbox, peer in healthy:
+            counter = [0]
+            counters.append(counter)
+            threading.Thread(target=readAll, args=(peer, counter), daemon=True).start()
+            for _ in range(messages):
+                outbox.put(payload)
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and any(c[0] < messages * len(payload) for c in counters):
+            time.sleep(0.01)
+        for counter in counters:
+            self.assertGreaterEqual(counter[0], messages * len(payload))
+
+        for outbox, _ in stalled:
+            # parked with its data, not closed
+            self.assertFalse(outbox.closed)
+            self.assertTrue(outbox.scheduled)
+            self.assertTrue(outbox.order)
+
+    def testParkedOutboxResumesWhenClientReads(self):
+        payload = bytes(256 * 1024)
+        messages = 20
+        outbox, peer = self.createConnection()
+        for _ in range(messages):
+            outbox.put(payload)
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and not self.connections[0].pending:
+            time.sleep(0.01)
+        self.assertTrue(self.connections[0].pending)
+
+        counter = [0]
+        threading.Thread(target=readAll, args=(peer, counter), daemon=True).start()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and (counter[0] < messages * len(payload) or outbox.scheduled):
+            time.sleep(0.01)
+        self.assertGreaterEqual(counter[0], messages * len(payload))
+        self.assertFalse(outbox.scheduled)
+
+    def testBlockingCompressedSendDoesNotHoldTheConnection(self):
+        stalledOutbox, _ = self.createConnection(deflate=True)
+        stalled = self.connections[0]
+        self.assertIsNotNone(stalled.deflate)
+        healthy, peer = self.createConnection(deflate=True)
+
+        # hardly compressible, so that it fills the socket buffers after compression
+        text = base64.b64encode(os.urandom(6 * 1024 * 1024)).decode()
+        threading.Thread(target=stalled.send, args=(text,), daemon=True).start()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and not stalled.pending:
+            time.sleep(0.01)
+        self.assertTrue(stalled.pending)
+
+        # the blocking sender waits for the socket without the send lock
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(stalled.whenWritable(lambda: None)), daemon=True)
+        waiter.start()
+        waiter.join(1)
+        self.assertEqual(result, [False])
+        stalledOutbox.put("x" * 1024)
+
+        counter = [0]
+        threading.Thread(target=readAll, args=(peer, counter), daemon=True).start()
+        messages = 20
+        for _ in range(messages):
+            healthy.put(base64.b64encode(os.urandom(64 * 1024)).decode())
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and (counter[0] < messages * 64 * 1024 or healthy.scheduled):
+            time.sleep(0.01)
+        self.assertGreaterEqual(counter[0], messages * 64 * 1024)
+        self.assertFalse(healthy.scheduled)
+
+
+class AsyncOutboxTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        setUpMetrics()
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        (self.server, self.peer) = socket.socketpair()
+        self.peer.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+
+        async def create():
+            reader, writer = await asyncio.open_connection(sock=self.server)
+            return AsyncWebSocketConnection(SocketHandler(self.server), NullHandler(), reader, writer)
+
+        self.connection = asyncio.run_coroutine_threadsafe(create(), self.loop).result(5)
+
+    def tearDown(self):
+        self.connection.cancelPing()
+        self.connection.close(socketError=True)
+        self.loop.call_soon_threadsafe(self.connection.writer.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+        self.peer.close()
+
+    def testOutboxHoldsFramesWhileTransportIsFull(self):
+        connection = self.connection
+        outbox = Outbox(100, partial(connection.send, block=False), connection.whenWritable)
+        coalesced = Metrics.getSharedInstance().getMetric("openwebrx.outbox.coalesced")
+        coalescedBefore = coalesced.getValue()["count"]
+        payload = bytes(64 * 1024)
+        messages = 50
+        for i in range(messages):
+            outbox.put(payload)
+            # spectrum frames
+            outbox.put(bytes([0x01]) + bytes(4096))
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and not outbox.order:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        # the frames wait in the outbox, where spectrum frames are coalesced, not in the transport
+        self.assertTrue(outbox.scheduled)
+        self.assertLess(outbox.fifoCount, messages)
+        self.assertGreater(outbox.fifoCount, 0)
+        self.assertGreater(coalesced.getValue()["count"], coalescedBefore)
+        self.assertLessEqual(
+            connection.queuedBytes + connection.scheduledBytes, AsyncWebSocketConnection.highWatermark + len(payload) * 2
+        )
+
+        counter = [0]
+        threading.Thread(target=readAll, args=(self.peer, counter), daemon=True).start()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and (counter[0] < messages * len(payload) or outbox.scheduled):
+            time.sleep(0.01)
+        self.assertGreaterEqual(counter[0], messages * len(payload))
+        self.assertFalse(outbox.scheduled)
@@ -0,0 +1,52 @@
+"""
+Micro-benchmarks for property change dispatch, with many subscribers on a shared stack like Config.get().
+
+Run with: python3 -m test.property.benchmark [max subscribers]
+"""
+from owrx.property import PropertyLayer, PropertyStack
+import timeit
+import sys
+
+
+def setup(clients):
+    layer = PropertyLayer(**{"key{0}".format(i): 0 for i in range(100)})
+    config = PropertyStack()
+    config.addLayer(0, layer)
+    subscriptions = []
+    for c in range(clients):
+        # typical client usage: a stack on top of the config, a filter and a few single property subscriptions
+        stack = PropertyStack()
+        stack.addLayer(0, PropertyLayer())
+        stack.addLayer(1, config)
+        subscriptions.append(stack.filter("key{0}".format(c % 100), "key{0}".format((c + 1) % 100)).wire(lambda c: None))
+        for k in range(3):
+            subscriptions.append(config.wireProperty("key{0}".format((c + k) % 100), lambda v: None))
+    return layer, subscriptions
+
+
+def measure(clients, number=200):
+    layer, subscriptions = setup(clients)
+    counter = iter(range(1, 10 ** 9))
+
+    def change():
+        layer["key50"] = next(counter)
+
+    perChange = min(timeit.repeat(change, number=number, repeat=3)) / number
+
+    # cancel in the order the subscriptions were made, the worst case for a list
+    perCancel = timeit.timeit(lambda: [s.cancel() for s in subscriptions], number=1) / len(subscriptions)
+    return perChange, perCancel
+
+
+def main():
+    maxClients = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    clients = 10
+    print("{0:>8} {1:>16} {2:>16}".format("clients", "us per change", "us per cancel"))
+    while clients <= maxClients:
+        perChange, perCancel = measure(clients)
+        print("{0:>8} {1:>16.2f} {2:>16.3f}".format(clients, perChange * 1e6, perCancel * 1e6))
+        clients *= 10
+
+
+if __name__ == "__main__":
+    main()
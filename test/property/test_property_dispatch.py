@@ -0,0 +1,67 @@
+from unittest import TestCase
+from unittest.mock import Mock
+from owrx.property import PropertyLayer, PropertyStack
+import gc
+
+
+class PropertyDispatchTest(TestCase):
+    def testFiltersOnlyReceiveTheirKeys(self):
+        layer = PropertyLayer()
+        mocks = [Mock() for _ in range(100)]
+        for i, mock in enumerate(mocks):
+            layer.filter("key{0}".format(i)).wire(mock.method)
+        layer["key5"] = "value"
+        for i, mock in enumerate(mocks):
+            if i == 5:
+                mock.method.assert_called_once_with({"key5": "value"})
+            else:
+                mock.method.assert_not_called()
+
+    def testWiringOrder(self):
+        layer = PropertyLayer()
+        calls = []
+        layer.wire(lambda changes: calls.append("first"))
+        layer.filter("testkey").wire(lambda changes: calls.append("second"))
+        layer.wire(lambda changes: calls.append("third"))
+        layer.wireProperty("testkey", lambda value: calls.append("property"))
+        layer["testkey"] = "value"
+        self.assertEqual(calls, ["first", "second", "third", "property"])
+
+    def testCancelRemovesFromIndex(self):
+        layer = PropertyLayer()
+        mock = Mock()
+        sub = layer.wireProperty("testkey", mock.method)
+        self.assertIn("testkey", layer.propertySubscribers)
+        sub.cancel()
+        self.assertNotIn("testkey", layer.propertySubscribers)
+        # cancelling again is harmless
+        sub.cancel()
+        layer["testkey"] = "value"
+        mock.method.assert_not_called()
+
+    def testSubscriptionDoesNotKeepManagerAlive(self):
+        layer = PropertyLayer()
+        sub = layer.wire(Mock())
+        del layer
+        gc.collect()
+        self.assertIsNone(sub.getSubscriptee())
+        sub.cancel()
+
+    def testStackWithoutSubscribersSkipsEvents(self):
+        layer = PropertyLayer()
+        stack = PropertyStack()
+        stack.addLayer(0, layer)
+        stack._getTopLayer = Mock()
+        layer["testkey"] = "value"
+        stack._getTopLayer.assert_not_called()
+
+    def testStackWithOtherSubscribersSkipsEvents(self):
+        layer = PropertyLayer()
+        stack = PropertyStack()
+        stack.addLayer(0, layer)
+        mock = Mock()
+        stack.wireProperty("otherkey", mock.method)
+        stack._getTopLayer = Mock()
+        layer["testkey"] = "value"
+        stack._getTopLayer.assert_not_called()
+        mock.method.assert_not_called()
@@ -0,0 +1,154 @@
+from unittest import TestCase
+from unittest.mock import Mock
+from owrx.property import PropertyLayer, PropertyStack, PropertyCarousel, PropertyTransaction, PropertyDeleted
+
+
+class PropertyTransactionTest(TestCase):
+    def testDefersEvents(self):
+        layer = PropertyLayer()
+        mock = Mock()
+        layer.wire(mock.method)
+        with PropertyTransaction():
+            layer["testkey"] = "testvalue"
+            mock.method.assert_not_called()
+            # values are visible immediately
+            self.assertEqual(layer["testkey"], "testvalue")
+        mock.method.assert_called_once_with({"testkey": "testvalue"})
+
+    def testCoalescesEvents(self):
+        layer = PropertyLayer()
+        mock = Mock()
+        layer.wire(mock.method)
+        with PropertyTransaction():
+            layer["testkey"] = "first value"
+            layer["otherkey"] = "other value"
+            layer["testkey"] = "second value"
+        mock.method.assert_called_once_with({"testkey": "second value", "otherkey": "other value"})
+
+    def testCoalescesPropertyEvents(self):
+        layer = PropertyLayer(testkey="initial value")
+        mock = Mock()
+        layer.wireProperty("testkey", mock.method)
+        mock.reset_mock()
+        with PropertyTransaction():
+            layer["testkey"] = "first value"
+            layer["testkey"] = "second value"
+        mock.method.assert_called_once_with("second value")
+
+    def testDropsNetZeroChanges(self):
+        layer = PropertyLayer(testkey="initial value")
+        mock = Mock()
+        layer.wire(mock.method)
+        with PropertyTransaction():
+            layer["testkey"] = "modified value"
+            layer["testkey"] = "initial value"
+        mock.method.assert_not_called()
+
+    def testDropsNetZeroDeletion(self):
+        layer = PropertyLayer()
+        mock = Mock()
+        layer.wire(mock.method)
+        with PropertyTransaction():
+            layer["testkey"] = "new value"
+            del layer["testkey"]
+        mock.method.assert_not_called()
+
+    def testBatchesAcrossLayers(self):
+        low_layer = PropertyLayer(testkey="low value")
+        high_layer = PropertyLayer()
+        stack = PropertyStack()
+        stack.addLayer(1, low_layer)
+        stack.addLayer(0, high_layer)
+        mock = Mock()
+        stack.wire(mock.method)
+        with PropertyTransaction():
+            low_layer["otherkey"] = "other value"
+            high_layer["testkey"] = "high value"
+        mock.method.assert_called_once_with({"otherkey": "other value", "testkey": "high value"})
+
+    def testNetChangePerStack(self):
+        low_layer = PropertyLayer(testkey="low value")
+        high_layer = PropertyLayer()
+        stack = PropertyStack()
+        stack.addLayer(1, low_layer)
+        stack.addLayer(0, high_layer)
+        mock = Mock()
+        stack.wire(mock.method)
+        with PropertyTransaction():
+            # shadows the low layer with the same value, and then changes the low layer below it
+            high_layer["testkey"] = "high value"
+            low_layer["testkey"] = "modified low value"
+            del high_layer["testkey"]
+        mock.method.assert_called_once_with({"testkey": "modified low value"})
+
+    def testNestedTransactions(self):
+        layer = PropertyLayer()
+        mock = Mock()
+        layer.wire(mock.method)
+        with PropertyTransaction():
+            with PropertyTransaction():
+                layer["testkey"] = "testvalue"
+            mock.method.assert_not_called()
+            layer["otherkey"] = "other value"
+        mock.method.assert_called_once_with({"testkey": "testvalue", "otherkey": "other value"})
+
+    def testCarouselSwitch(self):
+        carousel = PropertyCarousel()
+        carousel.addLayer("x", PropertyLayer(testkey="x value", samekey="same"))
+        carousel.addLayer("y", PropertyLayer(testkey="y value", samekey="same"))
+        carousel.switch("x")
+        stack = PropertyStack()
+        top_layer = PropertyLayer()
+        stack.addLayer(0, top_layer)
+        stack.addLayer(1, carousel)
+
+        def forward(changes):
+            if "testkey" in changes:
+                top_layer["forwarded"] = changes["testkey"]
+
+        carousel.wireDownstream(stack, forward)
+        mock = Mock()
+        stack.wire(mock.method)
+        with PropertyTransaction():
+            carousel.switch("y")
+        mock.method.assert_called_once_with({"testkey": "y value", "forwarded": "y value"})
+
+    def testCancelledSubscription(self):
+        layer = PropertyLayer()
+        mock = Mock()
+        sub = layer.wire(mock.method)
+        with PropertyTransaction():
+            layer["testkey"] = "testvalue"
+            sub.cancel()
+        mock.method.assert_not_called()
+
+    def testDispatchesOnException(self):
+        layer = PropertyLayer()
+        mock = Mock()
+        layer.wire(mock.method)
+        with self.assertRaises(ValueError):
+            with PropertyTransaction():
+                layer["testkey"] = "testvalue"
+                raise ValueError()
+        mock.method.assert_called_once_with({"testkey": "testvalue"})
+        self.assertIsNone(PropertyTransaction.getCurrent())
+
+    def testDeletionEvent(self):
+        layer = PropertyLayer(testkey="testvalue")
+        mock = Mock()
+        layer.wire(mock.method)
+        with PropertyTransaction():
+            layer["testkey"] = "modified value"
+            del layer["testkey"]
+        mock.method.assert_called_once_with({"testkey": PropertyDeleted})
+
+    def testDispatchStatistics(self):
+        layer = PropertyLayer()
+        mock = Mock()
+        sub = layer.wire(mock.method)
+        with PropertyTransaction():
+            layer["testkey"] = "first value"
+            layer["otherkey"] = "second value"
+        layer["testkey"] = "third value"
+        self.assertEqual(sub.getDispatchCount(), 2)
+        self.assertGreaterEqual(sub.getDispatchTime(), 0.0)